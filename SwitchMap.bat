@@ -10,6 +10,6 @@ start cmd /k "cd /d A:\SwitchMap\backend\SWICTHMAP\websocket && py app.py"
 start cmd /k "cd /d A:\SwitchMap\backend\SWICTHMAP\websocket && py approve.py"
 start cmd /k "cd /d A:\SwitchMap\backend\SWICTHMAP\websocket && py get_data_service.py"
 
-start cmd /k "cd /d A:\switchmap\ && py auto_backup_git.py"
+start cmd /k "cd /d A:\switchmap\ && py auto_backup_git.py run --git-push"
 
 exit
@@ -3,6 +3,11 @@ import time
 from datetime import datetime
 import sys
 import os
+import argparse
+import glob
+import hashlib
+import json
+import zlib
 
 def run_command(command, error_message):
     """Executa um comando no shell e trata erros."""
@@ -68,6 +73,279 @@ def create_gitattributes():
         run_command("git add .", "Falha ao adicionar arquivos")
         run_command('git commit -m "Corrige finais de linha"', "Falha ao commitar correção de finais de linha")
 
+# --- Backup por snapshots ---
+#
+# Em vez de commitar a árvore inteira a cada minuto, cada tick guarda um snapshot do estado
+# (dados.json, log de aprovações, histórico) num diretório local:
+#
+#   <store>/chunks/ab/abcdef...   pedaços do conteúdo, comprimidos, nomeados pelo SHA-256
+#   <store>/snapshots/<id>.json   manifesto: para cada arquivo, tamanho, hash e lista de pedaços
+#
+# Os cortes entre pedaços dependem do conteúdo (fim de linha cujo CRC32 cai num múltiplo de
+# DIVISOR_CORTE), então uma alteração no meio de dados.json só gera pedaços novos perto dela:
+# o resto reaproveita os pedaços já guardados.
+
+DIRETORIO_WEBSOCKET = os.path.join("backend", "SWICTHMAP", "websocket")
+ARQUIVOS_BACKUP = [
+    os.path.join(DIRETORIO_WEBSOCKET, "dados.json"),
+    os.path.join(DIRETORIO_WEBSOCKET, "aprovacoes.*.jsonl"),
+    os.path.join(DIRETORIO_WEBSOCKET, "aprovacoes_pendentes.json"),
+    os.path.join(DIRETORIO_WEBSOCKET, "alteracoes.json"),
+]
+DIRETORIO_SNAPSHOTS = "snapshots_backup"
+INTERVALO_SNAPSHOT = 60          # segundos entre ticks
+INTERVALO_MINIMO_PUSH = 3600     # no máximo um push por hora
+TAMANHO_MIN_PEDACO = 16 * 1024
+TAMANHO_MAX_PEDACO = 256 * 1024
+DIVISOR_CORTE = 64               # corte em ~1 de cada 64 linhas depois do tamanho mínimo
+
+# Retenção em camadas: tudo na última hora, um por hora nas últimas 24h, um por dia por 30 dias
+RETENCAO = [
+    (3600, 0),
+    (24 * 3600, 3600),
+    (30 * 24 * 3600, 24 * 3600),
+]
+
+def _pedacos(conteudo):
+    """Divide o conteúdo em pedaços com cortes definidos pelo próprio conteúdo (fins de linha)."""
+    inicio = 0
+    tamanho = 0
+    for linha in conteudo.splitlines(keepends=True):
+        tamanho += len(linha)
+        if tamanho >= TAMANHO_MAX_PEDACO or (
+                tamanho >= TAMANHO_MIN_PEDACO and zlib.crc32(linha) % DIVISOR_CORTE == 0):
+            yield conteudo[inicio:inicio + tamanho]
+            inicio += tamanho
+            tamanho = 0
+    if tamanho:
+        yield conteudo[inicio:inicio + tamanho]
+
+def _escrever_atomico(caminho, dados):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        f.write(dados)
+    os.replace(temporario, caminho)
+
+class SnapshotStore:
+    """Snapshots deduplicados e comprimidos do estado do SwitchMap num diretório local."""
+
+    def __init__(self, diretorio=DIRETORIO_SNAPSHOTS):
+        self.diretorio = diretorio
+        self.dir_pedacos = os.path.join(diretorio, "chunks")
+        self.dir_manifestos = os.path.join(diretorio, "snapshots")
+
+    def _caminho_pedaco(self, digest):
+        return os.path.join(self.dir_pedacos, digest[:2], digest)
+
+    def _guardar_pedaco(self, pedaco):
+        """Grava o pedaço se ainda não existe. Retorna (hash, bytes gravados)."""
+        digest = hashlib.sha256(pedaco).hexdigest()
+        caminho = self._caminho_pedaco(digest)
+        if os.path.exists(caminho):
+            return digest, 0
+        comprimido = zlib.compress(pedaco, 6)
+        _escrever_atomico(caminho, comprimido)
+        return digest, len(comprimido)
+
+    def list(self):
+        """Manifestos dos snapshots, do mais antigo ao mais recente."""
+        manifestos = []
+        for caminho in sorted(glob.glob(os.path.join(self.dir_manifestos, "*.json"))):
+            with open(caminho, "r", encoding="utf-8") as f:
+                manifestos.append(json.load(f))
+        return manifestos
+
+    def latest(self):
+        manifestos = sorted(glob.glob(os.path.join(self.dir_manifestos, "*.json")))
+        if not manifestos:
+            return None
+        with open(manifestos[-1], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def snapshot(self, padroes=ARQUIVOS_BACKUP, agora=None):
+        """
+        Cria um snapshot dos arquivos que casam com os padrões.
+
+        Returns:
+            O manifesto criado, ou None se nenhum arquivo mudou desde o último snapshot.
+        """
+        agora = agora or time.time()
+        caminhos = sorted({c for padrao in padroes for c in glob.glob(padrao) if os.path.isfile(c)})
+        ultimo = self.latest()
+        anteriores = ultimo["arquivos"] if ultimo else {}
+
+        arquivos = {}
+        bytes_novos = 0
+        for caminho in caminhos:
+            with open(caminho, "rb") as f:
+                conteudo = f.read()
+            chave = caminho.replace(os.sep, "/")
+            digest = hashlib.sha256(conteudo).hexdigest()
+            if anteriores.get(chave, {}).get("sha256") == digest:
+                arquivos[chave] = anteriores[chave]  # inalterado: reaproveita a lista de pedaços
+                continue
+            pedacos = []
+            for pedaco in _pedacos(conteudo):
+                hash_pedaco, gravados = self._guardar_pedaco(pedaco)
+                pedacos.append(hash_pedaco)
+                bytes_novos += gravados
+            arquivos[chave] = {"tamanho": len(conteudo), "sha256": digest, "pedacos": pedacos}
+
+        if ultimo is not None and arquivos == anteriores:
+            return None
+
+        snapshot_id = datetime.fromtimestamp(agora).strftime("%Y%m%d-%H%M%S")
+        sufixo = 1
+        while os.path.exists(os.path.join(self.dir_manifestos, f"{snapshot_id}.json")):
+            sufixo += 1
+            snapshot_id = f"{datetime.fromtimestamp(agora).strftime('%Y%m%d-%H%M%S')}-{sufixo}"
+        manifesto = {"id": snapshot_id, "ts": agora, "arquivos": arquivos, "bytes_novos": bytes_novos}
+        _escrever_atomico(os.path.join(self.dir_manifestos, f"{snapshot_id}.json"),
+                          json.dumps(manifesto, ensure_ascii=False).encode("utf-8"))
+        return manifesto
+
+    def restore(self, snapshot_id, destino=".", arquivos=None):
+        """Reconstrói os arquivos do snapshot (todos, ou só os indicados) sob `destino`."""
+        caminho = os.path.join(self.dir_manifestos, f"{snapshot_id}.json")
+        with open(caminho, "r", encoding="utf-8") as f:
+            manifesto = json.load(f)
+        restaurados = []
+        for nome, info in manifesto["arquivos"].items():
+            if arquivos and nome not in arquivos:
+                continue
+            partes = []
+            for digest in info["pedacos"]:
+                with open(self._caminho_pedaco(digest), "rb") as f:
+                    partes.append(zlib.decompress(f.read()))
+            conteudo = b"".join(partes)
+            if hashlib.sha256(conteudo).hexdigest() != info["sha256"]:
+                raise ValueError(f"Conteúdo restaurado de {nome} não confere com o hash do snapshot")
+            _escrever_atomico(os.path.join(destino, *nome.split("/")), conteudo)
+            restaurados.append(nome)
+        return restaurados
+
+    def prune(self, agora=None, retencao=RETENCAO):
+        """
+        Aplica a retenção em camadas e remove os pedaços que nenhum snapshot usa mais.
+
+        Para cada camada (idade máxima, espaçamento), fica o snapshot mais recente de cada
+        intervalo de `espaçamento` segundos; snapshots mais velhos que a última camada saem.
+        O snapshot mais recente é sempre mantido.
+        """
+        agora = agora or time.time()
+        manifestos = self.list()
+        manter = set()
+        vistos = set()
+        for manifesto in reversed(manifestos):
+            idade = agora - manifesto["ts"]
+            for idade_max, espacamento in retencao:
+                if idade <= idade_max:
+                    balde = (idade_max, int(manifesto["ts"] // espacamento) if espacamento else manifesto["id"])
+                    if balde not in vistos:
+                        vistos.add(balde)
+                        manter.add(manifesto["id"])
+                    break
+        if manifestos:
+            manter.add(manifestos[-1]["id"])
+
+        removidos = 0
+        em_uso = set()
+        for manifesto in manifestos:
+            if manifesto["id"] in manter:
+                for info in manifesto["arquivos"].values():
+                    em_uso.update(info["pedacos"])
+            else:
+                os.remove(os.path.join(self.dir_manifestos, f"{manifesto['id']}.json"))
+                removidos += 1
+        pedacos_removidos = 0
+        for caminho in glob.glob(os.path.join(self.dir_pedacos, "*", "*")):
+            if os.path.basename(caminho) not in em_uso:
+                os.remove(caminho)
+                pedacos_removidos += 1
+        return removidos, pedacos_removidos
+
+class GitSink:
+    """
+    Envio opcional do diretório de snapshots para um repositório git, no máximo uma vez a
+    cada `intervalo` segundos. Só o diretório de snapshots é adicionado ao commit.
+    """
+
+    def __init__(self, repo=".", caminho=DIRETORIO_SNAPSHOTS, remote="origin", branch="main",
+                 intervalo=INTERVALO_MINIMO_PUSH):
+        self.repo = repo
+        self.caminho = caminho
+        self.remote = remote
+        self.branch = branch
+        self.intervalo = intervalo
+        self._ultimo_push = 0
+
+    def _git(self, *args):
+        return subprocess.run(["git", *args], cwd=self.repo, text=True, capture_output=True)
+
+    def maybe_push(self, agora=None):
+        """Commita e envia os snapshots se já passou o intervalo mínimo. Retorna True se enviou."""
+        agora = agora or time.time()
+        if agora - self._ultimo_push < self.intervalo:
+            return False
+        self._git("add", "-A", "--", self.caminho)
+        if not self._git("status", "--porcelain", "--", self.caminho).stdout.strip():
+            return False
+        mensagem = f"Backup de snapshots: {datetime.fromtimestamp(agora).strftime('%Y-%m-%d %H:%M:%S')}"
+        commit = self._git("commit", "-m", mensagem, "--", self.caminho)
+        if commit.returncode != 0:
+            log_message(f"Erro: Falha ao criar commit de snapshots\n{commit.stderr}")
+            return False
+        push = self._git("push", self.remote, f"HEAD:{self.branch}")
+        if push.returncode != 0:
+            log_message(f"Erro: Falha ao fazer push dos snapshots\n{push.stderr}")
+            return False
+        self._ultimo_push = agora
+        log_message("Snapshots enviados ao repositório remoto.")
+        return True
+
+def snapshot_tick(store, sink=None):
+    """Um tick do modo snapshot: snapshot (se algo mudou), retenção e push opcional."""
+    manifesto = store.snapshot()
+    if manifesto is None:
+        print("Nenhuma mudança desde o último snapshot.")
+    else:
+        mensagem = (f"Snapshot {manifesto['id']}: {len(manifesto['arquivos'])} arquivos, "
+                    f"{manifesto['bytes_novos'] / 1024:.1f} KB novos")
+        print(mensagem)
+        log_message(mensagem)
+        removidos, pedacos = store.prune()
+        if removidos:
+            log_message(f"Retenção: {removidos} snapshots e {pedacos} pedaços removidos")
+    if sink is not None:
+        sink.maybe_push()
+
+def run_snapshots(args):
+    store = SnapshotStore(args.store)
+    sink = GitSink(repo=args.repo, caminho=args.store, remote=args.remote, branch=args.branch,
+                   intervalo=args.push_interval) if args.git_push else None
+    while True:
+        try:
+            snapshot_tick(store, sink)
+        except Exception as e:
+            log_message(f"Erro no snapshot: {e}")
+            print(f"Erro no snapshot: {e}")
+        if args.once:
+            return
+        time.sleep(args.interval)
+
+def list_snapshots(args):
+    for manifesto in SnapshotStore(args.store).list():
+        tamanho = sum(info["tamanho"] for info in manifesto["arquivos"].values())
+        print(f"{manifesto['id']}  {len(manifesto['arquivos'])} arquivos  {tamanho / 1024:.0f} KB  "
+              f"({manifesto['bytes_novos'] / 1024:.1f} KB novos)")
+
+def restore_snapshot(args):
+    restaurados = SnapshotStore(args.store).restore(args.id, args.dest, args.files or None)
+    for nome in restaurados:
+        print(f"Restaurado: {os.path.join(args.dest, nome)}")
+    log_message(f"Snapshot {args.id} restaurado em {args.dest}: {len(restaurados)} arquivos")
+
 def deploy():
     """Executa o processo de deploy."""
     print(f"\nIniciando deploy às {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}...")
@@ -99,8 +377,8 @@ def deploy():
     print("Deploy concluído com sucesso!")
     log_message("Deploy concluído com sucesso!")
 
-def main():
-    """Loop principal que executa o deploy a cada 6 horas."""
+def run_legacy():
+    """Modo antigo: git add . + commit + push a cada minuto."""
     # Configurações iniciais
     ensure_git_config()
     create_gitignore()
@@ -113,6 +391,45 @@ def main():
         log_message("Aguardando para o próximo deploy...")
         time.sleep(60) 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backup do estado do SwitchMap")
+    parser.add_argument("--store", default=DIRETORIO_SNAPSHOTS, help="Diretório dos snapshots")
+    comandos = parser.add_subparsers(dest="comando")
+
+    run = comandos.add_parser("run", help="Snapshot a cada intervalo (padrão)")
+    run.add_argument("--interval", type=int, default=INTERVALO_SNAPSHOT)
+    run.add_argument("--once", action="store_true", help="Executa um único tick")
+    run.add_argument("--git-push", action="store_true", help="Envia os snapshots para um repositório git")
+    run.add_argument("--push-interval", type=int, default=INTERVALO_MINIMO_PUSH)
+    run.add_argument("--repo", default=".", help="Repositório git onde o diretório de snapshots é commitado")
+    run.add_argument("--remote", default="origin")
+    run.add_argument("--branch", default="main")
+
+    comandos.add_parser("list", help="Lista os snapshots")
+
+    restore = comandos.add_parser("restore", help="Restaura um snapshot")
+    restore.add_argument("id")
+    restore.add_argument("--dest", default=".", help="Diretório de destino (padrão: atual)")
+    restore.add_argument("--files", nargs="*", help="Só estes arquivos (caminhos como no manifesto)")
+
+    comandos.add_parser("legacy", help="Modo antigo: git add . + commit + push a cada minuto")
+
+    args = parser.parse_args(argv)
+    if args.comando is None:
+        args = parser.parse_args(["--store", args.store, "run"])
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.comando == "list":
+        list_snapshots(args)
+    elif args.comando == "restore":
+        restore_snapshot(args)
+    elif args.comando == "legacy":
+        run_legacy()
+    else:
+        run_snapshots(args)
+
 if __name__ == "__main__":
     try:
         main()
@@ -1,80 +1,285 @@
-from flask import Flask, render_template
-from flask_socketio import SocketIO
+from flask import Flask, render_template, jsonify
+from flask_socketio import SocketIO, emit
 import psutil
 import eventlet
+import os
 import time
+from collections import deque, Counter
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+MONITORED_PORTS = [5000, 3000, 8080]
+INTERVALO_AMOSTRAGEM = 1  # segundos
+TAMANHO_HISTORICO = 300   # amostras guardadas para quem conecta depois (5 min com intervalo de 1s)
+INTERVALO_DESCOBERTA = 10  # segundos entre varreduras da lista de processos
+
+# Serviços do SwitchMap: identificados pela porta em que escutam e/ou pelo script na linha de comando
+SERVICOS = {
+    "app": {"porta": 5000, "comando": "app.py"},
+    "get_data_service": {"porta": 5001, "comando": "get_data_service.py"},
+    "approve": {"porta": 5002, "comando": "approve.py"},
+    "cache_mapa": {"porta": 3000, "comando": "cachemap.js"},
+    "scraper": {"porta": 8080, "comando": "scraper.js"},
+    "auto_backup": {"porta": None, "comando": "auto_backup_git.py"},
+    "monitor": {"porta": 8050, "comando": "cpu.py"},
+}
+# Campos enviados no delta: só vão os que mudaram além da tolerância desde o último envio
+TOLERANCIA_DELTA = {"cpu": 0.5, "rss_mb": 0.5, "threads": 0, "fds": 0, "sockets": 0,
+                    "io_leitura_kbs": 1, "io_escrita_kbs": 1, "processos": 0}
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
-def get_port_info(ports):
+def get_listening_pids(connections=None):
+    """Mapa porta -> pid de todos os sockets em LISTEN, com uma única varredura de conexões."""
+    if connections is None:
+        connections = psutil.net_connections(kind='inet')
+    listening = {}
+    for conn in connections:
+        if conn.status == psutil.CONN_LISTEN:
+            listening.setdefault(conn.laddr.port, conn.pid)
+    return listening
+
+def get_port_info(ports, listening=None):
     """Obtém informações sobre processos nas portas especificadas."""
+    if listening is None:
+        listening = get_listening_pids()
     port_data = {}
     for port in ports:
-        port_data[port] = {"status": "Livre", "process": None, "pid": None}
-        for conn in psutil.net_connections(kind='inet'):
-            if conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
-                try:
-                    process = psutil.Process(conn.pid)
-                    port_data[port] = {
-                        "status": "Em uso",
-                        "process": process.name(),
-                        "pid": conn.pid
-                    }
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    port_data[port] = {
-                        "status": "Em uso",
-                        "process": "Desconhecido",
-                        "pid": conn.pid
-                    }
-                break
+        if port not in listening:
+            port_data[port] = {"status": "Livre", "process": None, "pid": None}
+            continue
+        pid = listening[port]
+        try:
+            process_name = psutil.Process(pid).name()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, ValueError):
+            process_name = "Desconhecido"
+        port_data[port] = {"status": "Em uso", "process": process_name, "pid": pid}
     return port_data
 
-def send_system_stats():
-    """Envia estatísticas do sistema e informações de portas em tempo real."""
-    monitored_ports = [5000, 3000, 8080]
-    last_net_io = psutil.net_io_counters()
-    last_time = time.time()
+def _arquivos_do_comando(process):
+    """Nomes (sem diretório, em minúsculas) dos argumentos da linha de comando: {"py", "app.py"}"""
+    try:
+        return {os.path.basename(arg).lower() for arg in process.cmdline()}
+    except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+        return set()
+
+class ProcessMonitor:
+    """
+    Uso de recursos por serviço do SwitchMap (app.py, approve.py, scraper, cache do mapa...).
+
+    Os processos de cada serviço são descobertos pela porta em que escutam e pela linha de
+    comando (a lista completa de processos só é percorrida a cada INTERVALO_DESCOBERTA
+    segundos). Por amostra, cada serviço recebe a soma dos seus processos: CPU, RSS,
+    threads, descritores abertos, sockets e taxa de I/O de disco.
+    """
+
+    def __init__(self, servicos=SERVICOS, history_size=TAMANHO_HISTORICO,
+                 intervalo_descoberta=INTERVALO_DESCOBERTA):
+        self.servicos = servicos
+        self.history = deque(maxlen=history_size)
+        self.intervalo_descoberta = intervalo_descoberta
+        self._processos = {}      # pid -> psutil.Process (mantido para o cpu_percent incremental)
+        self._pids_servico = {}   # nome -> conjunto de pids
+        self._ultima_descoberta = 0
+        self._io_anterior = {}    # pid -> (ts, read_bytes, write_bytes)
+        self._enviado = {}        # nome -> último estado enviado no delta
+
+    def _processo(self, pid):
+        process = self._processos.get(pid)
+        if process is None:
+            process = self._processos[pid] = psutil.Process(pid)
+            process.cpu_percent(None)  # primeira leitura só define a base
+        return process
+
+    def _descobrir(self, listening):
+        pids_por_porta = {porta: pid for porta, pid in listening.items() if pid}
+        agora = time.time()
+        if agora - self._ultima_descoberta >= self.intervalo_descoberta:
+            self._ultima_descoberta = agora
+            encontrados = {nome: set() for nome in self.servicos}
+            for process in psutil.process_iter():
+                arquivos = _arquivos_do_comando(process)
+                for nome, servico in self.servicos.items():
+                    if servico["comando"] in arquivos:
+                        encontrados[nome].add(process.pid)
+            self._pids_servico = encontrados
+        for nome, servico in self.servicos.items():
+            pid = pids_por_porta.get(servico["porta"])
+            if pid:
+                self._pids_servico.setdefault(nome, set()).add(pid)
+        # Processos que não pertencem mais a nenhum serviço deixam de ser acompanhados
+        ativos = set().union(*self._pids_servico.values()) if self._pids_servico else set()
+        for pid in list(self._processos):
+            if pid not in ativos:
+                self._processos.pop(pid)
+                self._io_anterior.pop(pid, None)
+
+    def _medir(self, pid, sockets_por_pid, agora):
+        process = self._processo(pid)
+        with process.oneshot():
+            medida = {
+                "cpu": process.cpu_percent(None),
+                "rss_mb": process.memory_info().rss / (1024 * 1024),
+                "threads": process.num_threads(),
+                "fds": process.num_fds() if hasattr(process, "num_fds") else process.num_handles(),
+                "sockets": sockets_por_pid.get(pid, 0),
+                "io_leitura_kbs": 0.0,
+                "io_escrita_kbs": 0.0,
+            }
+            try:
+                io = process.io_counters()
+            except (AttributeError, psutil.AccessDenied):  # indisponível no macOS ou sem permissão
+                io = None
+        if io is not None:
+            anterior = self._io_anterior.get(pid)
+            self._io_anterior[pid] = (agora, io.read_bytes, io.write_bytes)
+            if anterior is not None and agora > anterior[0]:
+                medida["io_leitura_kbs"] = (io.read_bytes - anterior[1]) / 1024 / (agora - anterior[0])
+                medida["io_escrita_kbs"] = (io.write_bytes - anterior[2]) / 1024 / (agora - anterior[0])
+        return medida
+
+    def sample(self, listening, connections):
+        """Amostra {ts, servicos: {nome: {pids, processos, cpu, rss_mb, ...}}} e guarda no histórico."""
+        self._descobrir(listening)
+        sockets_por_pid = Counter(conn.pid for conn in connections if conn.pid)
+        agora = time.time()
+        servicos = {}
+        for nome in self.servicos:
+            total = dict.fromkeys(TOLERANCIA_DELTA, 0)
+            pids = []
+            for pid in sorted(self._pids_servico.get(nome, ())):
+                try:
+                    medida = self._medir(pid, sockets_por_pid, agora)
+                except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                    self._pids_servico[nome].discard(pid)
+                    self._processos.pop(pid, None)
+                    continue
+                except psutil.AccessDenied:
+                    continue
+                pids.append(pid)
+                for campo, valor in medida.items():
+                    total[campo] += valor
+            total["processos"] = len(pids)
+            servicos[nome] = {"pids": pids, **{c: round(v, 1) for c, v in total.items()}}
+        amostra = {"ts": agora, "servicos": servicos}
+        self.history.append(amostra)
+        return amostra
+
+    def delta(self, amostra):
+        """Só os campos de cada serviço que mudaram além da tolerância desde o último delta."""
+        mudancas = {}
+        for nome, atual in amostra["servicos"].items():
+            enviado = self._enviado.setdefault(nome, {})
+            campos = {}
+            if atual["pids"] != enviado.get("pids"):
+                campos["pids"] = atual["pids"]
+            for campo, tolerancia in TOLERANCIA_DELTA.items():
+                if campo not in enviado or abs(atual[campo] - enviado[campo]) > tolerancia:
+                    campos[campo] = atual[campo]
+            if campos:
+                enviado.update(campos)
+                mudancas[nome] = campos
+        return {"ts": amostra["ts"], "servicos": mudancas}
+
+    def latest(self):
+        return self.history[-1] if self.history else None
+
+class StatsSampler:
+    """
+    Amostrador único das estatísticas do sistema.
+
+    Coleta uma vez por intervalo, independentemente de quantos clientes estão conectados,
+    guarda as últimas amostras num buffer circular (enviado a quem conecta depois) e emite
+    a mesma amostra para todos os clientes.
+    """
+
+    def __init__(self, socketio, ports=MONITORED_PORTS, interval=INTERVALO_AMOSTRAGEM,
+                 history_size=TAMANHO_HISTORICO, process_monitor=None):
+        self.socketio = socketio
+        self.process_monitor = process_monitor
+        self.ports = ports
+        self.interval = interval
+        self.history = deque(maxlen=history_size)
+        self._thread = None
+        self._last_net_io = None
+        self._last_time = None
 
-    while True:
-        # Uso da CPU, memória e disco
-        cpu_usage = psutil.cpu_percent(interval=1)
+    def start(self):
+        """Inicia a coleta (uma única vez, mesmo se chamado a cada conexão)."""
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._run)
+        return self
+
+    def sample(self):
+        """Coleta uma amostra de CPU, memória, disco, rede e portas."""
+        # interval=None: uso desde a chamada anterior, sem bloquear o loop por 1s
+        cpu_usage = psutil.cpu_percent(interval=None)
         memory = psutil.virtual_memory()
         disk = psutil.disk_usage('/')
 
         # Uso de rede (KB/s)
         current_net_io = psutil.net_io_counters()
         current_time = time.time()
-        time_diff = current_time - last_time
-        bytes_sent_diff = current_net_io.bytes_sent - last_net_io.bytes_sent
-        bytes_recv_diff = current_net_io.bytes_recv - last_net_io.bytes_recv
-        net_usage = (bytes_sent_diff + bytes_recv_diff) / 1024 / time_diff  # KB/s
-
-        last_net_io = current_net_io
-        last_time = current_time
+        net_usage = 0.0
+        if self._last_net_io is not None and current_time > self._last_time:
+            bytes_sent_diff = current_net_io.bytes_sent - self._last_net_io.bytes_sent
+            bytes_recv_diff = current_net_io.bytes_recv - self._last_net_io.bytes_recv
+            net_usage = (bytes_sent_diff + bytes_recv_diff) / 1024 / (current_time - self._last_time)
+        self._last_net_io = current_net_io
+        self._last_time = current_time
 
-        # Informações das portas
-        port_info = get_port_info(monitored_ports)
+        # Uma varredura de conexões serve às portas e à contagem de sockets por processo
+        connections = psutil.net_connections(kind='inet')
+        listening = get_listening_pids(connections)
+        if self.process_monitor is not None:
+            self._process_sample = self.process_monitor.sample(listening, connections)
 
-        # Envia todos os dados para o frontend
-        stats = {
+        return {
+            "ts": current_time,
             "cpu": cpu_usage,
             "memory": memory.percent,
             "disk": disk.percent,
             "network": net_usage,  # Substitui temperatura por uso de rede
-            "ports": port_info
+            "ports": get_port_info(self.ports, listening)
         }
-        socketio.emit("system_stats", stats)
-        eventlet.sleep(1)
+
+    def _run(self):
+        psutil.cpu_percent(interval=None)  # primeira leitura só define a base
+        self._last_net_io = psutil.net_io_counters()
+        self._last_time = time.time()
+        while True:
+            eventlet.sleep(self.interval)
+            try:
+                stats = self.sample()
+            except Exception as e:
+                print(f"Erro ao coletar estatísticas: {e}")
+                continue
+            self.history.append(stats)
+            self.socketio.emit("system_stats", stats)
+            if self.process_monitor is not None:
+                delta = self.process_monitor.delta(self._process_sample)
+                if delta["servicos"]:
+                    self.socketio.emit("process_stats_delta", delta)
+
+process_monitor = ProcessMonitor()
+sampler = StatsSampler(socketio, process_monitor=process_monitor)
+
+@app.route("/processes")
+def processes():
+    """Última amostra por serviço e o histórico recente, para planejamento de capacidade."""
+    return jsonify({"atual": process_monitor.latest(), "historico": list(process_monitor.history)})
 
 @socketio.on("connect")
 def handle_connect():
     print("Cliente conectado!")
-    eventlet.spawn(send_system_stats)
+    sampler.start()
+    # Quem conecta depois recebe as amostras recentes para preencher os gráficos
+    emit("system_stats_history", list(sampler.history))
+    # Estado completo por serviço; depois disso o cliente só recebe os deltas
+    emit("process_stats", process_monitor.latest())
 
 if __name__ == "__main__":
-    socketio.run(app, host="172.16.196.36", port=8050, debug=True)
\ No newline at end of file
+    socketio.run(app, host="172.16.196.36", port=8050, debug=True)
@@ -1,15 +1,42 @@
-from flask import jsonify, request, render_template, Response
+from flask import jsonify, request, render_template, Response, stream_with_context
 import socket
 import time
+import uuid
 import logging
 from datetime import datetime
-from utils import obter_hostnames_confiaveis, atualizar_valores_dos_hosts, load_hostnames
-import asyncio
-import json
+from utils import load_hostnames
+from client_identity import identificar_cliente
+from spatial_index import parse_bbox
+from export_stream import iter_json, iter_ndjson, gzip_stream
+from ping_service import separar_ips_conhecidos, MAX_IPS_POR_PEDIDO
 
 logger = logging.getLogger(__name__)
 
-def register_routes(app, data_manager, limiter):
+STATUS_ALIASES = {"online": "#00d700", "offline": "red"}
+PORT_STATUS_ALIASES = {"ok": "Ok", "up": "Ok", "down": "Down: Port down", "admin_down": "Admin down",
+                       "admin down": "Admin down"}
+SIM_NAO_ALIASES = {"yes": "Yes", "sim": "Yes", "true": "Yes", "no": "No", "nao": "No", "false": "No"}
+PORT_GROUPS = ("site", "uf", "host")
+MAX_LIMITE_HOSTS = 5000
+MAX_ITENS_LOTE = 1000
+
+def _parse_lista(valor, aliases=None):
+    """Converte "a,b,c" em conjunto (None se vazio), traduzindo apelidos."""
+    if not valor:
+        return None
+    aliases = aliases or {}
+    return {aliases.get(item.strip().lower(), item.strip()) for item in valor.split(",") if item.strip()}
+
+def _novo_id_edicao():
+    """ID de solicitação de edição; aleatório para não colidir entre workers com cópias do estado."""
+    return uuid.uuid4().hex[:12]
+
+def _edicao_pendente(txn, edit_id, editavel=False):
+    """Edição pendente com o ID (somente leitura, ou a cópia mutável da transação), ou None."""
+    pendentes = txn.section("pending_edits", []) if editavel else txn.get_section("pending_edits", [])
+    return next((e for e in pendentes if e.get("id") == edit_id and e.get("status") == "pendente"), None)
+
+def register_routes(app, data_manager, limiter, trusted_provider=None, pinger=None):
     # @app.route("/get-data", methods=["GET"])
     # @limiter.limit("50 per minute")
     # def get_data():
@@ -40,22 +67,18 @@ def register_routes(app, data_manager, limiter):
             if not isinstance(ips, list):
                 return jsonify({"erro": "O campo 'ips' deve ser uma lista"}), 400
 
-            dados = data_manager.get_data()
-            priority_ips = dados.get("priority_ips", {})
             current_time = datetime.now().isoformat()
-            valid_ips = {host["ip"] for host in dados["hosts"]}
             accepted_ips = []
             rejected_ips = []
 
-            for ip in ips:
-                if ip in valid_ips:
-                    priority_ips[ip] = current_time
-                    accepted_ips.append(ip)
-                else:
-                    rejected_ips.append(ip)
-
-            dados["priority_ips"] = priority_ips
-            data_manager.update_data(dados)
+            with data_manager.transaction() as txn:
+                for ip in ips:
+                    if isinstance(ip, str) and txn.get_host(ip) is not None:
+                        accepted_ips.append(ip)
+                    else:
+                        rejected_ips.append(ip)
+                if accepted_ips:
+                    txn.section("priority_ips", {}).update((ip, current_time) for ip in accepted_ips)
             
             logger.info(f"{len(accepted_ips)} IPs marcados para priorização, {len(rejected_ips)} rejeitados")
             return jsonify({
@@ -67,48 +90,83 @@ def register_routes(app, data_manager, limiter):
             logger.error(f"Erro ao priorizar IPs: {str(e)}")
             return jsonify({"erro": "Falha ao priorizar IPs"}), 500
 
+    @app.route("/ping", methods=["POST"])
+    @limiter.limit("60 per minute")
+    def ping_sob_demanda():
+        """
+        Ping imediato de hosts: {"ips": [...]}. Retorna um ticket na hora; os resultados chegam
+        pelo evento 'ping_result' (e 'hosts_delta', se o host mudou) ou por GET /ping/<ticket>.
+        """
+        if pinger is None:
+            return jsonify({"erro": "Ping sob demanda indisponível"}), 503
+        ips = (request.get_json(silent=True) or {}).get("ips")
+        if not isinstance(ips, list) or not ips or len(ips) > MAX_IPS_POR_PEDIDO:
+            return jsonify({"erro": f"O campo 'ips' deve ser uma lista com 1 a {MAX_IPS_POR_PEDIDO} IPs"}), 400
+        aceitos, rejeitados = separar_ips_conhecidos(data_manager, ips)
+        if not aceitos:
+            return jsonify({"erro": "Nenhum IP conhecido", "rejected": rejeitados}), 404
+        return jsonify({**pinger.request(aceitos), "rejected": rejeitados}), 202
+
+    @app.route("/ping/<ticket>", methods=["GET"])
+    @limiter.limit("300 per minute")
+    def status_ping(ticket):
+        status = pinger.ticket_status(ticket) if pinger is not None else None
+        if status is None:
+            return jsonify({"erro": "Ticket não encontrado ou expirado"}), 404
+        return jsonify(status), 200
+
     @app.route("/refresh-trusted-hostnames", methods=["POST"])
     def refresh_trusted_hostnames():
-        try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            hostnames = loop.run_until_complete(obter_hostnames_confiaveis())
-            loop.close()
-            
-            dados = data_manager.get_data()
-            dados["trusted_hostnames"] = hostnames
-            data_manager.update_data(dados)
-            logger.info("Hostnames confiáveis atualizados manualmente")
-            return jsonify({"mensagem": "Hostnames atualizados com sucesso"}), 200
-        except Exception as e:
-            logger.error(f"Erro ao atualizar hostnames: {str(e)}")
-            return jsonify({"erro": "Falha ao atualizar hostnames"}), 500
+        # A busca roda em segundo plano; a lista nova chega aos clientes pelo cache remoto
+        if trusted_provider is not None:
+            trusted_provider.refresh_async()
+            status = trusted_provider.status()
+        else:
+            data_manager.bus.publish("refresh_trusted_hostnames", {})
+            status = {"total": len(data_manager.snapshot().get("trusted_hostnames", []))}
+        logger.info("Atualização de hostnames confiáveis solicitada manualmente")
+        return jsonify({"mensagem": "Atualização de hostnames agendada", **status}), 202
+
+    @app.route("/ingest-status", methods=["GET"])
+    def ingest_status():
+        if data_manager.ingest_stats is None:
+            return jsonify({"erro": "Nenhuma ingestão de resultados.json concluída"}), 503
+        return jsonify(data_manager.ingest_stats), 200
 
     @app.route("/download-dados", methods=["GET"])
     @limiter.limit("50 per minute")
     def download_dados():
         start_time = time.time()
-        try:
-            hostname_cliente = socket.gethostbyaddr(request.remote_addr)[0] if request.remote_addr else "Desconhecido"
-        except socket.herror:
-            hostname_cliente = "Desconhecido"
-            logger.debug(f"Não foi possível resolver hostname para {request.remote_addr}")
+        hostname_cliente = identificar_cliente(request.remote_addr)
 
-        dados = data_manager.get_data()
-        hostnames_confiaveis = dados.get("trusted_hostnames", [])
-        if hostname_cliente not in hostnames_confiaveis:
-            logger.info(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - 🚫 ACESSO NEGADO para {hostname_cliente} em /download-dados")
+        if hostname_cliente not in data_manager.get_trusted_hostnames():
+            logger.warning("🚫 ACESSO NEGADO em /download-dados", extra={"cliente": hostname_cliente})
             return jsonify({"erro": "Acesso não autorizado"}), 403
 
-        json_data = json.dumps(dados, indent=4, ensure_ascii=False)
-        logger.info(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - ✅ Dados baixados por {hostname_cliente}")
-        total_time = time.time() - start_time
-        logger.debug(f"Tempo total de /download-dados: {total_time:.3f}s")
-        return Response(
-            json_data,
-            mimetype="application/json",
-            headers={"Content-Disposition": "attachment; filename=dados.json"}
-        )
+        # Snapshot imutável: nada de deepcopy, o documento é serializado host a host e as
+        # portas de cada host são remontadas da tabela colunar só na hora de serializá-lo
+        dados = data_manager.snapshot()
+        formato = request.args.get("format", "json").lower()
+        if formato == "ndjson":
+            blocos = iter_ndjson(dados, host_transform=data_manager.with_ports)
+            mimetype, filename = "application/x-ndjson", "dados.ndjson"
+        else:
+            blocos = iter_json(dados, host_transform=data_manager.with_ports)
+            mimetype, filename = "application/json", "dados.json"
+
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
+        usar_gzip = request.args.get("gzip") == "1" or "gzip" in request.headers.get("Accept-Encoding", "")
+        if usar_gzip:
+            blocos = gzip_stream(blocos)
+            headers["Content-Encoding"] = "gzip"
+            headers["Vary"] = "Accept-Encoding"
+
+        logger.info("✅ Dados baixados", extra={"cliente": hostname_cliente})
+        logger.debug("Tempo até o início do envio de /download-dados: %.3fs", time.time() - start_time)
+        response = Response(stream_with_context(blocos), mimetype=mimetype, headers=headers)
+        # Impede o Flask-Compress de bufferizar a resposta para comprimi-la de novo
+        response.direct_passthrough = True
+        return response
 
     @app.route("/editar-host", methods=["PUT"])
     @limiter.limit("20 per minute")
@@ -121,23 +179,20 @@ def register_routes(app, data_manager, limiter):
             if not ip:
                 return jsonify({"erro": "O campo 'ip' é obrigatório"}), 400
 
-            dados = data_manager.get_data()
-            hosts_dict = {host["ip"]: host for host in dados["hosts"]}
-            if ip not in hosts_dict:
-                return jsonify({"erro": "Host não encontrado"}), 404
-
-            edit_id = str(len(dados.get("pending_edits", [])) + 1)
-            solicitacao = {
-                "id": edit_id,
-                "ip": ip,
-                **novos_dados,
-                "solicitante": socket.gethostname(),
-                "data_solicitacao": datetime.now().isoformat(),
-                "status": "pendente"
-            }
+            with data_manager.transaction() as txn:
+                if txn.get_host(ip) is None:
+                    return jsonify({"erro": "Host não encontrado"}), 404
 
-            dados["pending_edits"] = dados.get("pending_edits", []) + [solicitacao]
-            data_manager.update_data(dados)
+                edit_id = _novo_id_edicao()
+                solicitacao = {
+                    "id": edit_id,
+                    "ip": ip,
+                    **novos_dados,
+                    "solicitante": socket.gethostname(),
+                    "data_solicitacao": datetime.now().isoformat(),
+                    "status": "pendente"
+                }
+                txn.section("pending_edits", []).append(solicitacao)
             logger.info(f"Solicitação de edição enviada para IP {ip} (ID: {edit_id})")
             return jsonify({"mensagem": "Solicitação enviada!", "solicitacao": solicitacao}), 200
         except Exception as e:
@@ -149,27 +204,23 @@ def register_routes(app, data_manager, limiter):
     def listar_pendentes():
         dados = data_manager.get_data()
         pendentes = [edit for edit in dados.get("pending_edits", []) if edit["status"] == "pendente"]
-        logger.debug(f"Listando {len(pendentes)} edições pendentes")
+        logger.debug("Listando %d edições pendentes", len(pendentes))
         return jsonify(pendentes), 200
 
     @app.route("/approve-edit/<edit_id>", methods=["POST"])
     @limiter.limit("20 per minute")
     def aprovar_edicao(edit_id):
         try:
-            dados = data_manager.get_data()
-            edit = next((e for e in dados["pending_edits"] if e["id"] == edit_id and e["status"] == "pendente"), None)
-            if not edit:
-                return jsonify({"erro": "Edição não encontrada ou já processada"}), 404
-
-            hosts_dict = {host["ip"]: host for host in dados["hosts"]}
-            if edit["ip"] in hosts_dict:
-                hosts_dict[edit["ip"]].update(
-                    {k: v for k, v in edit.items() if k not in ["id", "solicitante", "data_solicitacao", "status"]}
-                )
-            edit["status"] = "aprovado"
-            dados["hosts"] = list(hosts_dict.values())
-            data_manager.update_data(dados)
-            logger.info(f"Edição {edit_id} aprovada para IP {edit['ip']}")
+            with data_manager.transaction() as txn:
+                if not _edicao_pendente(txn, edit_id):
+                    return jsonify({"erro": "Edição não encontrada ou já processada"}), 404
+
+                edit = _edicao_pendente(txn, edit_id, editavel=True)
+                host = txn.edit_host(edit.get("ip"))
+                if host is not None:
+                    host.update({k: v for k, v in edit.items() if k not in ["id", "solicitante", "data_solicitacao", "status"]})
+                edit["status"] = "aprovado"
+            logger.info(f"Edição {edit_id} aprovada para IP {edit.get('ip')}")
             return jsonify({"mensagem": "Edição aprovada!"}), 200
         except Exception as e:
             logger.error(f"Erro ao aprovar edição {edit_id}: {str(e)}")
@@ -179,19 +230,112 @@ def register_routes(app, data_manager, limiter):
     @limiter.limit("20 per minute")
     def rejeitar_edicao(edit_id):
         try:
-            dados = data_manager.get_data()
-            edit = next((e for e in dados["pending_edits"] if e["id"] == edit_id and e["status"] == "pendente"), None)
-            if not edit:
-                return jsonify({"erro": "Edição não encontrada ou já processada"}), 404
-
-            edit["status"] = "rejeitado"
-            data_manager.update_data(dados)
-            logger.info(f"Edição {edit_id} rejeitada para IP {edit['ip']}")
+            with data_manager.transaction() as txn:
+                if not _edicao_pendente(txn, edit_id):
+                    return jsonify({"erro": "Edição não encontrada ou já processada"}), 404
+
+                edit = _edicao_pendente(txn, edit_id, editavel=True)
+                edit["status"] = "rejeitado"
+            logger.info(f"Edição {edit_id} rejeitada para IP {edit.get('ip')}")
             return jsonify({"mensagem": "Edição rejeitada!"}), 200
         except Exception as e:
             logger.error(f"Erro ao rejeitar edição {edit_id}: {str(e)}")
             return jsonify({"erro": "Falha ao rejeitar edição"}), 500
 
+    @app.route("/editar-hosts", methods=["PUT"])
+    @limiter.limit("20 per minute")
+    def editar_hosts_lote():
+        """Várias solicitações de edição de uma vez: {"edits": [{"ip": ..., campos...}, ...]}"""
+        try:
+            corpo = request.get_json(silent=True) or {}
+            edits = corpo.get("edits")
+            if not isinstance(edits, list) or not edits:
+                return jsonify({"erro": "O campo 'edits' deve ser uma lista não vazia"}), 400
+            if len(edits) > MAX_ITENS_LOTE:
+                return jsonify({"erro": f"Máximo de {MAX_ITENS_LOTE} itens por lote"}), 400
+
+            resultados = []
+            with data_manager.transaction() as txn:
+                novas = []
+                for item in edits:
+                    ip = item.get("ip") if isinstance(item, dict) else None
+                    if not ip or not isinstance(ip, str):
+                        resultados.append({"ip": ip, "ok": False, "erro": "O campo 'ip' é obrigatório"})
+                        continue
+                    if txn.get_host(ip) is None:
+                        resultados.append({"ip": ip, "ok": False, "erro": "Host não encontrado"})
+                        continue
+                    solicitacao = {
+                        "id": _novo_id_edicao(),
+                        "ip": ip,
+                        **{k: v for k, v in item.items() if v is not None and k != "ip"},
+                        "solicitante": socket.gethostname(),
+                        "data_solicitacao": datetime.now().isoformat(),
+                        "status": "pendente"
+                    }
+                    novas.append(solicitacao)
+                    resultados.append({"ip": ip, "ok": True, "solicitacao": solicitacao})
+                # Sem nenhum item aceito a transação fica vazia: nada é gravado nem publicado
+                if novas:
+                    txn.section("pending_edits", []).extend(novas)
+
+            aceitos = sum(1 for r in resultados if r["ok"])
+            logger.info(f"Lote de edição: {aceitos} solicitações criadas, {len(resultados) - aceitos} rejeitadas")
+            return jsonify({"mensagem": f"{aceitos} solicitações enviadas", "resultados": resultados}), 200
+        except Exception as e:
+            logger.error(f"Erro ao processar lote de edições: {str(e)}")
+            return jsonify({"erro": "Falha ao enviar solicitações"}), 500
+
+    def _processar_lote_edicoes(novo_status):
+        """Aprova ou rejeita uma lista de IDs ({"ids": [...]}) numa única transação."""
+        corpo = request.get_json(silent=True) or {}
+        ids = corpo.get("ids")
+        if not isinstance(ids, list) or not ids:
+            return jsonify({"erro": "O campo 'ids' deve ser uma lista não vazia"}), 400
+        if len(ids) > MAX_ITENS_LOTE:
+            return jsonify({"erro": f"Máximo de {MAX_ITENS_LOTE} itens por lote"}), 400
+
+        resultados = []
+        with data_manager.transaction() as txn:
+            # Leitura sem cópia; a seção só é copiada (e a transação gravada) se algum id casar
+            pendentes = {e["id"] for e in txn.get_section("pending_edits", []) if e.get("status") == "pendente"}
+            editaveis = {}
+            if any(str(i) in pendentes for i in ids):
+                editaveis = {e["id"]: e for e in txn.section("pending_edits", []) if e["id"] in pendentes}
+            for edit_id in ids:
+                edit = editaveis.pop(str(edit_id), None)
+                if edit is None:
+                    resultados.append({"id": edit_id, "ok": False, "erro": "Edição não encontrada ou já processada"})
+                    continue
+                if novo_status == "aprovado":
+                    host = txn.edit_host(edit["ip"])
+                    if host is not None:
+                        host.update({k: v for k, v in edit.items() if k not in ["id", "solicitante", "data_solicitacao", "status"]})
+                edit["status"] = novo_status
+                resultados.append({"id": edit_id, "ok": True, "ip": edit["ip"]})
+
+        processados = sum(1 for r in resultados if r["ok"])
+        logger.info(f"Lote: {processados} edições marcadas como {novo_status}, {len(resultados) - processados} ignoradas")
+        return jsonify({"mensagem": f"{processados} edições processadas", "resultados": resultados}), 200
+
+    @app.route("/approve-edits", methods=["POST"])
+    @limiter.limit("20 per minute")
+    def aprovar_edicoes_lote():
+        try:
+            return _processar_lote_edicoes("aprovado")
+        except Exception as e:
+            logger.error(f"Erro ao aprovar lote de edições: {str(e)}")
+            return jsonify({"erro": "Falha ao aprovar edições"}), 500
+
+    @app.route("/reject-edits", methods=["POST"])
+    @limiter.limit("20 per minute")
+    def rejeitar_edicoes_lote():
+        try:
+            return _processar_lote_edicoes("rejeitado")
+        except Exception as e:
+            logger.error(f"Erro ao rejeitar lote de edições: {str(e)}")
+            return jsonify({"erro": "Falha ao rejeitar edições"}), 500
+
     @app.route("/", methods=["GET"])
     def index():
         return render_template("realtime.html")
@@ -199,7 +343,7 @@ def register_routes(app, data_manager, limiter):
     @app.route("/status", methods=["GET"])
     @limiter.limit("100 per minute")
     def obter_status():
-        return get_data()
+        return jsonify(data_manager.get_data())
 
     @app.route("/adicionar-host", methods=["POST"])
     @limiter.limit("20 per minute")
@@ -220,32 +364,169 @@ def register_routes(app, data_manager, limiter):
             if not novo_host["ip"] or not novo_host["nome"]:
                 return jsonify({"erro": "Campos 'ip' e 'nome' obrigatórios"}), 400
 
-            dados = data_manager.get_data()
-            hosts_dict = {host["ip"]: host for host in dados["hosts"]}
-            if novo_host["ip"] in hosts_dict:
-                return jsonify({"erro": "Host já existe"}), 400
-
-            dados["hosts"] = dados["hosts"] + [novo_host]
-            data_manager.update_data(dados)
+            with data_manager.transaction() as txn:
+                if txn.get_host(novo_host["ip"]) is not None:
+                    return jsonify({"erro": "Host já existe"}), 400
+                txn.add_host(novo_host)
             logger.info(f"Host {novo_host['ip']} adicionado com sucesso")
             return jsonify({"mensagem": "Host adicionado!", "host": novo_host}), 201
         except Exception as e:
             logger.error(f"Erro ao adicionar host: {str(e)}")
             return jsonify({"erro": "Falha ao adicionar host"}), 500
 
+    @app.route("/hosts", methods=["GET"])
+    @limiter.limit("300 per minute")
+    def listar_hosts():
+        """
+        Consulta de hosts com filtros, ordenação, paginação por cursor e projeção de campos.
+
+        Parâmetros: bbox=minLng,minLat,maxLng,maxLat, zoom, status, tipo, uf, site, port_status
+        (listas separadas por vírgula), prefix, rtt_min, rtt_max, sort (nome|ip|tempo_resposta),
+        order (asc|desc), cursor, limit (máx. MAX_LIMITE_HOSTS), fields.
+        """
+        args = request.args
+        try:
+            bbox = parse_bbox(args["bbox"]) if args.get("bbox") else None
+            limit = args.get("limit", 1000, type=int)
+            if not 1 <= limit <= MAX_LIMITE_HOSTS:
+                raise ValueError(f"limit deve estar entre 1 e {MAX_LIMITE_HOSTS}")
+            resultado = data_manager.query_hosts(
+                bbox=bbox,
+                zoom=args.get("zoom", type=float),
+                fields=_parse_lista(args.get("fields")),
+                sort=args.get("sort", "nome"),
+                desc=args.get("order", "asc").lower() == "desc",
+                cursor=args.get("cursor"),
+                limit=limit,
+                status=_parse_lista(args.get("status"), STATUS_ALIASES),
+                tipo=_parse_lista(args.get("tipo")),
+                uf=_parse_lista(args.get("uf", "").upper()),
+                site=_parse_lista(args.get("site", "").upper()),
+                port_status=_parse_lista(args.get("port_status")),
+                prefix=args.get("prefix"),
+                rtt_min=args.get("rtt_min", type=float),
+                rtt_max=args.get("rtt_max", type=float),
+            )
+        except ValueError as e:
+            return jsonify({"erro": f"Parâmetros inválidos: {str(e)}"}), 400
+
+        logger.debug("/hosts retornou %d de %d hosts", len(resultado['hosts']), resultado['total'])
+        return jsonify(resultado), 200
+
+    @app.route("/search", methods=["GET"])
+    @limiter.limit("600 per minute")
+    def buscar_hosts():
+        """Busca por nome, ip, local e observação: ?q=texto&limit=20"""
+        consulta = request.args.get("q", "").strip()
+        limit = max(1, min(request.args.get("limit", 20, type=int), 200))
+        if not consulta:
+            return jsonify({"resultados": []}), 200
+        start_time = time.time()
+        resultados = data_manager.search_hosts(consulta, limit)
+        logger.debug("/search '%s': %d resultados em %.4fs", consulta, len(resultados), time.time() - start_time)
+        return jsonify({"resultados": resultados}), 200
+
+    def _filtros_portas():
+        return {
+            "status": _parse_lista(request.args.get("status"), PORT_STATUS_ALIASES),
+            "spare": _parse_lista(request.args.get("spare"), SIM_NAO_ALIASES),
+            "duplex": _parse_lista(request.args.get("duplex")),
+            "speed": _parse_lista(request.args.get("speed")),
+            "vlan": _parse_lista(request.args.get("vlan")),
+            "site": _parse_lista(request.args.get("site")),
+            "uf": _parse_lista(request.args.get("uf")),
+            "ip": _parse_lista(request.args.get("ip")),
+        }
+
+    @app.route("/ports", methods=["GET"])
+    @limiter.limit("300 per minute")
+    def consultar_portas():
+        """
+        Portas da frota inteira. Filtros (valores separados por vírgula):
+        status (ok, down, admin_down), spare (yes/no), duplex, speed, vlan, site, uf, ip.
+        Paginação: offset, limit. Ex.: /ports?status=admin_down ou /ports?vlan=11&site=IMP
+        """
+        limite = max(1, min(request.args.get("limit", 1000, type=int), MAX_LIMITE_HOSTS))
+        offset = max(0, request.args.get("offset", 0, type=int))
+        start_time = time.time()
+        resultado = data_manager.query_ports(offset=offset, limit=limite, **_filtros_portas())
+        logger.debug("/ports: %d portas em %.4fs", resultado['total'], time.time() - start_time)
+        return jsonify(resultado), 200
+
+    @app.route("/ports/summary", methods=["GET"])
+    @limiter.limit("300 per minute")
+    def resumir_portas():
+        """Contagem de portas por site, uf ou host: ?group=site&spare=yes (portas livres por site)"""
+        grupo = request.args.get("group", "site")
+        if grupo not in PORT_GROUPS:
+            return jsonify({"erro": f"group deve ser um de: {', '.join(PORT_GROUPS)}"}), 400
+        grupos = data_manager.summarize_ports(group=grupo, **_filtros_portas())
+        return jsonify({"grupos": grupos, "total": sum(grupos.values())}), 200
+
+    @app.route("/port-events", methods=["GET"])
+    @limiter.limit("300 per minute")
+    def listar_eventos_portas():
+        """
+        Mudanças de porta entre coletas do Entuity, em ordem. Filtros: since (último seq já
+        visto), ip, tipo (added, removed, changed), campo (ex.: Status, VLANs), limit.
+        """
+        desde = max(0, request.args.get("since", 0, type=int))
+        limite = max(1, min(request.args.get("limit", 1000, type=int), MAX_LIMITE_HOSTS))
+        # Lido antes da consulta: um evento gravado durante ela tem seq maior e vem na próxima
+        ultimo_seq = data_manager.port_events.last_seq
+        eventos = data_manager.port_changes(
+            since=desde,
+            ips=_parse_lista(request.args.get("ip")),
+            tipos=_parse_lista(request.args.get("tipo")),
+            campos=_parse_lista(request.args.get("campo")),
+            limit=limite,
+        )
+        if eventos:
+            ultimo_seq = eventos[-1]["seq"]
+        return jsonify({"eventos": eventos, "ultimo_seq": ultimo_seq}), 200
+
+    @app.route("/alerts", methods=["GET"])
+    @limiter.limit("300 per minute")
+    def listar_alertas():
+        """Alertas de telemetria ativos: ?severidade=critical,warning"""
+        severidades = _parse_lista(request.args.get("severidade"))
+        alertas = data_manager.active_alerts()
+        if severidades:
+            alertas = [a for a in alertas if a["severidade"] in severidades]
+        return jsonify({"alertas": alertas, "total": len(alertas)}), 200
+
+    @app.route("/clusters", methods=["GET"])
+    @limiter.limit("300 per minute")
+    def listar_clusters():
+        """Clusters pré-calculados dos tiles não vazios que cobrem a área: ?bbox=minLng,minLat,maxLng,maxLat&zoom="""
+        try:
+            bbox = parse_bbox(request.args.get("bbox", ""))
+            zoom = request.args.get("zoom", type=int)
+            if zoom is None:
+                raise ValueError("zoom é obrigatório")
+            tiles = data_manager.query_clusters(bbox, zoom)
+        except ValueError as e:
+            return jsonify({"erro": f"Parâmetros inválidos: {str(e)}"}), 400
+        return jsonify({"zoom": zoom, "tiles": tiles}), 200
+
+    @app.route("/clusters/<int:z>/<int:x>/<int:y>", methods=["GET"])
+    @limiter.limit("1000 per minute")
+    def obter_tile_clusters(z, x, y):
+        try:
+            clusters = data_manager.get_cluster_tile(z, x, y)
+        except ValueError as e:
+            return jsonify({"erro": str(e)}), 400
+        return jsonify({"tile": f"{z}/{x}/{y}", "clusters": clusters}), 200
+
     @app.route("/get-user-info", methods=["GET"])
     @limiter.limit("100 per minute")
     def get_user_info():
-        try:
-            hostname_cliente = socket.gethostbyaddr(request.remote_addr)[0] if request.remote_addr else "Desconhecido"
-        except socket.herror:
-            hostname_cliente = "Desconhecido"
-            logger.debug(f"Não foi possível resolver hostname para {request.remote_addr}")
+        hostname_cliente = identificar_cliente(request.remote_addr)
 
         hostnames_dict = load_hostnames()
         user_type = hostnames_dict.get(hostname_cliente, "guest")
 
-        logger.info(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - ℹ️ Informações consultadas por {hostname_cliente} ({user_type})")
+        logger.info("ℹ️ Informações consultadas", extra={"cliente": hostname_cliente, "user_type": user_type})
         return jsonify({
             "hostname": hostname_cliente,
             "user_type": user_type
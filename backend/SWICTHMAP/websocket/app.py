@@ -1,5 +1,6 @@
 import eventlet
 eventlet.monkey_patch()
+import eventlet.wsgi
 
 import urllib3
 from flask import Flask
@@ -10,25 +11,27 @@ from flask_socketio import SocketIO
 from flask_compress import Compress
 import threading
 import socket
+import time
 import os
 import sys
 import logging
-from data_manager import DataManager
-from ping_service import init_ping_service  # Usando init_ping_service conforme corrigido
+import argparse
+import subprocess
+from data_manager import DataManager, ReplicaDataManager
+from ping_service import init_ping_service, OnDemandPinger, RemotePingRequester  # Usando init_ping_service conforme corrigido
 from api_routes import register_routes
-from websocket import register_websocket
-from utils import atualizar_valores_dos_hosts  # Mantido, mas removido obter_hostnames_confiaveis
+from websocket import register_websocket, register_bus_forwarding
+from message_bus import create_bus, InProcessBus, DEFAULT_BUS_URL
+from trusted_hostnames import TrustedHostnameProvider
+from entuity_ingest import EntuityIngestor
+from log_setup import configure_logging
+from metrics import register_metrics
+from profiling import register_profiling
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("ping_logs.log", encoding="utf-8"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Escrita de log em thread separada, com rotação/compressão e limite para mensagens por IP
+configure_logging("ping_logs.log", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -45,6 +48,8 @@ limiter = Limiter(
 )
 
 CAMINHO_DADOS_JSON = os.path.join(os.getcwd(), "dados.json")
+PORTA = 5000
+PORTA_METRICAS_DONO = 5010  # /metrics do processo dono no modo multi-worker (varredura, lock, disco)
 
 ascii_art = """
  ____          _ _       _     __  __             
@@ -55,31 +60,152 @@ ascii_art = """
                                            |_|    
 Desenvolvido por Pedro Lucas Sousa Moura
 """
-print(ascii_art)
 
-data_manager = DataManager(CAMINHO_DADOS_JSON, socketio)
 
-if __name__ == "__main__":
+def parse_args():
+    parser = argparse.ArgumentParser(description="Servidor SwitchMap")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SWITCHMAP_WORKERS", "1")),
+                        help="Número de processos socket.io/HTTP atrás da mesma porta")
+    parser.add_argument("--bus", default=os.environ.get("SWITCHMAP_BUS", DEFAULT_BUS_URL),
+                        help="URL do barramento (inproc://, unix:///x.sock, tcp://h:p, redis://h:p/db)")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-id", type=int, default=0, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def obter_ip_local():
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         s.connect(("8.8.8.8", 80))
         local_ip = s.getsockname()[0]
         s.close()
-        logger.info(f"Servidor iniciando em {local_ip}:5000")
+        return local_ip
     except Exception as e:
         logger.error(f"Erro ao determinar IP local: {str(e)}")
-        local_ip = "0.0.0.0"
+        return "0.0.0.0"
 
-    # ALTERAÇÃO: Removido carregamento de hostnames via API
-    # Carregar dados iniciais e atualizar valores dos hosts (se necessário)
-    logger.info("Inicializando dados e atualizando valores dos hosts")
-    atualizar_valores_dos_hosts(data_manager)
-    
-    register_routes(app, data_manager, limiter)
-    register_websocket(socketio, data_manager)
-    
-    logger.info("Iniciando serviço de ping em thread separada")
-    ping_thread = threading.Thread(target=init_ping_service, args=(data_manager, socketio), daemon=True)
-    ping_thread.start()
+
+def apos_escutar(porta, *acoes):
+    """
+    Roda cada ação numa thread própria assim que o servidor aceitar conexões na porta.
+
+    A ingestão de resultados.json e a varredura de ping gravam no DataManager e por isso
+    carregam as seções adiadas do snapshot (valores e portas); esperando o servidor subir,
+    a partida não paga essa carga antes de atender.
+    """
+    def esperar():
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", porta), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.2)
+        for acao in acoes:
+            threading.Thread(target=acao, daemon=True).start()
+    threading.Thread(target=esperar, daemon=True).start()
+
+
+def run_single():
+    """Modo original: um processo faz ping, guarda o estado e atende todos os clientes."""
+    data_manager = DataManager(CAMINHO_DADOS_JSON, socketio, bus=InProcessBus())
+
+    # Aplica resultados.json a cada nova coleta do Entuity; a primeira passada espera o servidor
+    logger.info("Iniciando ingestão contínua de resultados.json")
+    ingestor = EntuityIngestor(data_manager).start(ingerir_agora=False)
+
+    # Renovação em segundo plano; o DataManager recarrega a lista quando o cache remoto muda
+    trusted_provider = TrustedHostnameProvider(cache_path=data_manager.trusted_hostnames_cache_path).start()
+
+    # Faixa rápida de ping sob demanda, com event loop próprio
+    pinger = OnDemandPinger(data_manager).start()
+
+    register_routes(app, data_manager, limiter, trusted_provider, pinger)
+    register_websocket(socketio, data_manager, pinger)
+    register_metrics(app, socketio, limiter)
+    register_profiling(app, data_manager, limiter)
     
-    socketio.run(app, host="0.0.0.0", port=5000, use_reloader=False)
\ No newline at end of file
+    logger.info("Serviço de ping e primeira ingestão iniciam quando o servidor estiver escutando")
+    apos_escutar(PORTA, ingestor.ingest, lambda: init_ping_service(data_manager, socketio, pinger))
+
+    socketio.run(app, host="0.0.0.0", port=PORTA, use_reloader=False)
+
+
+def run_owner(args):
+    """
+    Processo dono do estado: DataManager, ping e hub do barramento. Não atende clientes;
+    inicia N workers que dividem a porta via SO_REUSEPORT e recebem as mudanças pelo barramento.
+    """
+    bus = create_bus(args.bus, serve=True)
+    data_manager = DataManager(CAMINHO_DADOS_JSON, None, bus=bus)
+
+    # Aqui a ingestão não espera: o dono não atende clientes e a sincronização do primeiro
+    # worker já pede o estado completo, o que carrega as seções adiadas do snapshot de qualquer
+    # forma; no dono a carga adiada só encurta o tempo até o barramento responder
+    logger.info("Iniciando ingestão contínua de resultados.json")
+    EntuityIngestor(data_manager).start()
+
+    trusted_provider = TrustedHostnameProvider(cache_path=data_manager.trusted_hostnames_cache_path).start()
+    bus.subscribe("refresh_trusted_hostnames", lambda _: trusted_provider.refresh_async())
+
+    # O dono não atende clientes; suas métricas e o perfilamento ficam numa porta própria
+    app_metricas = Flask("switchmap_dono")
+    register_metrics(app_metricas)
+    register_profiling(app_metricas, data_manager)
+    eventlet.spawn(eventlet.wsgi.server, eventlet.listen(("0.0.0.0", PORTA_METRICAS_DONO)), app_metricas,
+                   log_output=False)
+
+    workers = []
+    for i in range(args.workers):
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--worker-id", str(i + 1), "--bus", args.bus]
+        workers.append(subprocess.Popen(cmd))
+        logger.info(f"Worker {i + 1}/{args.workers} iniciado (pid {workers[-1].pid})")
+
+    try:
+        init_ping_service(data_manager, None, OnDemandPinger(data_manager).start())
+    finally:
+        for worker in workers:
+            worker.terminate()
+        bus.close()
+
+
+def run_worker(args):
+    """Worker socket.io/HTTP: réplica do estado alimentada pelo barramento."""
+    # Cada processo rotaciona o próprio arquivo de log
+    configure_logging(f"ping_logs.worker{args.worker_id}.log", level=logging.INFO)
+    bus = create_bus(args.bus)
+    data_manager = ReplicaDataManager(socketio, bus)
+
+    # Pedidos de ping sob demanda vão ao dono pelo barramento
+    pinger = RemotePingRequester(bus)
+
+    register_routes(app, data_manager, limiter, pinger=pinger)
+    register_websocket(socketio, data_manager, pinger)
+    register_bus_forwarding(socketio, bus)
+    register_metrics(app, socketio, limiter)
+    register_profiling(app, data_manager, limiter)
+
+    # Vários processos escutando na mesma porta; o kernel distribui as conexões.
+    # Clientes devem usar o transporte websocket (sem long-polling), pois não há sessão fixa.
+    listener = eventlet.listen(("0.0.0.0", PORTA), reuse_port=True)
+    logger.info(f"Worker {os.getpid()} atendendo na porta {PORTA}")
+    eventlet.wsgi.server(listener, app, log_output=False)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.worker:
+        run_worker(args)
+        sys.exit(0)
+
+    print(ascii_art)
+    logger.info(f"Servidor iniciando em {obter_ip_local()}:{PORTA}")
+
+    if args.workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        logger.warning("SO_REUSEPORT indisponível nesta plataforma; usando um único processo")
+        args.workers = 1
+
+    if args.workers > 1:
+        run_owner(args)
+    else:
+        run_single()
@@ -0,0 +1,297 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+from copy import deepcopy
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_MAX_SEGMENTO = 8 * 1024 * 1024
+EVENTO_ESTADO = "estado"              # linha que só atualiza o estado (não aparece no histórico)
+EVENTO_LIMPEZA = "history_cleared"    # histórico visível recomeça após esta linha
+
+_SEGMENTO_RE = re.compile(r"\.(\d{6})\.jsonl$")
+
+
+class ApprovalLog:
+    """
+    Solicitações de edição e histórico de aprovações num log JSONL só de acréscimo.
+
+    Cada ação (submissão, aprovação, rejeição) acrescenta uma linha com o registro completo
+    da solicitação, no mesmo formato de alteracoes.json; o estado atual de uma solicitação é
+    a última linha com o seu id. Na partida o log é relido uma vez para montar os índices em
+    memória (estado por id, ids por status e por IP, posições do histórico), então cada ação
+    custa um append e as consultas não leem nem reescrevem o arquivo inteiro.
+
+    O log é dividido em segmentos <base>.000001.jsonl, <base>.000002.jsonl... e um novo
+    segmento é aberto quando o atual passa de `max_bytes`.
+    """
+
+    def __init__(self, base_path, max_bytes=TAMANHO_MAX_SEGMENTO):
+        self.base_path = base_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._arquivo = None
+        self._segmentos = []          # caminhos, em ordem
+        self._requests = {}           # id -> registro atual
+        self._ids_por_status = {}     # status -> {id: None}
+        self._ids_por_ip = {}         # ip -> {id: None}
+        self._historico = []          # (segmento, offset, id, status, ip) de cada linha visível
+        self._carregar()
+
+    # --- segmentos ---
+
+    def _caminho_segmento(self, numero):
+        return f"{self.base_path}.{numero:06d}.jsonl"
+
+    def _listar_segmentos(self):
+        segmentos = []
+        for caminho in glob.glob(glob.escape(self.base_path) + ".*.jsonl"):
+            m = _SEGMENTO_RE.search(caminho)
+            if m:
+                segmentos.append((int(m.group(1)), caminho))
+        return [caminho for _, caminho in sorted(segmentos)]
+
+    def _abrir_para_escrita(self):
+        if not self._segmentos:
+            self._segmentos.append(self._caminho_segmento(1))
+        self._reparar_final(self._segmentos[-1])
+        self._arquivo = open(self._segmentos[-1], "ab")
+
+    @staticmethod
+    def _reparar_final(caminho):
+        """
+        Garante que o segmento termina em "\n". Uma escrita interrompida (queda no meio do
+        append) deixa uma linha parcial, e o próximo registro ficaria colado nela e seria perdido
+        na releitura: a linha parcial é descartada, ou só recebe o "\n" se for um JSON completo.
+        """
+        if not os.path.exists(caminho):
+            return
+        with open(caminho, "r+b") as arquivo:
+            fim = arquivo.seek(0, os.SEEK_END)
+            inicio = fim
+            while inicio > 0:
+                bloco_inicio = max(0, inicio - 65536)
+                arquivo.seek(bloco_inicio)
+                bloco = arquivo.read(inicio - bloco_inicio)
+                quebra = bloco.rfind(b"\n")
+                if quebra >= 0:
+                    inicio = bloco_inicio + quebra + 1
+                    break
+                inicio = bloco_inicio
+            if inicio == fim:
+                return
+            arquivo.seek(inicio)
+            parcial = arquivo.read()
+            try:
+                json.loads(parcial)
+            except ValueError:
+                arquivo.truncate(inicio)
+                logger.warning(f"Linha parcial de {len(parcial)} bytes descartada do fim de {caminho}")
+                return
+            arquivo.write(b"\n")
+
+    def _rotacionar_se_necessario(self):
+        if self._arquivo.tell() < self.max_bytes:
+            return
+        self._arquivo.close()
+        numero = int(_SEGMENTO_RE.search(self._segmentos[-1]).group(1)) + 1
+        self._segmentos.append(self._caminho_segmento(numero))
+        self._arquivo = open(self._segmentos[-1], "ab")
+        logger.info(f"Novo segmento do log de aprovações: {self._segmentos[-1]}")
+
+    # --- carga e índices ---
+
+    def _carregar(self):
+        self._segmentos = self._listar_segmentos()
+        linhas = 0
+        for indice, caminho in enumerate(self._segmentos):
+            with open(caminho, "rb") as arquivo:
+                offset = 0
+                for linha in arquivo:
+                    inicio, offset = offset, offset + len(linha)
+                    if not linha.strip():
+                        continue
+                    try:
+                        registro = json.loads(linha)
+                    except json.JSONDecodeError:
+                        # Linha truncada (ex.: queda durante a escrita): ignorada
+                        logger.error(f"Linha inválida em {caminho} (offset {inicio}), ignorada")
+                        continue
+                    self._indexar(registro, indice, inicio)
+                    linhas += 1
+        self._abrir_para_escrita()
+        logger.info(f"Log de aprovações carregado: {linhas} linhas em {len(self._segmentos)} segmentos, "
+                    f"{len(self._requests)} solicitações")
+
+    def _indexar(self, registro, segmento, offset):
+        evento = registro.get("_evento")
+        if evento == EVENTO_LIMPEZA:
+            self._historico = []
+            return
+        if evento == EVENTO_ESTADO:
+            registro = registro.get("request") or {}
+        request_id = registro.get("id")
+        if request_id is None:
+            return
+        anterior = self._requests.get(request_id)
+        if anterior is not None:
+            if anterior.get("status") != registro.get("status"):
+                self._ids_por_status[anterior.get("status")].pop(request_id, None)
+            if _ip(anterior) != _ip(registro):
+                self._ids_por_ip[_ip(anterior)].pop(request_id, None)
+        self._requests[request_id] = registro
+        self._ids_por_status.setdefault(registro.get("status"), {}).setdefault(request_id)
+        self._ids_por_ip.setdefault(_ip(registro), {}).setdefault(request_id)
+        if evento is None:
+            self._historico.append((segmento, offset, request_id, registro.get("status"), _ip(registro)))
+
+    def _escrever(self, linhas):
+        """Acrescenta e indexa as linhas (chamar com o lock adquirido)."""
+        for linha in linhas:
+            dados = (json.dumps(linha, ensure_ascii=False) + "\n").encode("utf-8")
+            offset = self._arquivo.tell()
+            self._arquivo.write(dados)
+            self._indexar(linha, len(self._segmentos) - 1, offset)
+        self._arquivo.flush()
+        self._rotacionar_se_necessario()
+
+    # --- escrita ---
+
+    def append(self, request_data):
+        self.append_many([request_data])
+
+    def append_many(self, requests):
+        """
+        Grava novas solicitações e as registra no histórico. Lança ValueError (sem gravar
+        nada) se algum id já existe ou se repete no lote: o estado é indexado por id, então
+        gravar por cima faria a solicitação anterior sumir.
+        """
+        with self._lock:
+            vistos = set()
+            for r in requests:
+                request_id = r.get("id")
+                if request_id is None or request_id in self._requests or request_id in vistos:
+                    raise ValueError(f"Solicitação {request_id} já existe")
+                vistos.add(request_id)
+            self._escrever([deepcopy(r) for r in requests])
+
+    def update(self, request_data):
+        self.update_many([request_data])
+
+    def update_many(self, requests):
+        """Grava o novo estado de solicitações existentes (aprovação, rejeição) no histórico."""
+        with self._lock:
+            for r in requests:
+                if r.get("id") not in self._requests:
+                    raise KeyError(f"Solicitação {r.get('id')} não encontrada")
+            self._escrever([deepcopy(r) for r in requests])
+
+    def clear_history(self):
+        """Esvazia o histórico visível; o estado das solicitações é preservado."""
+        with self._lock:
+            self._escrever([{"_evento": EVENTO_LIMPEZA}])
+
+    def import_legacy(self, caminho_historico, caminho_aprovacoes):
+        """
+        Importa alteracoes.json e aprovacoes_pendentes.json (formato antigo, listas JSON) se o
+        log ainda estiver vazio. Solicitações que só existem no arquivo de aprovações entram
+        como linhas de estado, sem aparecer no histórico.
+        """
+        with self._lock:
+            if self._requests or any(os.path.getsize(s) for s in self._segmentos if os.path.exists(s)):
+                return 0
+            historico = [r for r in _ler_lista(caminho_historico) if isinstance(r, dict)]
+            self._escrever(historico)
+            estado = [{"_evento": EVENTO_ESTADO, "request": r} for r in _ler_lista(caminho_aprovacoes)
+                      if isinstance(r, dict) and self._requests.get(r.get("id")) != r]
+            self._escrever(estado)
+        if historico or estado:
+            logger.info(f"Importados {len(historico)} registros de histórico e {len(estado)} de estado "
+                        f"para o log de aprovações")
+        return len(historico) + len(estado)
+
+    # --- leitura ---
+
+    def get(self, request_id):
+        """Cópia do estado atual da solicitação, ou None."""
+        with self._lock:
+            registro = self._requests.get(request_id)
+            return deepcopy(registro) if registro is not None else None
+
+    def get_many(self, ids):
+        with self._lock:
+            return {i: deepcopy(self._requests[i]) for i in ids if i in self._requests}
+
+    def requests(self, status=None, ip=None, offset=0, limit=None):
+        """Solicitações no estado atual, filtradas por status e IP. Returns: (página, total)"""
+        with self._lock:
+            ids = self._ids_por_status.get(status, {}) if status is not None else self._requests
+            if ip is not None:
+                ids = [i for i in self._ids_por_ip.get(ip, {}) if i in ids]
+            ids = list(ids)
+            fim = None if limit is None else offset + limit
+            return [deepcopy(self._requests[i]) for i in ids[offset:fim]], len(ids)
+
+    def history(self, status=None, ip=None, request_id=None, offset=0, limit=100, desc=False):
+        """
+        Entradas do histórico (uma por ação), lidas do disco só para a página pedida
+        (limit=None: todas a partir de offset).
+
+        Returns:
+            (página, total)
+        """
+        with self._lock:
+            posicoes = self._historico
+            if status is not None or ip is not None or request_id is not None:
+                posicoes = [p for p in posicoes
+                            if (status is None or p[3] == status) and (ip is None or p[4] == ip)
+                            and (request_id is None or p[2] == request_id)]
+            total = len(posicoes)
+            if desc:
+                posicoes = posicoes[::-1]
+            pagina = posicoes[offset:] if limit is None else posicoes[offset:offset + limit]
+            segmentos = self._segmentos
+            self._arquivo.flush()
+            return self._ler_posicoes(segmentos, pagina), total
+
+    @staticmethod
+    def _ler_posicoes(segmentos, posicoes):
+        resultado = []
+        abertos = {}
+        try:
+            for segmento, offset, *_ in posicoes:
+                arquivo = abertos.get(segmento)
+                if arquivo is None:
+                    arquivo = abertos[segmento] = open(segmentos[segmento], "rb")
+                arquivo.seek(offset)
+                resultado.append(json.loads(arquivo.readline()))
+        finally:
+            for arquivo in abertos.values():
+                arquivo.close()
+        return resultado
+
+    def close(self):
+        with self._lock:
+            if self._arquivo is not None:
+                self._arquivo.close()
+                self._arquivo = None
+
+
+def _ip(registro):
+    changes = registro.get("changes")
+    return changes.get("ip") if isinstance(changes, dict) else None
+
+
+def _ler_lista(caminho):
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            conteudo = f.read().strip()
+        return json.loads(conteudo) if conteudo else []
+    except FileNotFoundError:
+        return []
+    except json.JSONDecodeError as e:
+        logger.error(f"Erro ao decodificar {caminho}, ignorado na importação: {str(e)}")
+        return []
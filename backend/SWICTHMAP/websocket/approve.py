@@ -6,80 +6,64 @@ from flask_cors import CORS
 from flask_socketio import SocketIO
 import logging
 import os
-import json
+import uuid
 from datetime import datetime
 from data_manager import DataManager
+from approval_log import ApprovalLog
+from log_setup import configure_logging
+from metrics import register_metrics
 import re
 
 # Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("approve_logs.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging("approve_logs.log", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Inicialização do aplicativo Flask
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
+register_metrics(app, socketio)
 
 # Caminhos para os arquivos de dados
 CAMINHO_DADOS_JSON = os.path.join(os.getcwd(), "dados.json")
 CAMINHO_APROVACOES = os.path.join(os.getcwd(), "aprovacoes_pendentes.json")
 CAMINHO_HISTORICO = os.path.join(os.getcwd(), "alteracoes.json")
+CAMINHO_LOG_APROVACOES = os.path.join(os.getcwd(), "aprovacoes")  # segmentos aprovacoes.NNNNNN.jsonl
+
+MAX_ITENS_LOTE = 1000
+LIMITE_PADRAO_PAGINA = 500
 
 # Instância do DataManager
 data_manager = DataManager(CAMINHO_DADOS_JSON, socketio)
 
+def novo_id_edicao():
+    """ID de solicitação de edição; aleatório para não colidir entre pedidos no mesmo segundo."""
+    return f"edit_{uuid.uuid4().hex}"
+
 # Função para validar IP
 def is_valid_ip(ip):
     pattern = r'^(?:[0-9]{1,3}\.){3}[0-9]{1,3}$'
     return re.match(pattern, ip) is not None
 
-# Função para salvar no histórico
-def save_to_history(request_data):
-    try:
-        history = []
-        if os.path.exists(CAMINHO_HISTORICO):
-            with open(CAMINHO_HISTORICO, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if content:
-                    history = json.loads(content)
-                else:
-                    logger.warning("Arquivo alteracoes.json está vazio, inicializando com lista vazia")
-        history.append(request_data)
-        with open(CAMINHO_HISTORICO, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=4)
-    except json.JSONDecodeError as e:
-        logger.error(f"Erro ao decodificar alteracoes.json, inicializando com nova entrada: {str(e)}")
-        history = [request_data]
-        with open(CAMINHO_HISTORICO, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        logger.error(f"Erro ao salvar no histórico: {str(e)}")
-
-# Classe para gerenciar as aprovações
-class EditManager:
-    def __init__(self, approvals_path):
-        self.approvals_path = approvals_path
-
-    def load_approvals(self):
-        try:
-            with open(self.approvals_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return []
-
-    def save_approvals(self, approvals):
-        with open(self.approvals_path, 'w', encoding='utf-8') as f:
-            json.dump(approvals, f, ensure_ascii=False, indent=4)
-
-# Instância do EditManager
-edit_manager = EditManager(CAMINHO_APROVACOES)
+# Log de solicitações e histórico (append-only); na primeira execução importa os arquivos antigos
+approval_log = ApprovalLog(CAMINHO_LOG_APROVACOES)
+approval_log.import_legacy(CAMINHO_HISTORICO, CAMINHO_APROVACOES)
+
+# Paginação comum a /pending-edits e /history: offset, limit (máx. MAX_ITENS_LOTE). Sem nenhum
+# dos dois a resposta continua sendo a lista completa, como antes da paginação (limit None)
+def parametros_paginacao():
+    if 'offset' not in request.args and 'limit' not in request.args:
+        return 0, None
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = max(1, min(request.args.get('limit', LIMITE_PADRAO_PAGINA, type=int), MAX_ITENS_LOTE))
+    return offset, limit
+
+# Resposta paginada: a lista continua sendo o corpo (compatível com os clientes atuais),
+# com o total de itens no cabeçalho X-Total-Count
+def resposta_paginada(itens, total):
+    resposta = jsonify(itens)
+    resposta.headers['X-Total-Count'] = str(total)
+    return resposta, 200
 
 # Rota para submeter edição
 @app.route('/submit-edit', methods=['POST'])
@@ -95,18 +79,14 @@ def submit_edit():
             return jsonify({'error': 'IP inválido'}), 400
 
         approval_request = {
-            'id': f"edit_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            'id': novo_id_edicao(),
             'timestamp': datetime.now().isoformat(),
             'changes': edit_data['changes'],
             'status': 'pending',
             'submitted_by': edit_data.get('user', 'anonymous')
         }
 
-        approvals = edit_manager.load_approvals()
-        approvals.append(approval_request)
-        edit_manager.save_approvals(approvals)
-
-        save_to_history(approval_request)
+        approval_log.append(approval_request)
 
         socketio.emit('new_edit_request', approval_request)
         logger.info(f"Nova solicitação de edição recebida: {approval_request['id']}")
@@ -131,7 +111,7 @@ def editar_host():
             return jsonify({'error': 'IP inválido'}), 400
 
         approval_request = {
-            'id': f"edit_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            'id': novo_id_edicao(),
             'timestamp': datetime.now().isoformat(),
             'changes': {
                 'ip': ip,
@@ -145,11 +125,7 @@ def editar_host():
             'submitted_by': 'anonymous'
         }
 
-        approvals = edit_manager.load_approvals()
-        approvals.append(approval_request)
-        edit_manager.save_approvals(approvals)
-
-        save_to_history(approval_request)
+        approval_log.append(approval_request)
 
         socketio.emit('new_edit_request', approval_request)
         logger.info(f"Nova solicitação de edição recebida em /editar-host: {approval_request['id']}")
@@ -159,13 +135,14 @@ def editar_host():
         logger.error(f"Erro ao processar edição em /editar-host: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# Rota para listar edições pendentes
+# Rota para listar edições pendentes: ?ip=&offset=&limit=
 @app.route('/pending-edits', methods=['GET'])
 def get_pending_edits():
     try:
-        approvals = edit_manager.load_approvals()
-        pending = [req for req in approvals if req['status'] == 'pending']
-        return jsonify(pending), 200
+        offset, limit = parametros_paginacao()
+        pending, total = approval_log.requests(status='pending', ip=request.args.get('ip') or None,
+                                               offset=offset, limit=limit)
+        return resposta_paginada(pending, total)
     except Exception as e:
         logger.error(f"Erro ao listar edições pendentes: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -174,14 +151,15 @@ def get_pending_edits():
 @app.route('/approve-edit/<id>', methods=['POST'])
 def approve_edit_by_id(id):
     try:
-        approvals = edit_manager.load_approvals()
-        target_request = next((req for req in approvals if req['id'] == id), None)
+        target_request = approval_log.get(id)
         
         if not target_request:
             return jsonify({'error': 'Solicitação não encontrada'}), 404
 
         if target_request['status'] != 'pending':
             return jsonify({'error': 'Solicitação já processada'}), 400
+        if not _ip_da_solicitacao(target_request):
+            return jsonify({'error': 'Solicitação sem IP, não pode ser aplicada'}), 400
 
         target_request['status'] = 'approve'
         target_request['processed_at'] = datetime.now().isoformat()
@@ -206,9 +184,7 @@ def approve_edit_by_id(id):
             current_data['hosts'].append(new_host)
 
         data_manager.update_data(current_data)
-        edit_manager.save_approvals(approvals)
-
-        save_to_history(target_request)
+        approval_log.update(target_request)
 
         socketio.emit('edit_status_update', target_request)
         socketio.emit('host_updated', {'ip': target_ip})
@@ -223,8 +199,7 @@ def approve_edit_by_id(id):
 @app.route('/reject-edit/<id>', methods=['DELETE'])
 def reject_edit_by_id(id):
     try:
-        approvals = edit_manager.load_approvals()
-        target_request = next((req for req in approvals if req['id'] == id), None)
+        target_request = approval_log.get(id)
         
         if not target_request:
             return jsonify({'error': 'Solicitação não encontrada'}), 404
@@ -236,9 +211,7 @@ def reject_edit_by_id(id):
         target_request['processed_at'] = datetime.now().isoformat()
         target_request['processed_by'] = 'anonymous'
 
-        edit_manager.save_approvals(approvals)
-
-        save_to_history(target_request)
+        approval_log.update(target_request)
 
         socketio.emit('edit_status_update', target_request)
         logger.info(f"Edição rejeitada: {id}")
@@ -248,24 +221,144 @@ def reject_edit_by_id(id):
         logger.error(f"Erro ao rejeitar edição: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# Rota para consultar o histórico
+# Rota para editar vários hosts de uma vez
+@app.route('/editar-hosts', methods=['PUT'])
+def editar_hosts_lote():
+    try:
+        corpo = request.get_json(silent=True) or {}
+        edits = corpo.get('edits')
+        if not isinstance(edits, list) or not edits:
+            return jsonify({'error': 'O campo "edits" deve ser uma lista não vazia'}), 400
+        if len(edits) > MAX_ITENS_LOTE:
+            return jsonify({'error': f'Máximo de {MAX_ITENS_LOTE} itens por lote'}), 400
+
+        novos = []
+        resultados = []
+        for edit_data in edits:
+            ip = edit_data.get('ip') if isinstance(edit_data, dict) else None
+            if not ip or not is_valid_ip(ip):
+                resultados.append({'ip': ip, 'ok': False, 'error': 'IP inválido ou ausente'})
+                continue
+            approval_request = {
+                'id': novo_id_edicao(),
+                'timestamp': datetime.now().isoformat(),
+                'changes': {
+                    'ip': ip,
+                    'nome': edit_data.get('nome', ''),
+                    'local': edit_data.get('local', ''),
+                    'observacao': edit_data.get('observacao', ''),
+                    'tipo': edit_data.get('tipo', 'sw'),
+                    'ativo': edit_data.get('ativo', '#00d700')
+                },
+                'status': 'pending',
+                'submitted_by': corpo.get('user', 'anonymous')
+            }
+            novos.append(approval_request)
+            resultados.append({'ip': ip, 'ok': True, 'request_id': approval_request['id']})
+
+        if novos:
+            approval_log.append_many(novos)
+            socketio.emit('new_edit_requests', novos)
+
+        logger.info(f"Lote de edição recebido: {len(novos)} solicitações, {len(resultados) - len(novos)} inválidas")
+        return jsonify({'message': f'{len(novos)} solicitações submetidas', 'results': resultados}), 200
+
+    except Exception as e:
+        logger.error(f"Erro ao processar lote em /editar-hosts: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _ip_da_solicitacao(solicitacao):
+    changes = solicitacao.get('changes')
+    return changes.get('ip') if isinstance(changes, dict) else None
+
+def processar_lote(ids, novo_status):
+    """
+    Aprova ou rejeita vários pedidos: valida todos, aplica os aprovados aos hosts numa
+    única transação do DataManager, acrescenta os novos estados ao log de uma vez e emite um evento.
+    """
+    por_id = approval_log.get_many([i for i in ids if isinstance(i, str)])
+    agora = datetime.now().isoformat()
+    processados = []
+    resultados = []
+
+    with data_manager.transaction() as txn:
+        for request_id in ids:
+            target_request = por_id.get(request_id) if isinstance(request_id, str) else None
+            if not target_request:
+                resultados.append({'id': request_id, 'ok': False, 'error': 'Solicitação não encontrada'})
+                continue
+            if target_request.get('status') != 'pending':
+                resultados.append({'id': request_id, 'ok': False, 'error': 'Solicitação já processada'})
+                continue
+            changes = target_request.get('changes')
+            if novo_status == 'approve' and not (isinstance(changes, dict) and changes.get('ip')):
+                resultados.append({'id': request_id, 'ok': False, 'error': 'Solicitação sem IP, não pode ser aplicada'})
+                continue
+
+            target_request['status'] = novo_status
+            target_request['processed_at'] = agora
+            target_request['processed_by'] = 'anonymous'
+
+            if novo_status == 'approve':
+                changes = {k: v for k, v in changes.items() if k != 'ativo' and v is not None}
+                host = txn.edit_host(changes['ip'])
+                if host is not None:
+                    host.update(changes)
+                else:
+                    txn.add_host(changes)
+
+            processados.append(target_request)
+            resultados.append({'id': request_id, 'ok': True, 'ip': _ip_da_solicitacao(target_request)})
+
+    if processados:
+        approval_log.update_many(processados)
+        socketio.emit('edit_status_batch', processados)
+        if novo_status == 'approve':
+            socketio.emit('hosts_updated', {'ips': [req['changes']['ip'] for req in processados]})
+    return processados, resultados
+
+# Rota para aprovar várias edições: {"ids": [...]}
+@app.route('/approve-edits', methods=['POST'])
+def approve_edits_batch():
+    try:
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        if not isinstance(ids, list) or not ids or len(ids) > MAX_ITENS_LOTE:
+            return jsonify({'error': f'O campo "ids" deve ser uma lista com 1 a {MAX_ITENS_LOTE} itens'}), 400
+        processados, resultados = processar_lote(ids, 'approve')
+        logger.info(f"Lote aprovado: {len(processados)} de {len(ids)} solicitações")
+        return jsonify({'message': f'{len(processados)} edições aprovadas', 'results': resultados}), 200
+    except Exception as e:
+        logger.error(f"Erro ao aprovar lote: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Rota para rejeitar várias edições: {"ids": [...]}
+@app.route('/reject-edits', methods=['POST'])
+def reject_edits_batch():
+    try:
+        ids = (request.get_json(silent=True) or {}).get('ids')
+        if not isinstance(ids, list) or not ids or len(ids) > MAX_ITENS_LOTE:
+            return jsonify({'error': f'O campo "ids" deve ser uma lista com 1 a {MAX_ITENS_LOTE} itens'}), 400
+        processados, resultados = processar_lote(ids, 'reject')
+        logger.info(f"Lote rejeitado: {len(processados)} de {len(ids)} solicitações")
+        return jsonify({'message': f'{len(processados)} edições rejeitadas', 'results': resultados}), 200
+    except Exception as e:
+        logger.error(f"Erro ao rejeitar lote: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Rota para consultar o histórico: ?status=&ip=&id=&order=asc|desc&offset=&limit=
 @app.route('/history', methods=['GET'])
 def get_history():
     try:
-        history = []
-        if os.path.exists(CAMINHO_HISTORICO):
-            with open(CAMINHO_HISTORICO, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if content:
-                    history = json.loads(content)
-                else:
-                    logger.warning("Arquivo alteracoes.json está vazio")
-        else:
-            logger.info("Arquivo alteracoes.json não existe")
-        return jsonify(history), 200
-    except json.JSONDecodeError as e:
-        logger.error(f"Erro ao decodificar alteracoes.json: {str(e)}")
-        return jsonify(history), 200
+        offset, limit = parametros_paginacao()
+        history, total = approval_log.history(
+            status=request.args.get('status') or None,
+            ip=request.args.get('ip') or None,
+            request_id=request.args.get('id') or None,
+            offset=offset,
+            limit=limit,
+            desc=request.args.get('order', 'asc').lower() == 'desc',
+        )
+        return resposta_paginada(history, total)
     except Exception as e:
         logger.error(f"Erro ao consultar histórico: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -274,10 +367,9 @@ def get_history():
 @app.route('/clear-history', methods=['GET'])
 def clear_history():
     try:
-        # Redefinir alteracoes.json para uma lista vazia
-        with open(CAMINHO_HISTORICO, 'w', encoding='utf-8') as f:
-            json.dump([], f, ensure_ascii=False, indent=4)
-        logger.info("Histórico em alteracoes.json foi limpo com sucesso via GET")
+        # O log só recebe um marcador: o histórico visível recomeça e as solicitações pendentes continuam
+        approval_log.clear_history()
+        logger.info("Histórico de aprovações foi limpo com sucesso via GET")
         socketio.emit('history_cleared', {'message': 'Histórico limpo'})
         return jsonify({'message': 'Histórico limpo com sucesso'}), 200
     except Exception as e:
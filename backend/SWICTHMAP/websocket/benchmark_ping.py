@@ -0,0 +1,207 @@
+"""
+Benchmark do ping_service com o backend ICMP simulado (FakeProber), sem rede.
+
+Executa varreduras iguais às de init_ping_service (executar_varredura) sobre frotas sintéticas
+de 1k/10k/50k alvos e registra, por tamanho, a mediana de: duração da varredura, pings/s,
+tempo de CPU, pico de memória e tempo de espera/posse do RWLock do DataManager.
+O resultado vai para um arquivo JSON; com --baseline, o benchmark falha (código 1) se
+alguma métrica piorar além da tolerância.
+
+    py benchmark_ping.py
+    py benchmark_ping.py --tamanhos 1000,10000 --repeticoes 5 --saida atual.json
+    py benchmark_ping.py --baseline benchmark_ping.json --tolerancia 0.2
+"""
+if __name__ == "__main__":
+    # Mesmo runtime do app.py: a varredura é medida sob o monkey_patch do eventlet
+    import eventlet
+    eventlet.monkey_patch()
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from eventlet.patcher import is_monkey_patched
+
+from data_manager import DataManager
+from metrics import PROBES_SENT, LOCK_WAIT_SECONDS, LOCK_HOLD_SECONDS
+from ping_service import executar_varredura, set_prober
+from probers import FakeProber
+
+logger = logging.getLogger(__name__)
+
+VERSAO_FORMATO = 1
+TAMANHOS_PADRAO = (1000, 10000, 50000)
+# Métricas comparadas com o baseline (todas: menor é melhor)
+METRICAS_REGRESSAO = ("duracao_s", "cpu_s", "lock_espera_s", "lock_posse_s", "pico_memoria_mb")
+
+
+def ip_sintetico(indice):
+    return f"10.{(indice >> 16) & 255}.{(indice >> 8) & 255}.{indice & 255}"
+
+
+def frota_sintetica(alvos, fracao_conexoes=0.0):
+    """
+    Documento no formato de dados.json com `alvos` IPs a pingar; uma fração dos hosts leva uma
+    conexão (que também é pingada), de modo que hosts + conexões = alvos.
+    """
+    n_conexoes = int(alvos * fracao_conexoes / (1 + fracao_conexoes))
+    n_hosts = alvos - n_conexoes
+    hosts = []
+    for i in range(n_hosts):
+        host = {"ip": ip_sintetico(i), "nome": f"SW-BENCH-{i:05d}", "ativo": "red", "tempo_resposta": -1,
+                "tipo": "sw", "local": "", "conexoes": []}
+        if i < n_conexoes:
+            host["conexoes"].append({"ip": ip_sintetico(n_hosts + i), "ativo": "red", "tempo_resposta": -1})
+        hosts.append(host)
+    return {"hosts": hosts, "pending_edits": [], "priority_ips": {}, "trusted_hostnames": []}
+
+
+def _locks():
+    return {modo: (LOCK_WAIT_SECONDS.total(modo)[0], LOCK_HOLD_SECONDS.total(modo)[0])
+            for modo in ("reader", "writer")}
+
+
+def medir_varredura(data_manager, max_workers, chunk_size, memoria=False):
+    """Uma varredura com as medidas do benchmark."""
+    locks_antes = _locks()
+    pings_antes = PROBES_SENT.total()
+    if memoria:
+        tracemalloc.start()
+    cpu_antes = time.process_time()
+    inicio = time.perf_counter()
+    varredura = executar_varredura(data_manager, max_workers, chunk_size)
+    duracao = time.perf_counter() - inicio
+    cpu = time.process_time() - cpu_antes
+    pico = None
+    if memoria:
+        pico = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    locks = _locks()
+    pings = PROBES_SENT.total() - pings_antes
+    return {
+        "duracao_s": round(duracao, 4),
+        "cpu_s": round(cpu, 4),
+        "pings": pings,
+        "pings_por_s": round(pings / duracao, 1) if duracao else None,
+        "online": varredura["online"],
+        "lock_espera_s": round(sum(locks[m][0] - locks_antes[m][0] for m in locks), 4),
+        "lock_posse_s": round(sum(locks[m][1] - locks_antes[m][1] for m in locks), 4),
+        "lock_posse_escrita_s": round(locks["writer"][1] - locks_antes["writer"][1], 4),
+        "pico_memoria_mb": round(pico, 2) if pico is not None else None,
+    }
+
+
+def executar_tamanho(alvos, args, diretorio):
+    # Um diretório por frota; as threads de disco do DataManager continuam vivas até o fim do processo
+    diretorio = os.path.join(diretorio, str(alvos))
+    os.makedirs(diretorio)
+    caminho = os.path.join(diretorio, "dados.json")
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(frota_sintetica(alvos, args.conexoes), arquivo)
+    data_manager = DataManager(caminho, None)
+    set_prober(FakeProber(seed=args.seed, rtt=args.rtt, rtt_ms=(args.rtt_media, args.rtt_desvio),
+                          perda=args.perda, mortos=args.mortos, oscilantes=args.oscilantes,
+                          escala_tempo=args.escala_tempo))
+    varreduras = [medir_varredura(data_manager, args.workers, args.chunk) for _ in range(args.repeticoes)]
+    # Pico de memória numa varredura à parte: o tracemalloc distorceria os tempos acima
+    memoria = medir_varredura(data_manager, args.workers, args.chunk, memoria=True)
+    mediana = {campo: round(statistics.median(v[campo] for v in varreduras), 4)
+               for campo in varreduras[0] if campo != "pico_memoria_mb"}
+    mediana["pico_memoria_mb"] = memoria["pico_memoria_mb"]
+    logger.warning(f"{alvos} alvos: {mediana['duracao_s']}s, {mediana['pings_por_s']} pings/s, "
+                   f"CPU {mediana['cpu_s']}s, lock {mediana['lock_posse_s']}s, "
+                   f"pico {mediana['pico_memoria_mb']} MB")
+    return {"alvos": alvos, "mediana": mediana, "varreduras": varreduras}
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def comparar(resultado, baseline, tolerancia):
+    """Lista de regressões (métrica pior que baseline * (1 + tolerancia)) por tamanho."""
+    base_por_tamanho = {r["alvos"]: r["mediana"] for r in baseline.get("resultados", [])}
+    regressoes = []
+    for r in resultado["resultados"]:
+        base = base_por_tamanho.get(r["alvos"])
+        if base is None:
+            continue
+        for campo in METRICAS_REGRESSAO:
+            atual, anterior = r["mediana"].get(campo), base.get(campo)
+            # Valores muito pequenos (ex.: espera de lock ~0) só oscilam; ignorados
+            if atual is None or anterior is None or max(atual, anterior) < 0.01:
+                continue
+            if atual > anterior * (1 + tolerancia):
+                regressoes.append({"alvos": r["alvos"], "metrica": campo, "baseline": anterior, "atual": atual})
+    return regressoes
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark do ping_service com ICMP simulado")
+    parser.add_argument("--tamanhos", default=",".join(map(str, TAMANHOS_PADRAO)),
+                        help="Número de alvos de cada frota, separados por vírgula")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4, help="Threads da varredura (max_workers)")
+    parser.add_argument("--chunk", type=int, default=50, help="Hosts por chunk (chunk_size)")
+    parser.add_argument("--conexoes", type=float, default=0.0, help="Conexões por host (fração), também pingadas")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rtt", default="lognormal", choices=("lognormal", "normal", "uniforme", "fixo"))
+    parser.add_argument("--rtt-media", type=float, default=5.0, help="ms")
+    parser.add_argument("--rtt-desvio", type=float, default=3.0, help="ms")
+    parser.add_argument("--perda", type=float, default=0.02, help="Probabilidade de perda por pacote")
+    parser.add_argument("--mortos", type=float, default=0.1, help="Fração de hosts que nunca respondem")
+    parser.add_argument("--oscilantes", type=float, default=0.03, help="Fração de hosts que alternam vivo/morto")
+    parser.add_argument("--escala-tempo", type=float, default=0.001,
+                        help="Multiplica RTTs, timeouts e intervalos simulados (1 = tempo real)")
+    parser.add_argument("--saida", default="benchmark_ping.json")
+    parser.add_argument("--baseline", help="Resultado anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora aceita em relação ao baseline (0.2 = 20%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    tamanhos = [int(t) for t in args.tamanhos.split(",") if t.strip()]
+    resultado = {
+        "versao": VERSAO_FORMATO,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _commit_atual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "eventlet": is_monkey_patched("thread"),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("saida", "baseline")},
+    }
+    diretorio = tempfile.mkdtemp(prefix="bench_ping_")
+    try:
+        resultado["resultados"] = [executar_tamanho(alvos, args, diretorio) for alvos in tamanhos]
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as arquivo:
+            resultado["regressoes"] = comparar(resultado, json.load(arquivo), args.tolerancia)
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    logger.warning(f"Resultado gravado em {args.saida}")
+    for regressao in resultado.get("regressoes", []):
+        logger.error(f"Regressão com {regressao['alvos']} alvos: {regressao['metrica']} "
+                     f"{regressao['baseline']} -> {regressao['atual']}")
+    return 1 if resultado.get("regressoes") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from metrics import DNS_SECONDS
+
+logger = logging.getLogger(__name__)
+
+HOSTNAME_DESCONHECIDO = "Desconhecido"
+
+
+class ClientIdentityResolver:
+    """
+    Resolve o hostname do cliente (DNS reverso) com cache TTL + LRU.
+
+    - Acertos no cache não tocam o DNS; entradas próximas de expirar são renovadas em
+      segundo plano, de modo que clientes frequentes nunca esperam pelo servidor DNS.
+    - Falhas (herror/gaierror) são guardadas como cache negativo por negative_ttl.
+    - Uma consulta nova espera no máximo `timeout` segundos; se o DNS estiver lento o
+      cliente é tratado como desconhecido e a consulta continua em segundo plano,
+      preenchendo o cache para a próxima requisição.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=60, max_entries=4096, timeout=1.0,
+                 refresh_ahead=0.8, max_workers=4):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.refresh_ahead = refresh_ahead
+        self._cache = OrderedDict()  # ip -> (hostname, expira_em, ttl)
+        self._lock = threading.Lock()
+        self._pending = {}  # ip -> Future em andamento (evita consultas duplicadas)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rdns")
+
+    def resolve(self, ip):
+        """Retorna o hostname do IP ou HOSTNAME_DESCONHECIDO."""
+        if not ip:
+            return HOSTNAME_DESCONHECIDO
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(ip)
+            if entry is not None:
+                hostname, expires_at, ttl = entry
+                if now < expires_at:
+                    self._cache.move_to_end(ip)
+                    if expires_at - now < ttl * (1 - self.refresh_ahead):
+                        self._submit(ip)
+                    return hostname
+            future = self._submit(ip)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            logger.debug(f"DNS reverso para {ip} excedeu {self.timeout}s; tratando como desconhecido")
+            return HOSTNAME_DESCONHECIDO
+
+    def _submit(self, ip):
+        """Agenda uma consulta (chamado com self._lock adquirido)."""
+        future = self._pending.get(ip)
+        if future is None:
+            future = self._executor.submit(self._lookup, ip)
+            self._pending[ip] = future
+        return future
+
+    def _lookup(self, ip):
+        inicio = time.perf_counter()
+        try:
+            hostname = socket.gethostbyaddr(ip)[0]
+            ttl = self.ttl
+            DNS_SECONDS.observe(time.perf_counter() - inicio, "ok")
+        except (socket.herror, socket.gaierror, OSError):
+            DNS_SECONDS.observe(time.perf_counter() - inicio, "falha")
+            logger.debug(f"Não foi possível resolver hostname para {ip}")
+            hostname = HOSTNAME_DESCONHECIDO
+            ttl = self.negative_ttl
+        with self._lock:
+            self._cache[ip] = (hostname, time.monotonic() + ttl, ttl)
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            self._pending.pop(ip, None)
+        return hostname
+
+    def invalidate(self, ip=None):
+        with self._lock:
+            if ip is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(ip, None)
+
+
+def mesclar_hostnames(*listas):
+    """União das listas de hostnames (local e remota), na ordem, sem repetições."""
+    return list(dict.fromkeys(h for lista in listas if isinstance(lista, list) for h in lista))
+
+
+class TrustedHostnames:
+    """Conjunto de hostnames confiáveis com pertinência O(1) e sem distinção de maiúsculas."""
+
+    def __init__(self, hostnames=()):
+        self._source = None
+        self._set = frozenset()
+        self.update(hostnames)
+
+    def update(self, hostnames):
+        """Reconstrói o conjunto apenas se a lista de origem mudou."""
+        source = tuple(hostnames or ())
+        if source != self._source:
+            self._set = frozenset(h.lower() for h in source if isinstance(h, str))
+            self._source = source
+
+    def __contains__(self, hostname):
+        return bool(hostname) and hostname.lower() in self._set
+
+    def __len__(self):
+        return len(self._set)
+
+    def __iter__(self):
+        return iter(self._source)
+
+
+# Instância compartilhada pelos serviços do mesmo processo
+resolver = ClientIdentityResolver()
+
+
+def identificar_cliente(remote_addr):
+    """Hostname do cliente da requisição, via cache compartilhado."""
+    return resolver.resolve(remote_addr)
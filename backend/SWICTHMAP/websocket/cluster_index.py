@@ -0,0 +1,205 @@
+import logging
+import math
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+STATUS_ONLINE = "#00d700"
+STATUS_OFFLINE = "red"
+MAX_LAT = 85.05112878
+MAX_TILES_CONSULTA = 1024  # tiles por consulta de área (uma tela grande cobre ~150)
+
+
+def status_severity(status):
+    """Ordem de gravidade usada para o pior status de um cluster."""
+    if status == STATUS_OFFLINE:
+        return 2
+    if status == STATUS_ONLINE:
+        return 0
+    return 1
+
+
+def project(lat, lng):
+    """Projeção Web Mercator normalizada para [0, 1) nos dois eixos."""
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    x = (lng + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+
+def tiles_for_bbox(bbox, zoom, max_tiles=MAX_TILES_CONSULTA):
+    """
+    Tiles (x, y) do zoom que cobrem o retângulo (min_lng, min_lat, max_lng, max_lat).
+
+    Raises:
+        ValueError: se o retângulo cobre mais de max_tiles tiles (contados antes de listá-los)
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    n = 2 ** zoom
+    x0, y0 = project(max_lat, min_lng)
+    x1, y1 = project(min_lat, max_lng)
+    tx0, tx1 = int(x0 * n), int(x1 * n)
+    ty0, ty1 = int(y0 * n), int(y1 * n)
+    faixas_x = [(tx0, tx1)] if tx0 <= tx1 else [(tx0, n - 1), (0, tx1)]
+    total = sum(fim - inicio + 1 for inicio, fim in faixas_x) * (ty1 - ty0 + 1)
+    if max_tiles is not None and total > max_tiles:
+        raise ValueError(f"a área cobre {total} tiles no zoom {zoom} (máximo {max_tiles}); reduza a área ou o zoom")
+    return [(tx, ty) for inicio, fim in faixas_x for tx in range(inicio, fim + 1) for ty in range(ty0, ty1 + 1)]
+
+
+class _Cluster:
+    __slots__ = ("members", "status_counts", "rtt_sum", "rtt_count", "min_rtt", "lat_sum", "lng_sum")
+
+    def __init__(self):
+        self.members = {}  # ip -> (status, rtt, lat, lng)
+        self.status_counts = Counter()
+        self.rtt_sum = 0
+        self.rtt_count = 0
+        self.min_rtt = None
+        self.lat_sum = 0.0
+        self.lng_sum = 0.0
+
+    def add(self, ip, status, rtt, lat, lng):
+        self.members[ip] = (status, rtt, lat, lng)
+        self.status_counts[status] += 1
+        self.lat_sum += lat
+        self.lng_sum += lng
+        if rtt >= 0:
+            self.rtt_sum += rtt
+            self.rtt_count += 1
+            if self.min_rtt is None or rtt < self.min_rtt:
+                self.min_rtt = rtt
+
+    def remove(self, ip):
+        status, rtt, lat, lng = self.members.pop(ip)
+        self.status_counts[status] -= 1
+        if not self.status_counts[status]:
+            del self.status_counts[status]
+        self.lat_sum -= lat
+        self.lng_sum -= lng
+        if rtt >= 0:
+            self.rtt_sum -= rtt
+            self.rtt_count -= 1
+            if rtt == self.min_rtt:
+                # Só recalcula o mínimo quando o membro removido era o mínimo
+                rtts = [m[1] for m in self.members.values() if m[1] >= 0]
+                self.min_rtt = min(rtts) if rtts else None
+
+    def to_dict(self, cluster_id):
+        count = len(self.members)
+        worst = max(self.status_counts, key=status_severity) if self.status_counts else None
+        item = {
+            "id": cluster_id,
+            "lat": self.lat_sum / count,
+            "lng": self.lng_sum / count,
+            "count": count,
+            "status_counts": dict(self.status_counts),
+            "worst_status": worst,
+            "min_rtt": self.min_rtt,
+            "avg_rtt": round(self.rtt_sum / self.rtt_count, 1) if self.rtt_count else None,
+        }
+        if count == 1:
+            item["ip"] = next(iter(self.members))
+        return item
+
+
+class ClusterPyramid:
+    """
+    Pirâmide de clusters por nível de zoom, mantida incrementalmente.
+
+    Em cada zoom o mundo é dividido em tiles de 256px e cada tile em grid x grid células;
+    os hosts de uma célula formam um cluster. Uma mudança de status/RTT atualiza apenas os
+    contadores dos (max_zoom - min_zoom + 1) clusters do host, sem reconstruir a pirâmide,
+    e marca os tiles afetados para envio aos clientes inscritos.
+    """
+
+    def __init__(self, spatial_index, min_zoom=0, max_zoom=12, grid=8):
+        self.spatial_index = spatial_index
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.grid = grid
+        self._clusters = {z: {} for z in range(min_zoom, max_zoom + 1)}  # z -> (cx, cy) -> _Cluster
+        self._tiles = {z: {} for z in range(min_zoom, max_zoom + 1)}     # z -> (tx, ty) -> set((cx, cy))
+        self._members = {}  # ip -> (status, rtt, lat, lng)
+        self._dirty = set()  # (z, tx, ty)
+
+    def _cells(self, lat, lng):
+        x, y = project(lat, lng)
+        for z in range(self.min_zoom, self.max_zoom + 1):
+            n = (2 ** z) * self.grid
+            yield z, (int(x * n), int(y * n))
+
+    def upsert(self, ip, host):
+        ponto = self.spatial_index.point(ip)
+        if ponto is None:
+            self.remove(ip)
+            return
+        rtt = host.get("tempo_resposta", -1)
+        if not isinstance(rtt, (int, float)):
+            rtt = -1
+        novo = (host.get("ativo"), rtt, ponto[0], ponto[1])
+        atual = self._members.get(ip)
+        if atual == novo:
+            return
+        if atual is not None and atual[2:] == novo[2:]:
+            # Mesma posição: só ajusta os contadores dos clusters existentes
+            for z, cell in self._cells(*ponto):
+                cluster = self._clusters[z][cell]
+                cluster.remove(ip)
+                cluster.add(ip, *novo)
+                self._mark(z, cell)
+            self._members[ip] = novo
+            return
+        self.remove(ip)
+        for z, cell in self._cells(*ponto):
+            cluster = self._clusters[z].get(cell)
+            if cluster is None:
+                cluster = self._clusters[z][cell] = _Cluster()
+                self._tiles[z].setdefault(self._tile_of(cell), set()).add(cell)
+            cluster.add(ip, *novo)
+            self._mark(z, cell)
+        self._members[ip] = novo
+
+    def remove(self, ip):
+        atual = self._members.pop(ip, None)
+        if atual is None:
+            return
+        for z, cell in self._cells(atual[2], atual[3]):
+            cluster = self._clusters[z][cell]
+            cluster.remove(ip)
+            if not cluster.members:
+                del self._clusters[z][cell]
+                tile = self._tile_of(cell)
+                cells = self._tiles[z][tile]
+                cells.discard(cell)
+                if not cells:
+                    del self._tiles[z][tile]
+            self._mark(z, cell)
+
+    def _tile_of(self, cell):
+        return cell[0] // self.grid, cell[1] // self.grid
+
+    def _mark(self, z, cell):
+        self._dirty.add((z,) + self._tile_of(cell))
+
+    def _check_zoom(self, z):
+        if z not in self._clusters:
+            raise ValueError(f"zoom fora da pirâmide ({self.min_zoom}-{self.max_zoom})")
+
+    def tile(self, z, tx, ty):
+        """Clusters do tile (z, tx, ty) como dicionários prontos para JSON."""
+        self._check_zoom(z)
+        clusters = self._clusters[z]
+        return [clusters[cell].to_dict(f"{z}/{cell[0]}/{cell[1]}") for cell in self._tiles[z].get((tx, ty), ())]
+
+    def query(self, bbox, z, max_tiles=MAX_TILES_CONSULTA):
+        """Clusters dos tiles não vazios que cobrem o bbox no zoom z: {(tx, ty): [clusters]}"""
+        self._check_zoom(z)
+        ocupados = self._tiles[z]
+        return {tile: self.tile(z, *tile) for tile in tiles_for_bbox(bbox, z, max_tiles) if tile in ocupados}
+
+    def pop_dirty(self):
+        """Tiles alterados desde a última chamada, com o conteúdo atual: {(z, tx, ty): [clusters]}"""
+        dirty, self._dirty = self._dirty, set()
+        return {key: self.tile(*key) for key in dirty}
@@ -7,25 +7,513 @@ from datetime import datetime
 from rwlock import RWLock
 import logging
 from copy import deepcopy  # Importar deepcopy
+from contextlib import contextmanager
+from client_identity import TrustedHostnames, mesclar_hostnames
+from spatial_index import SpatialIndex
+from cluster_index import ClusterPyramid
+from host_query import HostQueryIndex, extrair_site
+from search_index import SearchIndex
+from telemetry import TelemetryTable, AlertEngine
+from port_table import PortTable
+from port_events import PortEventLog
+from export_stream import iter_json
+from metrics import MeasuredRWLock, STAGE_SECONDS
+from state_snapshot import caminho_snapshot, salvar_snapshot, abrir_snapshot, SECOES_ADIADAS
 
 logger = logging.getLogger(__name__)
 
-class DataManager:
-    def __init__(self, filepath, socketio):
+# Abaixo deste zoom as consultas por área omitem os campos pesados de cada host
+DETAIL_ZOOM = 13
+HEAVY_FIELDS = ("ports", "valores", "conexoes")
+PORT_CHANGES_ROOM = "port_changes"
+
+
+class HostIndexes:
+    """
+    Índices em memória sobre self.data["hosts"], mantidos a cada mutação.
+
+    self.data nunca é alterado no lugar (toda escrita substitui o documento), então os
+    índices podem guardar referências aos hosts e só reprocessam os hosts que mudaram.
+
+    As portas dos hosts não ficam em self.data: ao entrar no estado a lista "ports" de cada
+    host vai para self.port_table (colunar) e só é remontada na borda da API (get_data,
+    with_ports, consultas).
+    """
+
+    def _init_indexes(self):
+        self.hosts_by_ip = {}
+        self.spatial_index = SpatialIndex()
+        self.cluster_pyramid = ClusterPyramid(self.spatial_index)
+        self.port_table = PortTable()
+        self.port_events = PortEventLog(self.port_table.pool)
+        self._record_port_changes = False  # só o dono do estado gera eventos; réplicas os recebem
+        self._pending_port_events = []
+        self._secoes_pendentes = None  # SnapshotReader com valores/portas ainda não carregados
+        self.query_index = HostQueryIndex(self.port_table)
+        self.search_index = SearchIndex()
+        self.telemetry = TelemetryTable()
+        self.alert_engine = AlertEngine(self.telemetry)
+        self.indexes = [self.spatial_index, self.cluster_pyramid, self.query_index, self.search_index,
+                        self.telemetry]
+
+    def _absorb_ports(self, hosts):
+        """
+        Move a lista "ports" de cada host para a port_table (chamar com o writer_lock adquirido).
+
+        Hosts sem a chave "ports" mantêm as portas que já tinham.
+
+        Returns:
+            (hosts sem "ports", ips cujas portas mudaram)
+        """
+        sem_portas = []
+        alterados = set()
+        for host in hosts:
+            if "ports" in host and "ip" in host:
+                if self._record_port_changes:
+                    mudou, mudancas = self.port_table.set_with_diff(host["ip"], host["ports"])
+                    if mudancas:
+                        self._pending_port_events.extend(self.port_events.record(host["ip"], mudancas))
+                else:
+                    mudou = self.port_table.set(host["ip"], host["ports"])
+                if mudou:
+                    alterados.add(host["ip"])
+                host = {k: v for k, v in host.items() if k != "ports"}
+            sem_portas.append(host)
+        return sem_portas, alterados
+
+    def _take_port_events(self):
+        """Eventos de porta gerados desde a última chamada (chamar com o writer_lock adquirido)."""
+        eventos, self._pending_port_events = self._pending_port_events, []
+        return [self.port_events.to_dict(evento) for evento in eventos]
+
+    def _carregar_secoes(self):
+        """Carga adiada das seções pesadas do snapshot; só o DataManager dono parte de um snapshot."""
+
+    def port_changes(self, since=0, ips=None, tipos=None, campos=None, limit=1000):
+        return self.port_events.since(since, ips, tipos, campos, limit)
+
+    def _absorb_document(self, data):
+        if "hosts" not in data:
+            return data, set()
+        hosts, alterados = self._absorb_ports(data["hosts"])
+        return {**data, "hosts": hosts}, alterados
+
+    def _with_ports_unlocked(self, host):
+        ports = self.port_table.get(host.get("ip"))
+        return host if ports is None else {**host, "ports": ports}
+
+    def with_ports(self, host):
+        """Host no formato original, com a lista "ports" remontada."""
+        self._carregar_secoes()
+        with self.rwlock.reader_lock:
+            return self._with_ports_unlocked(host)
+
+    def _materialized_unlocked(self):
+        """Cópia profunda de self.data no formato original (com "ports")."""
+        dados = deepcopy(self.data)
+        for host in dados.get("hosts", []):
+            ports = self.port_table.get(host.get("ip"))
+            if ports is not None:
+                host["ports"] = ports
+        return dados
+
+    def get_data(self):
+        self._carregar_secoes()
+        with self.rwlock.reader_lock:
+            return self._materialized_unlocked()
+
+    def _reindex(self, portas_alteradas=()):
+        """
+        Atualiza os índices após trocar self.data (chamar com o writer_lock adquirido).
+
+        Args:
+            portas_alteradas: ips cujas portas mudaram sem mudança no host (vindos de _absorb_ports)
+
+        Returns:
+            (tiles, alertas): tiles de cluster alterados, a enviar com _emit_cluster_updates, e
+            alertas de telemetria novos/resolvidos ({"novos": [...], "resolvidos": [...]} ou None),
+            a enviar com _publish_alerts, ambos após soltar o lock
+        """
+        antigos = self.hosts_by_ip
+        novos = {host["ip"]: host for host in self.data.get("hosts", []) if "ip" in host}
+        for ip, host in novos.items():
+            anterior = antigos.get(ip)
+            if anterior is None or ip in portas_alteradas or (anterior is not host and anterior != host):
+                for index in self.indexes:
+                    index.upsert(ip, host)
+        for ip in antigos.keys() - novos.keys():
+            for index in self.indexes:
+                index.remove(ip)
+            self.port_table.remove(ip)
+        self.hosts_by_ip = novos
+        return self.cluster_pyramid.pop_dirty(), self._evaluate_alerts(antigos)
+
+    def _evaluate_alerts(self, antigos):
+        """Reavalia as regras de alerta se algum `valores` mudou."""
+        if not self.telemetry.dirty:
+            return None
+        novos, resolvidos = self.alert_engine.evaluate()
+        if not (novos or resolvidos):
+            return None
+        for alerta in novos + resolvidos:
+            host = self.hosts_by_ip.get(alerta["ip"]) or antigos.get(alerta["ip"]) or {}
+            alerta["nome"] = host.get("nome")
+        return {"novos": novos, "resolvidos": resolvidos}
+
+    def active_alerts(self):
+        self._carregar_secoes()
+        with self.rwlock.reader_lock:
+            alertas = self.alert_engine.active()
+            for alerta in alertas:
+                alerta["nome"] = self.hosts_by_ip.get(alerta["ip"], {}).get("nome")
+        return alertas
+
+    def _emit_cluster_updates(self, tiles):
+        """Envia cada tile alterado apenas para a sala dos clientes que o acompanham."""
+        if self.socketio is None:
+            return
+        for (z, x, y), clusters in tiles.items():
+            tile_id = f"{z}/{x}/{y}"
+            self.socketio.emit('clusters_updated', {"tile": tile_id, "clusters": clusters},
+                               room=f"clusters:{tile_id}", namespace='/')
+
+    def get_cluster_tile(self, z, x, y):
+        with self.rwlock.reader_lock:
+            return self.cluster_pyramid.tile(z, x, y)
+
+    def query_clusters(self, bbox, zoom):
+        """Clusters dos tiles não vazios que cobrem o bbox no zoom pedido: {"z/x/y": [clusters]}"""
+        with self.rwlock.reader_lock:
+            tiles = self.cluster_pyramid.query(bbox, zoom)
+        return {f"{zoom}/{x}/{y}": clusters for (x, y), clusters in tiles.items()}
+
+    def query_hosts(self, bbox=None, zoom=None, fields=None, sort="nome", desc=False,
+                    cursor=None, limit=1000, **filtros):
+        """
+        Consulta paginada de hosts respondida pelos índices em memória.
+
+        Args:
+            bbox: Retângulo (min_lng, min_lat, max_lng, max_lat) da área visível, opcional
+            zoom: Abaixo de DETAIL_ZOOM os campos de HEAVY_FIELDS são omitidos
+            fields: Campos a retornar (projeção); None = todos
+            sort, desc, cursor, limit: Ordenação (nome, ip, tempo_resposta) e paginação por cursor
+            **filtros: status, tipo, uf, site, port_status (conjuntos), prefix, rtt_min, rtt_max
+
+        Returns:
+            Dict com hosts (cópias rasas, com lat/lng quando houver coordenadas), total e next_cursor
+        """
+        detalhado = zoom is None or zoom >= DETAIL_ZOOM
+        if filtros.get("port_status") or (set(fields) & set(SECOES_ADIADAS) if fields else detalhado):
+            self._carregar_secoes()  # visão geral do mapa não precisa de valores nem portas
+        hosts = []
+        with self.rwlock.reader_lock:
+            restrict = self.spatial_index.query(*bbox) if bbox is not None else None
+            candidatos = self.query_index.candidates(restrict=restrict, **filtros)
+            ips, total, next_cursor = self.query_index.page(candidatos, sort, desc, cursor, limit)
+            for ip in ips:
+                host = self.hosts_by_ip[ip]
+                if fields:
+                    item = {k: host[k] for k in fields if k in host}
+                else:
+                    item = {k: v for k, v in host.items() if detalhado or k not in HEAVY_FIELDS}
+                if (fields and "ports" in fields) or (not fields and detalhado):
+                    ports = self.port_table.get(ip)
+                    if ports is not None:
+                        item["ports"] = ports
+                ponto = self.spatial_index.point(ip)
+                if ponto is not None and (not fields or "lat" in fields or "lng" in fields):
+                    item["lat"], item["lng"] = ponto
+                hosts.append(item)
+        return {"hosts": hosts, "total": total, "next_cursor": next_cursor}
+
+    def _linhas_de_portas(self, site=None, uf=None, ip=None, **filtros):
+        ips = None
+        if site or uf or ip:
+            ips = self.query_index.candidates(site=site, uf=uf, restrict=ip)
+        return self.port_table.query(ips=ips, **filtros)
+
+    def query_ports(self, offset=0, limit=1000, **filtros):
+        """
+        Portas de toda a frota que atendem aos filtros, ordenadas por host e posição.
+
+        Args:
+            **filtros: status, spare, duplex, speed, vlan (conjuntos de valores) e site, uf, ip
+                       (conjuntos, restringem os hosts)
+
+        Returns:
+            Dict com ports (cada porta no formato original + ip, nome e indice) e total
+        """
+        self._carregar_secoes()
+        with self.rwlock.reader_lock:
+            por_host = {}
+            for linha in self._linhas_de_portas(**filtros):
+                por_host.setdefault(self.port_table.ip_of(linha), set()).add(linha)
+            total = sum(len(linhas) for linhas in por_host.values())
+            resultado = []
+            pular = offset
+            for ip in sorted(por_host, key=lambda ip: (self.hosts_by_ip.get(ip, {}).get("nome") or "", ip)):
+                linhas = por_host[ip]
+                if pular >= len(linhas):
+                    pular -= len(linhas)
+                    continue
+                nome = self.hosts_by_ip.get(ip, {}).get("nome")
+                for indice, linha in enumerate(self.port_table.rows[ip]):
+                    if linha not in linhas:
+                        continue
+                    if pular:
+                        pular -= 1
+                        continue
+                    resultado.append({"ip": ip, "nome": nome, "indice": indice, **self.port_table.materialize(linha)})
+                    if len(resultado) >= limit:
+                        return {"ports": resultado, "total": total}
+        return {"ports": resultado, "total": total}
+
+    def summarize_ports(self, group="site", **filtros):
+        """Contagem de portas que atendem aos filtros, agrupada por site, uf ou host."""
+        self._carregar_secoes()
+        contagem = {}
+        with self.rwlock.reader_lock:
+            por_host = {}
+            for linha in self._linhas_de_portas(**filtros):
+                ip = self.port_table.ip_of(linha)
+                por_host[ip] = por_host.get(ip, 0) + 1
+            for ip, n in por_host.items():
+                nome = self.hosts_by_ip.get(ip, {}).get("nome")
+                if group == "host":
+                    chave = nome or ip
+                else:
+                    uf, site = extrair_site(nome)
+                    chave = (uf if group == "uf" else site) or "desconhecido"
+                contagem[chave] = contagem.get(chave, 0) + n
+        return dict(sorted(contagem.items(), key=lambda item: (-item[1], item[0])))
+
+    def search_hosts(self, consulta, limit=20):
+        """Busca ranqueada para a caixa de pesquisa do mapa (campos leves de cada host)."""
+        resultados = []
+        with self.rwlock.reader_lock:
+            for ip, score in self.search_index.search(consulta, limit):
+                host = self.hosts_by_ip[ip]
+                item = {k: host.get(k) for k in ("ip", "nome", "local", "observacao", "ativo", "tipo")}
+                ponto = self.spatial_index.point(ip)
+                if ponto is not None:
+                    item["lat"], item["lng"] = ponto
+                item["score"] = score
+                resultados.append(item)
+        return resultados
+
+
+class Transaction:
+    """
+    Alterações acumuladas dentro de DataManager.transaction().
+
+    Os hosts são copiados sob demanda (copy-on-write): só os hosts editados são copiados,
+    e o commit grava o arquivo e publica um único delta com eles. Os hosts vistos aqui não
+    têm a chave "ports"; para trocar as portas basta atribuir host["ports"] na cópia.
+    """
+
+    def __init__(self, data, hosts_by_ip, port_table=None):
+        self._data = data
+        self._hosts_by_ip = hosts_by_ip
+        self._port_table = port_table
+        self.updated = {}   # ip -> host (cópia mutável)
+        self.added = {}     # ip -> host novo
+        self.sections = {}  # seções de topo substituídas (pending_edits, priority_ips...)
+
+    def get_host(self, ip):
+        """Host atual (somente leitura) ou None."""
+        return self.updated.get(ip) or self.added.get(ip) or self._hosts_by_ip.get(ip)
+
+    def edit_host(self, ip):
+        """Cópia mutável do host, criada na primeira edição. None se o host não existe."""
+        if ip in self.updated:
+            return self.updated[ip]
+        if ip in self.added:
+            return self.added[ip]
+        host = self._hosts_by_ip.get(ip)
+        if host is None:
+            return None
+        self.updated[ip] = deepcopy(host)
+        return self.updated[ip]
+
+    def get_ports(self, ip):
+        """Portas atuais do host (lista de dicts) ou None."""
+        for hosts in (self.updated, self.added):
+            if ip in hosts and "ports" in hosts[ip]:
+                return hosts[ip]["ports"]
+        return self._port_table.get(ip) if self._port_table is not None else None
+
+    def add_host(self, host):
+        if self.get_host(host["ip"]) is not None:
+            raise ValueError(f"Host {host['ip']} já existe")
+        self.added[host["ip"]] = host
+
+    def get_section(self, key, default=None):
+        """Seção de topo atual (somente leitura)."""
+        if key in self.sections:
+            return self.sections[key]
+        return self._data.get(key, default)
+
+    def section(self, key, default=None):
+        """Cópia mutável de uma seção de topo do documento."""
+        if key not in self.sections:
+            self.sections[key] = deepcopy(self._data.get(key, default))
+        return self.sections[key]
+
+    def is_empty(self):
+        return not (self.updated or self.added or self.sections)
+
+    def absorb_ports(self, absorver):
+        """Passa os hosts alterados por absorver (HostIndexes._absorb_ports) antes do commit."""
+        alterados = set()
+        for hosts in (self.updated, self.added):
+            sem_portas, mudaram = absorver(list(hosts.values()))
+            hosts.update((host["ip"], host) for host in sem_portas)
+            alterados |= mudaram
+        return alterados
+
+    def apply_to(self, data):
+        """Novo documento com as alterações aplicadas (data não é modificado)."""
+        hosts = [self.updated.get(host.get("ip"), host) for host in data.get("hosts", [])]
+        hosts.extend(self.added.values())
+        return {**data, **self.sections, "hosts": hosts}
+
+    def delta(self):
+        return {"updated": list(self.updated.values()) + list(self.added.values()), "sections": self.sections}
+
+    def patch(self):
+        """
+        As alterações como operações a reaplicar sobre outro estado (o do dono, vindas de um
+        worker): campos alterados de cada host e chaves/itens alterados de cada seção. Escritas
+        concorrentes em outros campos, hosts ou itens não são sobrescritas.
+        """
+        hosts = []
+        for ip, host in self.updated.items():
+            original = self._hosts_by_ip.get(ip, {})
+            hosts.append({
+                "ip": ip,
+                "set": {k: v for k, v in host.items() if k == "ports" or original.get(k, _AUSENTE) != v},
+                "unset": [k for k in original if k not in host],
+            })
+        sections = {key: _patch_secao(self._data.get(key), valor) for key, valor in self.sections.items()}
+        return {"hosts": hosts, "added": list(self.added.values()), "sections": sections}
+
+
+_AUSENTE = object()
+
+
+def _itens_por_id(valor):
+    """{id: item} se valor é uma lista de dicts com "id" (ex.: pending_edits), senão None."""
+    if not isinstance(valor, list) or not all(isinstance(item, dict) and "id" in item for item in valor):
+        return None
+    return {item["id"]: item for item in valor}
+
+
+def _patch_secao(original, novo):
+    """Operações que levam a seção de original a novo (ver Transaction.patch)."""
+    if isinstance(original, dict) and isinstance(novo, dict):
+        return {"set": {k: v for k, v in novo.items() if original.get(k, _AUSENTE) != v},
+                "unset": [k for k in original if k not in novo]}
+    antigos, novos = _itens_por_id(original or []), _itens_por_id(novo)
+    if antigos is not None and novos is not None:
+        return {"upsert": [item for id_, item in novos.items() if antigos.get(id_) != item],
+                "remove": [id_ for id_ in antigos if id_ not in novos]}
+    return {"value": novo}
+
+
+def aplicar_patch(txn, patch):
+    """Reaplica numa transação um patch gerado por Transaction.patch()."""
+    for host in patch.get("added", []):
+        if txn.get_host(host["ip"]) is None:
+            txn.add_host(host)
+        else:
+            txn.edit_host(host["ip"]).update(host)
+    for alteracao in patch.get("hosts", []):
+        host = txn.edit_host(alteracao["ip"])
+        if host is None:
+            continue  # removido no dono enquanto o worker editava
+        host.update(alteracao["set"])
+        for chave in alteracao["unset"]:
+            host.pop(chave, None)
+    for key, operacoes in patch.get("sections", {}).items():
+        if "value" in operacoes:
+            txn.sections[key] = operacoes["value"]
+        elif "upsert" in operacoes:
+            secao = txn.section(key, [])
+            itens = _itens_por_id(secao)
+            if itens is None:
+                itens = {}
+            for item in operacoes["upsert"]:
+                itens[item["id"]] = item
+            removidos = set(operacoes["remove"])
+            txn.sections[key] = [item for id_, item in itens.items() if id_ not in removidos]
+        else:
+            secao = txn.section(key, {})
+            if not isinstance(secao, dict):
+                secao = txn.sections[key] = {}
+            secao.update(operacoes["set"])
+            for chave in operacoes["unset"]:
+                secao.pop(chave, None)
+
+
+def merge_delta(data, delta):
+    """Aplica um delta publicado por DataManager.transaction() a um documento (sem modificá-lo)."""
+    alterados = {host["ip"]: host for host in delta.get("updated", [])}
+    hosts = []
+    for host in data.get("hosts", []):
+        hosts.append(alterados.pop(host.get("ip"), host))
+    hosts.extend(alterados.values())
+    return {**data, **delta.get("sections", {}), "hosts": hosts}
+
+
+class DataManager(HostIndexes):
+    def __init__(self, filepath, socketio, bus=None):
         self.filepath = filepath
         self.trusted_hostnames_path = os.path.join(os.path.dirname(filepath), "trusted_hostnames.json")
-        self.rwlock = RWLock()
-        self.data = self._load_initial_data()
-        self._dirty = False
+        # Lista remota gravada pelo TrustedHostnameProvider; trusted_hostnames.json é só local
+        self.trusted_hostnames_cache_path = os.path.join(os.path.dirname(filepath), "trusted_hostnames_remotos.json")
+        self.snapshot_path = caminho_snapshot(filepath)
+        self.rwlock = MeasuredRWLock(RWLock())
+        self._confiaveis = (None, TrustedHostnames())  # (lista de origem, conjunto)
+        self._init_indexes()
         self.last_hash = self._get_file_hash()
+        self._snapshot_hash = None  # hash de dados.json a que o snapshot binário em disco corresponde
+        self.data, _ = self._absorb_document(self._load_initial_data())
+        self._reindex()  # Alertas já ativos na partida ficam como estado inicial, sem publicação
+        self._record_port_changes = True
+        self.port_events.iniciar_seq()
+        self._dirty = False
+        self.ingest_stats = None
         self.last_trusted_hash = self._get_trusted_file_hash()
         self.socketio = socketio
+        self.bus = bus
+        if bus is not None:
+            # Workers encaminham escritas como patches e pedem o estado completo ao se conectarem
+            bus.subscribe("sync_request", lambda _: self._publish('data_updated', self.get_data()))
+            bus.subscribe("apply_delta", self.apply_delta)
         threading.Thread(target=self._sync_to_disk, daemon=True).start()
         threading.Thread(target=self._monitor_file_changes, daemon=True).start()
         threading.Thread(target=self._monitor_trusted_hostnames_changes, daemon=True).start()
         threading.Thread(target=self._cleanup_priority_ips, daemon=True).start()
 
     def _load_initial_data(self):
+        """
+        Documento inicial. Se o snapshot binário corresponder a dados.json, só a seção
+        "documento" é lida agora; valores e portas ficam para _carregar_secoes().
+        """
+        leitor = abrir_snapshot(self.snapshot_path, self.last_hash)
+        if leitor is not None:
+            try:
+                data = leitor.secao("documento")
+            except Exception as e:
+                logger.warning(f"Erro ao ler o snapshot {self.snapshot_path}, lendo dados.json: {str(e)}")
+            else:
+                self._secoes_pendentes = leitor
+                self._snapshot_hash = leitor.hash_origem
+                logger.info(f"Estado inicial carregado de {self.snapshot_path} ({len(data.get('hosts', []))} hosts)")
+                return data
+        return self._load_json_data()
+
+    def _load_json_data(self):
         try:
             with open(self.filepath, "r", encoding="utf-8") as arquivo:
                 data = json.load(arquivo)
@@ -46,40 +534,187 @@ class DataManager:
             return initial_data
 
     def _load_trusted_hostnames(self):
-        try:
-            with open(self.trusted_hostnames_path, "r", encoding="utf-8") as arquivo:
-                return json.load(arquivo)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logger.warning(f"Arquivo {self.trusted_hostnames_path} não encontrado ou inválido, usando lista vazia")
-            return []
+        """Lista local (trusted_hostnames.json) mais a remota em cache, sem repetições."""
+        listas = []
+        for caminho in (self.trusted_hostnames_path, self.trusted_hostnames_cache_path):
+            try:
+                with open(caminho, "r", encoding="utf-8") as arquivo:
+                    listas.append(json.load(arquivo))
+            except (FileNotFoundError, json.JSONDecodeError):
+                logger.warning(f"Arquivo {caminho} não encontrado ou inválido, ignorando")
+        return mesclar_hostnames(*listas)
 
-    def get_data(self):
+    def _carregar_secoes(self):
+        """
+        Completa o estado lido do snapshot com as seções adiadas: os valores de cada host e as
+        portas (port_table). Chamado no primeiro acesso que precisa delas, sem lock adquirido;
+        depois da carga não faz nada. Se o snapshot não puder ser lido, dados.json é relido.
+        """
+        if self._secoes_pendentes is None:
+            return
+        with self.rwlock.writer_lock:
+            leitor = self._secoes_pendentes
+            if leitor is None:
+                return
+            inicio = time.time()
+            try:
+                valores = leitor.secao("valores")
+                ports = leitor.secao("ports")
+            except Exception as e:
+                logger.error(f"Erro ao ler valores/portas do snapshot, lendo dados.json: {str(e)}")
+                self._snapshot_hash = None
+                self.data, alterados = self._absorb_document(self._load_json_data())
+            else:
+                hosts = [{**host, "valores": valores[host["ip"]]} if host.get("ip") in valores else host
+                         for host in self.data.get("hosts", [])]
+                self.data = {**self.data, "hosts": hosts}
+                alterados = {ip for ip, lista in ports.items() if self.port_table.set(ip, lista)}
+            # Como na partida: tiles e alertas que surgem da carga são estado inicial, sem publicação
+            self._reindex(alterados)
+            self.cluster_pyramid.pop_dirty()
+            self._secoes_pendentes = None
+        logger.info(f"Valores e portas carregados do snapshot em {time.time() - inicio:.3f}s")
+
+    def snapshot(self):
+        """
+        Referência somente leitura ao documento atual, sem cópia e sem as portas dos hosts
+        (use with_ports(host) para remontá-las).
+
+        Toda escrita substitui self.data por um novo objeto, então o snapshot continua
+        consistente mesmo que o estado mude durante o uso. Não deve ser modificado.
+        """
+        self._carregar_secoes()
+        with self.rwlock.reader_lock:
+            return self.data
+
+    def get_trusted_hostnames(self):
+        """
+        Conjunto de hostnames confiáveis para autorização, sem copiar o documento inteiro.
+
+        Toda escrita que muda a lista troca o objeto, então o conjunto é refeito uma vez por
+        recarga (e não a cada requisição) e publicado com uma única atribuição, sem alterar o
+        conjunto que outras requisições estão consultando.
+        """
         with self.rwlock.reader_lock:
-            return deepcopy(self.data)  # Usar deepcopy para evitar referências
+            lista = self.data.get("trusted_hostnames", [])
+        origem, confiaveis = self._confiaveis
+        if lista is not origem:
+            confiaveis = TrustedHostnames(lista)
+            self._confiaveis = (lista, confiaveis)
+        return confiaveis
 
     def update_data(self, new_data):
+        self._carregar_secoes()
         with self.rwlock.writer_lock:
-            if "hosts" in new_data:
-                hosts = new_data["hosts"]
-                unique_hosts = {host["ip"]: host for host in hosts if "ip" in host}.values()
-                new_data["hosts"] = list(unique_hosts)
-                if len(new_data["hosts"]) < len(hosts):
-                    logger.warning(f"Removidas {len(hosts) - len(new_data['hosts'])} entradas duplicadas em update_data")
-            
-            if new_data != self.data:
-                logger.debug("Dados mudaram, atualizando arquivo")
-                self.data = deepcopy(new_data)  # Garantir que self.data seja uma nova cópia
-                self._dirty = True
-                self._sync_to_disk_immediate()
-            else:
-                logger.debug("Dados não mudaram, nenhuma gravação necessária")
-        self.socketio.emit('data_updated', new_data, namespace='/')
+            tiles, alertas, eventos_portas = self._update_data_unlocked(new_data)
+        self._publish('data_updated', new_data)
+        self._emit_cluster_updates(tiles)
+        self._publish_alerts(alertas)
+        self._publish_port_events(eventos_portas)
+
+    def update_with(self, alterar):
+        """
+        Como update_data, mas o documento novo é alterar(documento atual), chamado com o lock de
+        escrita: nada gravado entre a leitura e a escrita é descartado (ex.: patches de workers
+        durante a varredura de ping). alterar recebe o documento interno, sem "ports", e deve
+        devolver um novo documento em vez de modificá-lo.
+        """
+        self._carregar_secoes()
+        with self.rwlock.writer_lock:
+            tiles, alertas, eventos_portas = self._update_data_unlocked(alterar(self.data))
+        self._publish('data_updated', self.get_data())
+        self._emit_cluster_updates(tiles)
+        self._publish_alerts(alertas)
+        self._publish_port_events(eventos_portas)
+
+    def _update_data_unlocked(self, new_data):
+        """Troca o documento (chamar com o writer_lock adquirido); retorna (tiles, alertas, eventos de portas)."""
+        tiles, alertas = {}, None
+        if "hosts" in new_data:
+            hosts = new_data["hosts"]
+            unique_hosts = {host["ip"]: host for host in hosts if "ip" in host}.values()
+            new_data["hosts"] = list(unique_hosts)
+            if len(new_data["hosts"]) < len(hosts):
+                logger.warning(f"Removidas {len(hosts) - len(new_data['hosts'])} entradas duplicadas em update_data")
+
+        sem_portas, portas_alteradas = self._absorb_document(new_data)
+        if portas_alteradas or sem_portas != self.data:
+            logger.debug("Dados mudaram, atualizando arquivo")
+            self.data = deepcopy(sem_portas)  # Garantir que self.data seja uma nova cópia
+            tiles, alertas = self._reindex(portas_alteradas)
+            self._dirty = True
+            self._sync_to_disk_immediate()
+        else:
+            logger.debug("Dados não mudaram, nenhuma gravação necessária")
+        return tiles, alertas, self._take_port_events()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Agrupa várias alterações numa única escrita: o lock de escrita é mantido durante o
+        bloco, o arquivo é gravado uma vez e um único evento hosts_delta é publicado.
+        Se o bloco lançar exceção nada é aplicado.
+        """
+        self._carregar_secoes()
+        with self.rwlock.writer_lock:
+            txn = Transaction(self.data, self.hosts_by_ip, self.port_table)
+            yield txn
+            if txn.is_empty():
+                return
+            portas_alteradas = txn.absorb_ports(self._absorb_ports)
+            self.data = txn.apply_to(self.data)
+            tiles, alertas = self._reindex(portas_alteradas)
+            self._dirty = True
+            self._sync_to_disk_immediate()
+            # Clientes substituem o host inteiro, então o delta leva as portas remontadas
+            delta = txn.delta()
+            delta["updated"] = [self._with_ports_unlocked(host) for host in delta["updated"]]
+            eventos_portas = self._take_port_events()
+        self._publish('hosts_delta', delta)
+        self._emit_cluster_updates(tiles)
+        self._publish_alerts(alertas)
+        self._publish_port_events(eventos_portas)
+
+    def apply_delta(self, patch):
+        """Aplica um patch vindo de outro processo (Transaction.patch() de uma transação num worker)."""
+        with self.transaction() as txn:
+            aplicar_patch(txn, patch)
+
+    def report_ingest(self, stats):
+        """Guarda e publica as estatísticas da última ingestão de resultados.json."""
+        self.ingest_stats = stats
+        self._publish('ingest_stats', stats)
+
+    def report_ping(self, resultado):
+        """Publica o resultado de um ping sob demanda ({ip, ativo, tempo_resposta, ts, tickets})."""
+        self._publish('ping_result', resultado)
+
+    def _publish_alerts(self, alertas):
+        if alertas is not None:
+            logger.info(f"Alertas de telemetria: {len(alertas['novos'])} novos, {len(alertas['resolvidos'])} resolvidos")
+            self._publish('alerts_updated', alertas)
+
+    def _publish_port_events(self, eventos):
+        """Mudanças de porta vão só para os clientes inscritos (sala PORT_CHANGES_ROOM)."""
+        if eventos:
+            logger.info(f"{len(eventos)} mudanças de porta detectadas")
+            self._publish('port_changes', {"eventos": eventos}, room=PORT_CHANGES_ROOM)
+
+    def _publish(self, event, payload, room=None):
+        """Emite para os clientes locais (se houver) e publica no barramento para os workers."""
+        with STAGE_SECONDS.time("emit"):
+            if self.socketio is not None:
+                self.socketio.emit(event, payload, room=room, namespace='/')
+            if self.bus is not None:
+                self.bus.publish(event, payload)
 
     def _sync_to_disk_immediate(self):
+        """Grava dados.json no formato original (chamar com algum lock adquirido)."""
         try:
-            with open(self.filepath, "w", encoding="utf-8") as arquivo:
-                json.dump(self.data, arquivo, indent=4, ensure_ascii=False)
-            logger.debug(f"Dados gravados em {self.filepath}")
+            with STAGE_SECONDS.time("disk_write"), open(self.filepath, "wb") as arquivo:
+                for bloco in iter_json(self.data, host_transform=self._with_ports_unlocked):
+                    arquivo.write(bloco)
+            logger.debug("Dados gravados em %s", self.filepath)
             self._dirty = False
             self.last_hash = self._get_file_hash()
         except Exception as e:
@@ -88,9 +723,31 @@ class DataManager:
     def _sync_to_disk(self):
         while True:
             if self._dirty:
-                self._sync_to_disk_immediate()
+                self._carregar_secoes()
+                with self.rwlock.reader_lock:
+                    self._sync_to_disk_immediate()
+            elif self._snapshot_hash != self.last_hash and self._secoes_pendentes is None:
+                with self.rwlock.reader_lock:
+                    self._save_snapshot()
             time.sleep(10)
 
+    def _save_snapshot(self):
+        """
+        Grava o snapshot binário do estado atual (chamar com algum lock adquirido), marcado com o
+        hash de dados.json para ser usado na próxima partida só se corresponder ao arquivo.
+        """
+        hash_origem = self.last_hash
+        if not hash_origem:
+            return
+        try:
+            ports = {ip: self.port_table.get(ip) for ip in self.port_table.rows}
+            salvar_snapshot(self.snapshot_path, self.data, ports, hash_origem)
+            self._snapshot_hash = hash_origem
+            logger.debug("Snapshot gravado em %s", self.snapshot_path)
+        except Exception as e:
+            logger.error(f"Erro ao gravar o snapshot {self.snapshot_path}: {str(e)}")
+            self._snapshot_hash = hash_origem  # nova tentativa só na próxima mudança
+
     def _get_file_hash(self):
         try:
             with open(self.filepath, "rb") as f:
@@ -99,17 +756,23 @@ class DataManager:
             return ""
 
     def _get_trusted_file_hash(self):
-        try:
-            with open(self.trusted_hostnames_path, "rb") as f:
-                return hashlib.md5(f.read()).hexdigest()
-        except FileNotFoundError:
-            return ""
+        md5 = hashlib.md5()
+        for caminho in (self.trusted_hostnames_path, self.trusted_hostnames_cache_path):
+            try:
+                with open(caminho, "rb") as f:
+                    md5.update(f.read())
+            except FileNotFoundError:
+                pass
+            md5.update(b"\0")
+        return md5.hexdigest()
 
     def _monitor_file_changes(self):
         while True:
             current_hash = self._get_file_hash()
             if current_hash != self.last_hash and current_hash:
                 logger.info(f"Detectada mudança externa em dados.json")
+                self._carregar_secoes()
+                new_data = None
                 with self.rwlock.writer_lock:
                     try:
                         with open(self.filepath, "r", encoding="utf-8") as arquivo:
@@ -118,10 +781,18 @@ class DataManager:
                             hosts = new_data.get("hosts", [])
                             unique_hosts = {host["ip"]: host for host in hosts if "ip" in host}.values()
                             new_data["hosts"] = list(unique_hosts)
-                            self.data = new_data
-                            self.socketio.emit('data_updated', self.get_data(), namespace='/')
+                            self.data, portas_alteradas = self._absorb_document(new_data)
+                            tiles, alertas = self._reindex(portas_alteradas)
+                            eventos_portas = self._take_port_events()
                     except json.JSONDecodeError:
                         logger.error("Erro ao carregar dados.json após mudança")
+                        new_data = None
+                # Publicação fora do lock (o documento lido já está no formato original)
+                if new_data is not None:
+                    self._publish('data_updated', new_data)
+                    self._emit_cluster_updates(tiles)
+                    self._publish_alerts(alertas)
+                    self._publish_port_events(eventos_portas)
                 self.last_hash = current_hash
             time.sleep(5)
 
@@ -129,12 +800,13 @@ class DataManager:
         while True:
             current_hash = self._get_trusted_file_hash()
             if current_hash != self.last_trusted_hash and current_hash:
-                logger.info(f"Detectada mudança externa em trusted_hostnames.json")
+                logger.info(f"Detectada mudança nas listas de hostnames confiáveis")
+                self._carregar_secoes()
                 with self.rwlock.writer_lock:
-                    self.data["trusted_hostnames"] = self._load_trusted_hostnames()
+                    self.data = {**self.data, "trusted_hostnames": self._load_trusted_hostnames()}
                     self._dirty = True
                     self._sync_to_disk_immediate()
-                    self.socketio.emit('data_updated', self.get_data(), namespace='/')
+                    self._publish('data_updated', self.get_data())
                 self.last_trusted_hash = current_hash
             time.sleep(5)
 
@@ -148,9 +820,90 @@ class DataManager:
                     if (current_time - datetime.fromisoformat(timestamp)).total_seconds() > 300
                 ]
                 if expired_ips:
-                    for ip in expired_ips:
-                        del priority_ips[ip]
-                    self.data["priority_ips"] = priority_ips
+                    # Novo dict em vez de alterar no lugar: snapshots em uso continuam válidos
+                    self.data = {**self.data, "priority_ips": {
+                        ip: ts for ip, ts in priority_ips.items() if ip not in expired_ips
+                    }}
                     self._dirty = True
                     logger.info(f"Removidos {len(expired_ips)} IPs prioritários expirados")
-            time.sleep(60)
\ No newline at end of file
+            time.sleep(60)
+
+
+class ReplicaDataManager(HostIndexes):
+    """
+    Réplica somente leitura do estado, usada pelos workers de socket.io/HTTP.
+
+    O estado chega pelo barramento (evento data_updated publicado pelo DataManager dono)
+    e é repassado aos clientes conectados a este worker. Escritas são feitas só por
+    transaction(): o patch vai ao dono pelo tópico apply_delta e é reaplicado sobre o estado
+    dele (não há update_data com o documento inteiro, que descartaria escritas concorrentes);
+    o dono persiste e republica para todos os workers.
+    """
+
+    def __init__(self, socketio, bus):
+        self.rwlock = MeasuredRWLock(RWLock())
+        self._confiaveis = (None, TrustedHostnames())  # (lista de origem, conjunto)
+        self._init_indexes()
+        self.data = {"hosts": [], "pending_edits": [], "priority_ips": {}, "trusted_hostnames": []}
+        self.socketio = socketio
+        self.bus = bus
+        self.ingest_stats = None
+        bus.subscribe("data_updated", self._on_data_updated)
+        bus.subscribe("ingest_stats", self._on_ingest_stats)
+        # Os alertas são avaliados aqui também (para /alerts), mas publicados só pelo dono
+        bus.subscribe("alerts_updated", lambda alertas: socketio.emit('alerts_updated', alertas, namespace='/'))
+        bus.subscribe("hosts_delta", self._on_hosts_delta)
+        bus.subscribe("port_changes", self._on_port_changes)
+        bus.subscribe("ping_result", lambda resultado: socketio.emit('ping_result', resultado, namespace='/'))
+        bus.subscribe("bus_connected", lambda _: bus.publish("sync_request", {}))
+
+    def _on_data_updated(self, new_data):
+        with self.rwlock.writer_lock:
+            self.data, portas_alteradas = self._absorb_document(new_data)
+            tiles, _ = self._reindex(portas_alteradas)
+        self.socketio.emit('data_updated', new_data, namespace='/')
+        self._emit_cluster_updates(tiles)
+
+    def _on_port_changes(self, payload):
+        self.port_events.record_dicts(payload.get("eventos", []))
+        self.socketio.emit('port_changes', payload, room=PORT_CHANGES_ROOM, namespace='/')
+
+    def _on_ingest_stats(self, stats):
+        self.ingest_stats = stats
+        self.socketio.emit('ingest_stats', stats, namespace='/')
+
+    @contextmanager
+    def transaction(self):
+        """Mesma interface de DataManager.transaction(); o patch é reaplicado e persistido pelo dono."""
+        with self.rwlock.writer_lock:
+            txn = Transaction(self.data, self.hosts_by_ip, self.port_table)
+            yield txn
+            if txn.is_empty():
+                return
+            patch = txn.patch()  # antes de absorb_ports, para levar as portas alteradas ao dono
+            portas_alteradas = txn.absorb_ports(self._absorb_ports)
+            self.data = txn.apply_to(self.data)
+            self._reindex(portas_alteradas)
+        self.bus.publish("apply_delta", patch)
+
+    def _on_hosts_delta(self, delta):
+        with self.rwlock.writer_lock:
+            hosts, portas_alteradas = self._absorb_ports(delta.get("updated", []))
+            self.data = merge_delta(self.data, {**delta, "updated": hosts})
+            tiles, _ = self._reindex(portas_alteradas)
+        self.socketio.emit('hosts_delta', delta, namespace='/')
+        self._emit_cluster_updates(tiles)
+
+    def snapshot(self):
+        with self.rwlock.reader_lock:
+            return self.data
+
+    def get_trusted_hostnames(self):
+        with self.rwlock.reader_lock:
+            lista = self.data.get("trusted_hostnames", [])
+        origem, confiaveis = self._confiaveis
+        if lista is not origem:
+            confiaveis = TrustedHostnames(lista)
+            self._confiaveis = (lista, confiaveis)
+        return confiaveis
+
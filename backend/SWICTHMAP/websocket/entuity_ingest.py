@@ -0,0 +1,234 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from file_watcher import FileWatcher
+from utils import CAMINHO_RESULTADOS_JSON
+
+logger = logging.getLogger(__name__)
+
+try:
+    import ijson
+except ImportError:  # Dependência opcional; sem ela usamos o decodificador incremental abaixo
+    ijson = None
+
+CHUNK_SIZE = 64 * 1024
+IP_INVALIDO = "IP não encontrado"
+
+_decoder = json.JSONDecoder()
+
+
+def _iter_array_stdlib(arquivo, chunk_size=CHUNK_SIZE):
+    """
+    Itera os elementos de um array JSON de topo lendo o arquivo em blocos.
+
+    Só o bloco atual e o elemento em construção ficam em memória, nunca o arquivo inteiro.
+    """
+    buffer = ""
+    pos = 0
+    fim_arquivo = False
+    inicio = True
+
+    def ler():
+        nonlocal buffer, pos, fim_arquivo
+        bloco = arquivo.read(chunk_size)
+        if not bloco:
+            fim_arquivo = True
+        buffer = buffer[pos:] + bloco
+        pos = 0
+
+    def pular_espacos():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or fim_arquivo:
+                return
+            ler()
+
+    ler()
+    pular_espacos()
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("resultados.json deve ser uma lista")
+    pos += 1
+    while True:
+        pular_espacos()
+        if pos >= len(buffer):
+            raise ValueError("resultados.json terminou antes do fim da lista")
+        if buffer[pos] == "]":
+            return
+        if not inicio:
+            if buffer[pos] != ",":
+                raise ValueError(f"',' esperado na posição {pos} do bloco atual")
+            pos += 1
+            pular_espacos()
+        inicio = False
+        while True:
+            try:
+                item, fim = _decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if fim_arquivo:
+                    raise
+                ler()
+                continue
+            if fim == len(buffer) and not fim_arquivo:
+                # Um número no fim do bloco pode continuar no próximo
+                ler()
+                continue
+            break
+        pos = fim
+        yield item
+
+
+def iter_resultados(path):
+    """Entradas de resultados.json, uma a uma (ijson se instalado, senão stdlib incremental)."""
+    if ijson is not None:
+        with open(path, "rb") as arquivo:
+            yield from ijson.items(arquivo, "item", use_float=True)
+    else:
+        with open(path, "r", encoding="utf-8") as arquivo:
+            yield from _iter_array_stdlib(arquivo)
+
+
+def _hash_entrada(entrada):
+    return hashlib.blake2b(json.dumps(entrada, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"),
+                           digest_size=16).digest()
+
+
+class EntuityIngestor:
+    """
+    Ingestão contínua de resultados.json (coleta do Entuity) no DataManager.
+
+    A cada mudança do arquivo as entradas são lidas em streaming e resumidas num hash por
+    IP; só os hosts cujo hash mudou são copiados e aplicados numa única transação, então o
+    custo de gravação/reindexação/publicação acompanha o número de switches alterados.
+    """
+
+    def __init__(self, data_manager, path=CAMINHO_RESULTADOS_JSON, auto_create_hosts=False):
+        self.data_manager = data_manager
+        self.path = path
+        self.auto_create_hosts = auto_create_hosts
+        self._hashes = {}  # ip -> hash da última entrada aplicada
+        self._lock = threading.Lock()
+        self.stats = {
+            "ingestoes": 0,
+            "ultima_ingestao": None,
+            "lag_segundos": None,
+            "duracao_segundos": None,
+            "entradas": 0,
+            "alteradas": 0,
+            "aplicadas": 0,
+            "criadas": 0,
+            "desconhecidas": 0,
+            "invalidas": 0,
+            "erro": None,
+        }
+
+    def start(self, ingerir_agora=True):
+        """
+        Passa a acompanhar resultados.json. Com ingerir_agora=False a primeira ingestão fica
+        por conta de quem chamou (ex.: só depois de o servidor estar escutando, já que ela
+        carrega as seções adiadas do snapshot).
+        """
+        if ingerir_agora:
+            # Em segundo plano, para o servidor atender logo na partida
+            threading.Thread(target=self.ingest, daemon=True).start()
+        FileWatcher(self.path, lambda _: self.ingest()).start()
+        return self
+
+    def ingest(self):
+        """Lê resultados.json e aplica só os hosts alterados. Retorna as estatísticas."""
+        with self._lock:
+            inicio = time.time()
+            try:
+                mtime = os.path.getmtime(self.path)
+                alteradas, hashes, invalidas = self._ler_alteradas()
+            except (OSError, ValueError) as e:
+                logger.error(f"Erro ao ler {self.path}: {str(e)}")
+                self.stats["erro"] = str(e)
+                return self.stats
+
+            total = len(hashes)
+            aplicadas, criadas, desconhecidas = self._aplicar(alteradas)
+            # Só memoriza hashes de entradas efetivamente aplicadas (ou sem mudança), para que
+            # hosts ainda inexistentes sejam tentados de novo quando aparecerem
+            for ip in alteradas.keys() - aplicadas:
+                hashes.pop(ip, None)
+            self._hashes = hashes
+
+            fim = time.time()
+            self.stats.update({
+                "ingestoes": self.stats["ingestoes"] + 1,
+                "ultima_ingestao": fim,
+                "lag_segundos": round(fim - mtime, 3),
+                "duracao_segundos": round(fim - inicio, 3),
+                "entradas": total,
+                "alteradas": len(alteradas),
+                "aplicadas": len(aplicadas),
+                "criadas": criadas,
+                "desconhecidas": desconhecidas,
+                "invalidas": invalidas,
+                "erro": None,
+            })
+            self.data_manager.report_ingest(dict(self.stats))
+        logger.info(
+            f"Ingestão de resultados.json: {self.stats['entradas']} entradas, "
+            f"{len(alteradas)} alteradas, {len(aplicadas)} aplicadas, "
+            f"lag {self.stats['lag_segundos']}s, {self.stats['duracao_segundos']}s"
+        )
+        return self.stats
+
+    def _ler_alteradas(self):
+        alteradas = {}
+        hashes = {}
+        invalidas = 0
+        for entrada in iter_resultados(self.path):
+            ip = entrada.get("IP") if isinstance(entrada, dict) else None
+            if not ip or ip == IP_INVALIDO:
+                invalidas += 1
+                continue
+            h = _hash_entrada(entrada)
+            hashes[ip] = h
+            if self._hashes.get(ip) != h:
+                alteradas[ip] = entrada
+        return alteradas, hashes, invalidas
+
+    def _aplicar(self, alteradas):
+        aplicadas = set()
+        criadas = 0
+        desconhecidas = 0
+        if not alteradas:
+            return aplicadas, criadas, desconhecidas
+        with self.data_manager.transaction() as txn:
+            for ip, entrada in alteradas.items():
+                valores = entrada.get("Valores", [])
+                ports = entrada.get("Ports", [])
+                if not isinstance(ports, list) or not all(isinstance(port, dict) for port in ports):
+                    logger.error("Formato inválido de Ports", extra={"ip": ip})
+                    ports = []
+                host = txn.get_host(ip)
+                if host is None:
+                    if not self.auto_create_hosts:
+                        desconhecidas += 1
+                        continue
+                    txn.add_host({
+                        "ip": ip,
+                        "nome": entrada.get("Nome SW", f"Host_{ip}"),
+                        "ativo": "green",
+                        "conexoes": [],
+                        "local": "",
+                        "ship": "",
+                        "tipo": "sw",
+                        "tempo_resposta": -1,
+                        "valores": valores,
+                        "ports": ports,
+                    })
+                    criadas += 1
+                elif host.get("valores") != valores or txn.get_ports(ip) != ports:
+                    # Cópia rasa: os demais campos continuam compartilhados com o snapshot atual
+                    txn.updated[ip] = {**host, "valores": valores, "ports": ports}
+                aplicadas.add(ip)
+        return aplicadas, criadas, desconhecidas
@@ -0,0 +1,85 @@
+import json
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+_pretty_encoder = json.JSONEncoder(indent=4, ensure_ascii=False)
+_compact_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def _agrupar(pedacos, chunk_size=CHUNK_SIZE):
+    """Junta pedaços pequenos do encoder em blocos de ~chunk_size bytes."""
+    buffer = []
+    tamanho = 0
+    for pedaco in pedacos:
+        buffer.append(pedaco)
+        tamanho += len(pedaco)
+        if tamanho >= chunk_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            tamanho = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _indentar(texto, nivel):
+    # Strings JSON não têm quebras de linha literais, então toda quebra é de formatação
+    return texto.replace("\n", "\n" + " " * (4 * nivel))
+
+
+def _iter_pretty_hosts(dados, host_transform):
+    """Mesma saída de iterencode, aplicando host_transform a cada host na hora de serializar."""
+    if not dados:
+        yield "{}"
+        return
+    yield "{"
+    for i, (chave, valor) in enumerate(dados.items()):
+        yield ("," if i else "") + "\n    " + _pretty_encoder.encode(chave) + ": "
+        if chave != "hosts" or not isinstance(valor, list):
+            yield _indentar(_pretty_encoder.encode(valor), 1)
+        elif not valor:
+            yield "[]"
+        else:
+            yield "["
+            for j, host in enumerate(valor):
+                yield ("," if j else "") + "\n        " + _indentar(_pretty_encoder.encode(host_transform(host)), 2)
+            yield "\n    ]"
+    yield "\n}"
+
+
+def iter_json(dados, chunk_size=CHUNK_SIZE, host_transform=None):
+    """
+    Mesmo conteúdo de json.dumps(dados, indent=4, ensure_ascii=False), gerado aos poucos.
+
+    iterencode percorre o documento sob demanda, então a memória extra é de um bloco,
+    não do documento inteiro. host_transform, se informado, é aplicado a cada item de
+    dados["hosts"] no momento da serialização (ex.: para anexar as portas do host).
+    """
+    if host_transform is not None:
+        return _agrupar(_iter_pretty_hosts(dados, host_transform), chunk_size)
+    return _agrupar(_pretty_encoder.iterencode(dados), chunk_size)
+
+
+def iter_ndjson(dados, chunk_size=CHUNK_SIZE, host_transform=None):
+    """
+    Um host por linha. A primeira linha traz as demais seções do documento em "meta"
+    (pending_edits, priority_ips, last_update...).
+    """
+    def linhas():
+        meta = {k: v for k, v in dados.items() if k != "hosts"}
+        yield _compact_encoder.encode({"meta": meta})
+        yield "\n"
+        for host in dados.get("hosts", []):
+            yield _compact_encoder.encode(host_transform(host) if host_transform else host)
+            yield "\n"
+    return _agrupar(linhas(), chunk_size)
+
+
+def gzip_stream(blocos, level=6):
+    """Comprime um iterável de bytes em formato gzip, bloco a bloco."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for bloco in blocos:
+        comprimido = compressor.compress(bloco)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # Dependência opcional; sem ela o arquivo é verificado por polling
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def _assinatura(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return None
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        caminhos = {getattr(event, "src_path", None), getattr(event, "dest_path", None)}
+        if self.watcher.path in {os.path.abspath(p) for p in caminhos if p}:
+            self.watcher.check()
+
+
+class FileWatcher:
+    """
+    Chama callback(path) quando o arquivo muda (mtime ou tamanho).
+
+    Usa notificações do sistema (watchdog) quando disponível e, em qualquer caso, um
+    polling de segurança a cada `interval` segundos. Mudanças em rajada (arquivo sendo
+    regravado) são agrupadas: o callback só roda depois de `settle` segundos sem alteração.
+    """
+
+    def __init__(self, path, callback, interval=2.0, settle=0.5):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.interval = interval
+        self.settle = settle
+        self._ultima = _assinatura(self.path)
+        self._lock = threading.Lock()
+        self._observer = None
+
+    def start(self):
+        if Observer is not None and os.path.isdir(os.path.dirname(self.path)):
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_Handler(self), os.path.dirname(self.path), recursive=False)
+                self._observer.daemon = True
+                self._observer.start()
+            except Exception as e:
+                logger.warning(f"Notificações indisponíveis para {self.path}, usando polling: {str(e)}")
+                self._observer = None
+        threading.Thread(target=self._poll_loop, daemon=True).start()
+        return self
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.check()
+
+    def check(self):
+        """Verifica o arquivo agora e dispara o callback se ele mudou."""
+        with self._lock:
+            atual = _assinatura(self.path)
+            if atual == self._ultima or atual is None:
+                return
+            # Espera o arquivo estabilizar antes de ler
+            time.sleep(self.settle)
+            estavel = _assinatura(self.path)
+            if estavel != atual:
+                return
+            self._ultima = estavel
+        try:
+            self.callback(self.path)
+        except Exception as e:
+            logger.error(f"Erro ao processar mudança em {self.path}: {str(e)}", exc_info=True)
@@ -1,32 +1,29 @@
-from flask import Flask, jsonify, request
-import socket
+from flask import Flask, jsonify, request, Response
 import logging
 import json
 import os
 import time
-import requests
+import hashlib
+import threading
 from flask_cors import CORS
+from client_identity import identificar_cliente, TrustedHostnames, mesclar_hostnames
+from file_watcher import FileWatcher
+from trusted_hostnames import TrustedHostnameProvider
+from log_setup import configure_logging
+from metrics import register_metrics
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+register_metrics(app)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("get_data_logs.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging("get_data_logs.log", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DATA_FILE = r"dados.json"
 RESULTADOS_FILE = r"A:\SwitchMap\backend\ENTUITY\resultados.json"
-TRUSTED_HOSTNAMES_URL = "https://api-security-swmap.vercel.app/APIhosts.json"
 
-trusted_hostnames_cache = None
-last_fetch_time = 0
-CACHE_DURATION = 300
+trusted_provider = TrustedHostnameProvider()
+_confiaveis = (None, None, TrustedHostnames())  # (lista remota, lista local, conjunto da união)
 
 def load_json_data(file_path):
     """Carrega um arquivo JSON com tratamento de erros."""
@@ -45,124 +42,162 @@ def load_json_data(file_path):
         logger.error(f"Erro ao carregar {file_path}: {str(e)}")
         return None
 
-def fetch_trusted_hostnames():
-    """Obtém hostnames confiáveis da URL remota ou cache."""
-    global trusted_hostnames_cache, last_fetch_time
-    current_time = time.time()
-
-    if trusted_hostnames_cache is not None and (current_time - last_fetch_time) < CACHE_DURATION:
-        logger.debug("Usando hostnames confiáveis do cache.")
-        return trusted_hostnames_cache
-
-    try:
-        response = requests.get(TRUSTED_HOSTNAMES_URL, timeout=5, verify=False)
-        response.raise_for_status()
-        data = response.json()
-        hostnames = data.get("hostnames", [])
-        if isinstance(hostnames, list):
-            trusted_hostnames_cache = hostnames
-            last_fetch_time = current_time
-            logger.info(f"Hostnames confiáveis atualizados do endpoint remoto: {hostnames}")
-            return hostnames
-        else:
-            logger.error("A chave 'hostnames' no JSON remoto não contém uma lista válida.")
-            return trusted_hostnames_cache or []
-    except requests.RequestException as e:
-        logger.error(f"Erro ao buscar hostnames de {TRUSTED_HOSTNAMES_URL}: {str(e)}")
-        return trusted_hostnames_cache or []
-    except json.JSONDecodeError as e:
-        logger.error(f"Erro ao decodificar JSON remoto: {str(e)}")
-        return trusted_hostnames_cache or []
-
-def merge_data(dados, resultados):
-    """Mescla dados de resultados.json com dados.json em memória."""
-    if not dados or not isinstance(dados.get("hosts", []), list):
-        logger.error("Estrutura inválida de dados.json: 'hosts' não é uma lista.")
-        return dados
-
-    if not resultados or not isinstance(resultados, list):
-        logger.error("Estrutura inválida de resultados.json: não é uma lista.")
-        return dados
-
-    # Criar uma cópia profunda para evitar modificar o original
-    merged_data = json.loads(json.dumps(dados))
-    hosts_dict = {host["ip"]: host for host in merged_data.get("hosts", [])}
-    
-    updated_ips = []
-    for resultado in resultados:
-        ip = resultado.get("IP")
-        if not ip or ip == "IP não encontrado":
-            logger.warning(f"Ignorando entrada com IP inválido: Nome SW {resultado.get('Nome SW', 'desconhecido')}")
-            continue
-        if ip in hosts_dict:
-            hosts_dict[ip]["valores"] = resultado.get("Valores", [])
-            ports = resultado.get("Ports", [])
-            if not all(isinstance(port, dict) for port in ports):
-                logger.error(f"Formato inválido de Ports para IP {ip}: {ports}")
-                hosts_dict[ip]["ports"] = []
-            else:
-                hosts_dict[ip]["ports"] = ports
-                updated_ips.append(ip)
-                logger.info(f"Mesclado valores e ports para IP {ip}")
-        else:
-            logger.debug(f"IP {ip} não encontrado em hosts_dict")
-
-    merged_data["hosts"] = list(hosts_dict.values())
-    if updated_ips:
-        logger.info(f"Hosts mesclados com sucesso: {updated_ips}")
+def _hash_entrada(entrada):
+    return hashlib.blake2b(json.dumps(entrada, sort_keys=True, ensure_ascii=False).encode("utf-8"), digest_size=16).digest()
+
+def _mesclar_host(host, resultado):
+    """Cópia do host com valores/ports de resultados.json (host original não é alterado)."""
+    mesclado = dict(host)
+    if resultado is None:
+        return mesclado
+    mesclado["valores"] = resultado.get("Valores", [])
+    ports = resultado.get("Ports", [])
+    if not all(isinstance(port, dict) for port in ports):
+        logger.error(f"Formato inválido de Ports para IP {host.get('ip')}: {ports}")
+        mesclado["ports"] = []
     else:
-        logger.warning("Nenhum host foi mesclado com valores ou ports")
-    
-    return merged_data
+        mesclado["ports"] = ports
+    return mesclado
+
+class MergedDataCache:
+    """
+    Visão mesclada de dados.json + resultados.json mantida em memória.
+
+    Os arquivos só são relidos quando mudam (FileWatcher); a cada mudança apenas os hosts
+    cuja entrada em dados.json ou em resultados.json mudou são mesclados de novo. A resposta
+    serializada é guardada por versão, então uma requisição sem mudanças não faz parse,
+    merge nem json.dumps.
+    """
+
+    def __init__(self, data_file, resultados_file):
+        self.data_file = data_file
+        self.resultados_file = resultados_file
+        self._lock = threading.Lock()
+        self.dados = None
+        self._hosts = {}           # ip -> host de dados.json
+        self._resultados = {}      # ip -> entrada de resultados.json
+        self._hash_resultados = {} # ip -> hash da entrada
+        self._merged = {}          # ip -> host mesclado
+        self.version = 0
+        self.timestamp = None
+        self._body = None
+        self._body_etag = None
+        self._body_version = -1
+
+    def start(self):
+        self.reload_dados()
+        self.reload_resultados()
+        FileWatcher(self.data_file, lambda _: self.reload_dados()).start()
+        FileWatcher(self.resultados_file, lambda _: self.reload_resultados()).start()
+        return self
+
+    def reload_dados(self):
+        dados = load_json_data(self.data_file)
+        if not dados or not isinstance(dados.get("hosts", []), list):
+            logger.error("Estrutura inválida de dados.json: 'hosts' não é uma lista.")
+            return
+        novos = {host["ip"]: host for host in dados.get("hosts", []) if "ip" in host}
+        with self._lock:
+            alterados = [ip for ip, host in novos.items() if self._hosts.get(ip) != host]
+            for ip in self._hosts.keys() - novos.keys():
+                self._merged.pop(ip, None)
+            for ip in alterados:
+                self._merged[ip] = _mesclar_host(novos[ip], self._resultados.get(ip))
+            self._hosts = novos
+            self.dados = dados
+            self._bump()
+        logger.info(f"dados.json recarregado: {len(alterados)} hosts mesclados novamente")
+
+    def reload_resultados(self):
+        resultados = load_json_data(self.resultados_file)
+        if not resultados or not isinstance(resultados, list):
+            logger.warning("resultados.json não carregado; mantendo a última versão mesclada")
+            return
+        novos = {}
+        hashes = {}
+        for resultado in resultados:
+            ip = resultado.get("IP")
+            if not ip or ip == "IP não encontrado":
+                continue
+            novos[ip] = resultado
+            hashes[ip] = _hash_entrada(resultado)
+        with self._lock:
+            alterados = {ip for ip, h in hashes.items() if self._hash_resultados.get(ip) != h}
+            alterados |= self._hash_resultados.keys() - hashes.keys()
+            self._resultados = novos
+            self._hash_resultados = hashes
+            for ip in alterados:
+                if ip in self._hosts:
+                    self._merged[ip] = _mesclar_host(self._hosts[ip], novos.get(ip))
+            self._bump()
+        logger.info(f"resultados.json recarregado: {len(alterados)} hosts com resultados alterados")
+
+    def _bump(self):
+        self.version += 1
+        self.timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    def trusted_hostnames(self):
+        return (self.dados or {}).get("trusted_hostnames", [])
+
+    def response_body(self):
+        """
+        (ETag, bytes JSON) da visão mesclada atual; serializa só quando a versão muda.
+
+        O ETag é o hash do conteúdo, não a versão: a versão é um contador do processo, que
+        recomeça a cada partida e difere entre instâncias, e um ETag repetido para outro
+        conteúdo faria o cliente aceitar um 304 com dados velhos.
+        """
+        with self._lock:
+            if self._body_version != self.version:
+                merged_data = {k: v for k, v in (self.dados or {}).items() if k != "hosts"}
+                merged_data["hosts"] = [self._merged[ip] for ip in self._hosts]
+                merged_data["timestamp"] = self.timestamp
+                merged_data["source"] = "merged_data"
+                self._body = json.dumps(merged_data, ensure_ascii=False).encode("utf-8")
+                self._body_etag = '"' + hashlib.blake2b(self._body, digest_size=16).hexdigest() + '"'
+                self._body_version = self.version
+            return self._body_etag, self._body
+
+merged_cache = MergedDataCache(DATA_FILE, RESULTADOS_FILE)
+
+def hostnames_confiaveis():
+    """
+    Lista remota (provider) mais a lista local de dados.json. As duas só trocam de objeto
+    quando recarregadas, então o conjunto é refeito uma vez por recarga e a troca é uma
+    atribuição só.
+    """
+    global _confiaveis
+    remota, local = trusted_provider.get(), merged_cache.trusted_hostnames()
+    if remota is not _confiaveis[0] or local is not _confiaveis[1]:
+        _confiaveis = (remota, local, TrustedHostnames(mesclar_hostnames(local, remota)))
+    return _confiaveis[2]
 
 @app.route("/get-data", methods=["GET"])
 def get_data():
     start_time = time.time()
-    try:
-        hostname_cliente = socket.gethostbyaddr(request.remote_addr)[0] if request.remote_addr else "Desconhecido"
-        logger.debug(f"Hostname resolvido para {request.remote_addr}: {hostname_cliente}")
-    except socket.herror:
-        hostname_cliente = "Desconhecido"
-        logger.debug(f"Não foi possível resolver hostname para {request.remote_addr}")
-
-    # Carregar dados.json
-    dados = load_json_data(DATA_FILE)
-    if not dados:
-        return jsonify({"erro": "Falha ao carregar dados.json"}), 500
+    hostname_cliente = identificar_cliente(request.remote_addr)
+    logger.debug("Hostname resolvido", extra={"cliente_ip": request.remote_addr, "cliente": hostname_cliente})
 
-    # Carregar resultados.json
-    resultados = load_json_data(RESULTADOS_FILE)
-    if not resultados:
-        logger.warning("resultados.json não carregado; retornando dados.json sem mesclagem")
-        # Prosseguir com dados.json mesmo sem resultados.json
-
-    # Mesclar dados
-    logger.info("Mesclando dados.json com resultados.json")
-    merged_data = merge_data(dados, resultados)
+    if merged_cache.dados is None:
+        return jsonify({"erro": "Falha ao carregar dados.json"}), 500
 
     # Autenticação
-    hostnames_confiaveis = fetch_trusted_hostnames()
-    if not hostnames_confiaveis:
-        hostnames_confiaveis = dados.get("trusted_hostnames", [])
-        logger.warning("Usando hostnames confiáveis do arquivo local como fallback.")
-
-    hostname_cliente_lower = hostname_cliente.lower()
-    hostnames_confiaveis_lower = [h.lower() for h in hostnames_confiaveis]
-    logger.debug(f"Hostnames confiáveis (lower): {hostnames_confiaveis_lower}")
-    logger.debug(f"Hostname cliente (lower): {hostname_cliente_lower}")
-
-    if hostname_cliente_lower not in hostnames_confiaveis_lower:
-        logger.info(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - 🚫 ACESSO NEGADO para {hostname_cliente}")
+    # Nunca espera pela lista remota: usa a última versão válida do provider
+    if hostname_cliente not in hostnames_confiaveis():
+        logger.warning("🚫 ACESSO NEGADO em /get-data", extra={"cliente": hostname_cliente})
         return jsonify({"erro": "Acesso não autorizado"}), 403
 
-    # Adicionar metadados
-    merged_data["timestamp"] = time.strftime('%Y-%m-%d %H:%M:%S')
-    merged_data["source"] = "merged_data"
+    etag, body = merged_cache.response_body()
+    headers = {'Cache-Control': 'no-cache', 'ETag': etag}
 
-    logger.info(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - ✅ Dados mesclados consultados por {hostname_cliente}")
+    logger.info("✅ Dados mesclados consultados", extra={"cliente": hostname_cliente})
     total_time = time.time() - start_time
-    logger.debug(f"Tempo total de /get-data: {total_time:.3f}s")
-    return jsonify(merged_data), 200, {'Cache-Control': 'no-cache'}
+    logger.debug("Tempo total de /get-data: %.3fs", total_time)
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status=304, headers=headers)
+    return Response(body, status=200, mimetype="application/json", headers=headers)
 
 if __name__ == "__main__":
+    merged_cache.start()
+    trusted_provider.start()
     app.run(host="0.0.0.0", port=5001, debug=True)
\ No newline at end of file
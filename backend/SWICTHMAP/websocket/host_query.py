@@ -0,0 +1,247 @@
+import base64
+import bisect
+import ipaddress
+import json
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+def _chave_ip(host):
+    try:
+        return int(ipaddress.ip_address(host.get("ip", "")))
+    except ValueError:
+        return -1
+
+
+def _chave_rtt(host):
+    rtt = host.get("tempo_resposta", -1)
+    return rtt if isinstance(rtt, (int, float)) else -1
+
+
+SORT_KEYS = {
+    "nome": lambda host: (host.get("nome") or "").lower(),
+    "ip": _chave_ip,
+    "tempo_resposta": _chave_rtt,
+}
+
+# Tipo da chave de cada ordenação, conferido no cursor (comparar tipos diferentes no bisect
+# lançaria TypeError)
+TIPOS_CHAVE = {
+    "nome": (str,),
+    "ip": (int,),
+    "tempo_resposta": (int, float),
+}
+
+
+def extrair_site(nome):
+    """
+    Extrai (uf, site) do padrão de nomes PAIS-UF-CATEGORIA-SITE-..., ex.:
+    "BR-MA-FAB-IMP-SWA_AC_DEPOSIT.124.26" -> ("MA", "BR-MA-FAB-IMP").
+    """
+    partes = (nome or "").upper().split("-")
+    if len(partes) < 5:
+        return None, None
+    return partes[1], "-".join(partes[:4])
+
+
+def encode_cursor(sort, chave, ip):
+    return base64.urlsafe_b64encode(json.dumps([sort, chave, ip]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, sort):
+    """Lança ValueError se o cursor é inválido ou foi gerado para outra ordenação."""
+    try:
+        sort_cursor, chave, ip = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("cursor inválido")
+    if sort_cursor != sort:
+        raise ValueError("cursor gerado para outra ordenação")
+    if (not isinstance(chave, TIPOS_CHAVE.get(sort, ())) or isinstance(chave, bool)
+            or not isinstance(ip, str)):
+        raise ValueError("cursor inválido")
+    return chave, ip
+
+
+class SortedKeyIndex:
+    """Lista ordenada de (chave, ip) mantida com bisect para ordenação e faixas."""
+
+    def __init__(self, key_func):
+        self.key_func = key_func
+        self._entries = []
+        self._keys = {}  # ip -> chave atual
+
+    def upsert(self, ip, host):
+        chave = self.key_func(host)
+        atual = self._keys.get(ip)
+        if atual == chave and ip in self._keys:
+            return
+        self.remove(ip)
+        bisect.insort(self._entries, (chave, ip))
+        self._keys[ip] = chave
+
+    def remove(self, ip):
+        if ip not in self._keys:
+            return
+        entrada = (self._keys.pop(ip), ip)
+        pos = bisect.bisect_left(self._entries, entrada)
+        if pos < len(self._entries) and self._entries[pos] == entrada:
+            del self._entries[pos]
+
+    def key(self, ip):
+        return self._keys[ip]
+
+    def range(self, minimo=None, maximo=None):
+        """IPs com minimo <= chave <= maximo."""
+        inicio = 0 if minimo is None else bisect.bisect_left(self._entries, (minimo,))
+        fim = len(self._entries)
+        if maximo is not None:
+            # (maximo, chr(0x10FFFF)) fica depois de qualquer (maximo, ip)
+            fim = bisect.bisect_right(self._entries, (maximo, chr(0x10FFFF)))
+        return {ip for _, ip in self._entries[inicio:fim]}
+
+    def prefix(self, prefixo):
+        inicio = bisect.bisect_left(self._entries, (prefixo,))
+        ips = set()
+        for chave, ip in self._entries[inicio:]:
+            if not chave.startswith(prefixo):
+                break
+            ips.add(ip)
+        return ips
+
+    def iter_from(self, depois=None, desc=False):
+        """Itera (chave, ip) em ordem a partir de (exclusive) `depois`."""
+        if not desc:
+            inicio = 0 if depois is None else bisect.bisect_right(self._entries, tuple(depois))
+            for i in range(inicio, len(self._entries)):
+                yield self._entries[i]
+        else:
+            fim = len(self._entries) if depois is None else bisect.bisect_left(self._entries, tuple(depois))
+            for i in range(fim - 1, -1, -1):
+                yield self._entries[i]
+
+
+class HostQueryIndex:
+    """
+    Índices invertidos (status, tipo, UF, site, status de porta) e ordenados (nome, ip,
+    tempo_resposta) usados pela consulta paginada de /hosts.
+    """
+
+    def __init__(self, port_table=None):
+        self.port_table = port_table  # status das portas vêm daqui quando os hosts não têm "ports"
+        self.by_status = defaultdict(set)
+        self.by_tipo = defaultdict(set)
+        self.by_uf = defaultdict(set)
+        self.by_site = defaultdict(set)  # "BR-MA-FAB-IMP" e também o código curto "IMP"
+        self.by_port_status = defaultdict(set)
+        self._inverted = {
+            "status": self.by_status,
+            "tipo": self.by_tipo,
+            "uf": self.by_uf,
+            "site": self.by_site,
+            "port_status": self.by_port_status,
+        }
+        self.sorted = {campo: SortedKeyIndex(func) for campo, func in SORT_KEYS.items()}
+        self._entries = {}  # ip -> chaves invertidas atuais
+
+    def _chaves(self, ip, host):
+        uf, site = extrair_site(host.get("nome"))
+        sites = (site, site.split("-")[-1]) if site else ()
+        if self.port_table is not None:
+            portas = self.port_table.statuses(ip)
+        else:
+            portas = frozenset(p.get("Status") for p in host.get("ports", []) if isinstance(p, dict))
+        return (
+            (("status", host.get("ativo")), ("tipo", host.get("tipo")))
+            + ((("uf", uf),) if uf else ())
+            + tuple(("site", s) for s in sites)
+            + tuple(("port_status", p) for p in sorted(portas, key=str))
+        )
+
+    def upsert(self, ip, host):
+        for index in self.sorted.values():
+            index.upsert(ip, host)
+        chaves = self._chaves(ip, host)
+        if self._entries.get(ip) == chaves:
+            return
+        self._remove_inverted(ip)
+        for nome_index, valor in chaves:
+            self._inverted[nome_index][valor].add(ip)
+        self._entries[ip] = chaves
+
+    def remove(self, ip):
+        for index in self.sorted.values():
+            index.remove(ip)
+        self._remove_inverted(ip)
+
+    def _remove_inverted(self, ip):
+        for nome_index, valor in self._entries.pop(ip, ()):
+            index = self._inverted[nome_index]
+            ips = index.get(valor)
+            if ips is not None:
+                ips.discard(ip)
+                if not ips:
+                    del index[valor]
+
+    def candidates(self, status=None, tipo=None, uf=None, site=None, port_status=None,
+                   prefix=None, rtt_min=None, rtt_max=None, restrict=None):
+        """
+        Interseção dos filtros informados. Cada filtro de conjunto aceita vários valores
+        (união entre eles). Retorna None quando nenhum filtro foi aplicado (todos os hosts).
+        """
+        conjuntos = []
+        for index, valores in ((self.by_status, status), (self.by_tipo, tipo), (self.by_uf, uf),
+                               (self.by_site, site), (self.by_port_status, port_status)):
+            if valores:
+                conjuntos.append(set().union(*(index.get(v, set()) for v in valores)))
+        if prefix:
+            conjuntos.append(self.sorted["nome"].prefix(prefix.lower()))
+        if rtt_min is not None or rtt_max is not None:
+            # Hosts offline têm tempo_resposta -1: a faixa começa em 0 para não incluí-los
+            minimo = 0 if rtt_min is None else max(rtt_min, 0)
+            conjuntos.append(self.sorted["tempo_resposta"].range(minimo, rtt_max))
+        if restrict is not None:
+            conjuntos.append(set(restrict))
+        if not conjuntos:
+            return None
+        conjuntos.sort(key=len)
+        resultado = conjuntos[0]
+        for conjunto in conjuntos[1:]:
+            resultado = resultado & conjunto
+        return resultado
+
+    def page(self, candidatos, sort="nome", desc=False, cursor=None, limit=100):
+        """
+        Uma página de IPs na ordem pedida.
+
+        Returns:
+            (ips, total, next_cursor)
+        """
+        if sort not in self.sorted:
+            raise ValueError(f"ordenação não suportada: {sort}")
+        index = self.sorted[sort]
+        depois = decode_cursor(cursor, sort) if cursor else None
+        n_hosts = len(index._keys)
+        total = n_hosts if candidatos is None else len(candidatos)
+
+        if candidatos is not None and len(candidatos) * 8 < n_hosts:
+            # Poucos candidatos: ordenar só eles sai mais barato que percorrer o índice inteiro
+            ordenados = sorted(((index.key(ip), ip) for ip in candidatos), reverse=desc)
+            if depois is not None:
+                depois = tuple(depois)
+                ordenados = [e for e in ordenados if (e < depois if desc else e > depois)]
+            iterador = iter(ordenados)
+        else:
+            iterador = (e for e in index.iter_from(depois, desc) if candidatos is None or e[1] in candidatos)
+
+        pagina = []
+        for entrada in iterador:
+            pagina.append(entrada)
+            if len(pagina) > limit:
+                break
+        next_cursor = None
+        if len(pagina) > limit:
+            pagina = pagina[:limit]
+            next_cursor = encode_cursor(sort, *pagina[-1])
+        return [ip for _, ip in pagina], total, next_cursor
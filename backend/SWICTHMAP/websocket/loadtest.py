@@ -0,0 +1,398 @@
+"""
+Teste de carga offline do app.py: HTTP + fan-out socket.io numa única máquina.
+
+Sobe o app Flask/socket.io do app.py num subprocesso, contra um dados.json sintético (sem
+ping real, sem Entuity, com o rate limiter desligado e o DNS reverso fixo), conecta centenas
+de clientes socket.io e gera tráfego HTTP concorrente em /status, /download-dados,
+/editar-host e /prioritize-pings. Enquanto isso o servidor publica uma "varredura" simulada
+(data_updated com last_update) a cada --intervalo-broadcast segundos.
+
+Relatório (também gravado em JSON): latência p50/p90/p99 e vazão por rota, tempo de conexão
+e atraso de entrega dos broadcasts aos clientes, e RSS do servidor.
+Os clientes usam python-socketio (AsyncClient) e aiohttp, que só o teste de carga precisa.
+
+    python loadtest.py --clientes 300 --hosts 1000 --duracao 60
+    python loadtest.py --clientes 500 --processos 4 --http-concorrencia 50 --saida carga.json
+"""
+import sys
+
+if "--servidor" in sys.argv:
+    # O processo servidor roda o app.py, que exige o monkey_patch antes de qualquer outro import
+    import eventlet
+    eventlet.monkey_patch()
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+try:
+    import psutil
+except ImportError:  # Sem psutil o RSS vem de /proc (Linux)
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+HOSTNAME_CARGA = "LOADTEST"
+PERCENTIS = (50, 90, 95, 99)
+# Peso de cada rota no tráfego HTTP
+ROTAS = {"status": 4, "download-dados": 1, "editar-host": 2, "prioritize-pings": 2}
+
+
+# --- servidor (subprocesso) ---
+
+class _ResolverFixo:
+    """Substitui o DNS reverso: todo cliente é HOSTNAME_CARGA (que está nos hostnames confiáveis)."""
+
+    def resolve(self, ip):
+        return HOSTNAME_CARGA
+
+
+def _broadcasts(data_manager, intervalo, fracao):
+    """Simula o ping_service: muda o status de uma fração dos hosts e publica com last_update."""
+    aleatorio = random.Random(0)
+    while True:
+        time.sleep(intervalo)
+        dados = data_manager.get_data()
+        hosts = dados["hosts"]
+        for host in aleatorio.sample(hosts, max(1, int(len(hosts) * fracao))):
+            online = aleatorio.random() < 0.9
+            host["ativo"] = "#00d700" if online else "red"
+            host["tempo_resposta"] = aleatorio.randint(1, 40) if online else -1
+        dados["last_update"] = datetime.utcnow().isoformat() + "Z"
+        data_manager.update_data(dados)
+
+
+def servir(args):
+    """Processo servidor: o app/socketio do app.py com as rotas e handlers de sempre."""
+    import app as servidor  # aplica o monkey_patch do eventlet e configura o logging
+    import eventlet
+    import client_identity
+    from data_manager import DataManager
+    from message_bus import InProcessBus
+    from api_routes import register_routes
+    from websocket import register_websocket
+    from metrics import register_metrics
+
+    servidor.limiter.enabled = False
+    client_identity.resolver = _ResolverFixo()
+    data_manager = DataManager(os.path.join(args.diretorio, "dados.json"), servidor.socketio, bus=InProcessBus())
+    register_routes(servidor.app, data_manager, servidor.limiter)
+    register_websocket(servidor.socketio, data_manager)
+    register_metrics(servidor.app, servidor.socketio, servidor.limiter)
+    eventlet.spawn(_broadcasts, data_manager, args.intervalo_broadcast, args.fracao_alterada)
+    servidor.socketio.run(servidor.app, host="127.0.0.1", port=args.porta, use_reloader=False, log_output=False)
+
+
+# --- medidas ---
+
+def percentis(valores):
+    """{"p50": ..., "p90": ..., "p95": ..., "p99": ..., "max": ...} em ms (nearest-rank)."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    resultado = {f"p{p}": round(ordenados[max(0, math.ceil(len(ordenados) * p / 100) - 1)] * 1000, 2)
+                 for p in PERCENTIS}
+    resultado["max"] = round(ordenados[-1] * 1000, 2)
+    return resultado
+
+
+def rss_mb(pid):
+    if psutil is not None:
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    with open(f"/proc/{pid}/status") as arquivo:
+        for linha in arquivo:
+            if linha.startswith("VmRSS:"):
+                return int(linha.split()[1]) / 1024
+    return None
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, intervalo=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.intervalo = intervalo
+        self.amostras = []
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.amostras.append(rss_mb(self.pid))
+            except (OSError, ValueError):
+                return
+            except Exception as e:  # psutil.NoSuchProcess etc.
+                logger.debug("RSS indisponível: %s", e)
+                return
+
+    def parar(self):
+        self._parar.set()
+        valores = [v for v in self.amostras if v is not None]
+        return {"inicial_mb": round(valores[0], 1), "pico_mb": round(max(valores), 1),
+                "final_mb": round(valores[-1], 1)} if valores else None
+
+
+# --- clientes socket.io (processos) ---
+
+def _marca_para_ts(marca):
+    return datetime.fromisoformat(marca.rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+
+
+async def _cliente(url, inicio, fim, estatisticas):
+    import socketio
+
+    sio = socketio.AsyncClient(reconnection=False)
+    primeiros = {}  # last_update -> instante em que este cliente o recebeu pela primeira vez
+
+    async def ao_receber(dados):
+        agora = time.time()
+        estatisticas["recebidos"] += 1
+        marca = dados.get("last_update") if isinstance(dados, dict) else None
+        if marca and marca not in primeiros:
+            primeiros[marca] = agora
+
+    sio.on("data_updated", ao_receber)
+    await asyncio.sleep(max(0.0, inicio - time.time()))
+    t0 = time.perf_counter()
+    try:
+        await sio.connect(url, transports=["websocket"])
+        estatisticas["tempos_conexao"].append(time.perf_counter() - t0)
+        await sio.emit("subscribe_to_updates")
+        await asyncio.sleep(max(0.0, fim - time.time()))
+    except Exception as e:
+        estatisticas["falhas"] += 1
+        estatisticas["erros"].append(f"{type(e).__name__}: {e}")
+    finally:
+        estatisticas["recebimentos"].append(primeiros)
+        if sio.connected:
+            await sio.disconnect()
+
+
+async def _clientes(url, n, inicio, intervalo_conexao, fim):
+    estatisticas = {"recebidos": 0, "falhas": 0, "erros": [], "tempos_conexao": [], "recebimentos": []}
+    await asyncio.gather(*(_cliente(url, inicio + i * intervalo_conexao, fim, estatisticas) for i in range(n)))
+    estatisticas["erros"] = estatisticas["erros"][:20]
+    return estatisticas
+
+
+def executar_clientes(url, n, inicio, intervalo_conexao, fim):
+    """Ponto de entrada de cada processo de clientes."""
+    return asyncio.run(_clientes(url, n, inicio, intervalo_conexao, fim))
+
+
+# --- tráfego HTTP ---
+
+async def _trafego_http(url, ips, concorrencia, inicio, fim):
+    import aiohttp
+
+    rotas = [rota for rota, peso in ROTAS.items() for _ in range(peso)]
+    resultados = {rota: {"latencias": [], "bytes": 0, "erros": 0, "status": {}} for rota in ROTAS}
+    aleatorio = random.Random(1)
+
+    async def requisitar(sessao, rota):
+        if rota == "editar-host":
+            return sessao.put(f"{url}/editar-host", json={"ip": aleatorio.choice(ips), "local": "carga"})
+        if rota == "prioritize-pings":
+            return sessao.post(f"{url}/prioritize-pings", json={"ips": aleatorio.sample(ips, min(3, len(ips)))})
+        return sessao.get(f"{url}/{rota}")
+
+    async def trabalhador(sessao):
+        while time.time() < fim:
+            rota = aleatorio.choice(rotas)
+            resultado = resultados[rota]
+            t0 = time.perf_counter()
+            try:
+                async with await requisitar(sessao, rota) as resposta:
+                    corpo = await resposta.read()
+                resultado["latencias"].append(time.perf_counter() - t0)
+                resultado["bytes"] += len(corpo)
+                resultado["status"][resposta.status] = resultado["status"].get(resposta.status, 0) + 1
+                if resposta.status >= 400:
+                    resultado["erros"] += 1
+            except Exception:
+                resultado["erros"] += 1
+
+    await asyncio.sleep(max(0.0, inicio - time.time()))
+    async with aiohttp.ClientSession(headers={"Accept-Encoding": "identity"}) as sessao:
+        await asyncio.gather(*(trabalhador(sessao) for _ in range(concorrencia)))
+    duracao = fim - inicio
+    return {rota: {"requisicoes": len(r["latencias"]), "erros": r["erros"], "status": r["status"],
+                   "req_por_s": round(len(r["latencias"]) / duracao, 1),
+                   "mb_por_s": round(r["bytes"] / duracao / (1024 * 1024), 2),
+                   "latencia_ms": percentis(r["latencias"])}
+            for rota, r in resultados.items()}
+
+
+# --- orquestração ---
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _aguardar_servidor(url, processo, timeout=60):
+    import urllib.request
+
+    limite = time.time() + timeout
+    while time.time() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"Servidor terminou na partida (código {processo.returncode})")
+        try:
+            with urllib.request.urlopen(f"{url}/metrics", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"Servidor não respondeu em {timeout}s")
+
+
+def _frota(hosts):
+    from benchmark_ping import frota_sintetica
+
+    dados = frota_sintetica(hosts)
+    dados["trusted_hostnames"] = [HOSTNAME_CARGA]
+    return dados
+
+
+def _juntar_clientes(partes, inicio_carga, fim, intervalo_broadcast):
+    """
+    Consolida os processos de clientes. Entrega e atraso consideram só as varreduras publicadas
+    na janela de carga (todos já conectados, e com tempo de chegar antes do fim): marcas antigas
+    também chegam no broadcast de cada connect e nas edições, e distorceriam as duas medidas.
+    """
+    recebidos = sum(parte["recebidos"] for parte in partes)
+    falhas = sum(parte["falhas"] for parte in partes)
+    erros = [erro for parte in partes for erro in parte["erros"]]
+    tempos_conexao = [t for parte in partes for t in parte["tempos_conexao"]]
+    recebimentos = [r for parte in partes for r in parte["recebimentos"]]
+
+    limite = fim - intervalo_broadcast
+    marcas = {marca: _marca_para_ts(marca) for r in recebimentos for marca in r}
+    na_janela = {marca for marca, ts in marcas.items() if inicio_carga <= ts <= limite}
+    atrasos = [agora - marcas[marca] for r in recebimentos for marca, agora in r.items() if marca in na_janela]
+    entregues = sum(1 for r in recebimentos for marca in r if marca in na_janela)
+    return {
+        "conectados": len(tempos_conexao),
+        "falhas_conexao": falhas,
+        "erros": erros[:20],
+        "tempo_conexao_ms": percentis(tempos_conexao),
+        "data_updated_recebidos": recebidos,
+        "data_updated_por_s": round(recebidos / (fim - inicio_carga), 1),
+        "broadcasts": len(na_janela),
+        "entrega": round(entregues / (len(na_janela) * len(recebimentos)), 4) if na_janela and recebimentos else None,
+        "atraso_entrega_ms": percentis(atrasos),
+    }
+
+
+def executar(args):
+    diretorio = tempfile.mkdtemp(prefix="loadtest_")
+    porta = args.porta or _porta_livre()
+    url = f"http://127.0.0.1:{porta}"
+    dados = _frota(args.hosts)
+    with open(os.path.join(diretorio, "dados.json"), "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo)
+    ips = [host["ip"] for host in dados["hosts"]]
+
+    comando = [sys.executable, os.path.abspath(__file__), "--servidor", "--porta", str(porta),
+               "--diretorio", diretorio, "--intervalo-broadcast", str(args.intervalo_broadcast),
+               "--fracao-alterada", str(args.fracao_alterada)]
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                                      os.environ.get("PYTHONPATH")]))}
+    processo = subprocess.Popen(comando, cwd=diretorio, env=env)
+    try:
+        _aguardar_servidor(url, processo)
+        rss = RssSampler(processo.pid)
+        rss.start()
+
+        # Clientes conectam em rampa; o tráfego HTTP começa quando todos estão conectados
+        inicio = time.time() + 1
+        intervalo_conexao = 1 / args.taxa_conexao
+        inicio_carga = inicio + args.clientes * intervalo_conexao
+        fim = inicio_carga + args.duracao
+        por_processo = [args.clientes // args.processos + (1 if i < args.clientes % args.processos else 0)
+                        for i in range(args.processos)]
+        with ProcessPoolExecutor(max_workers=args.processos) as executor:
+            futuros = []
+            deslocamento = 0
+            for n in por_processo:
+                # Processos intercalados: o i-ésimo cliente de cada um conecta em instantes diferentes
+                futuros.append(executor.submit(executar_clientes, url, n,
+                                               inicio + deslocamento * intervalo_conexao,
+                                               intervalo_conexao * args.processos, fim))
+                deslocamento += 1
+            http = asyncio.run(_trafego_http(url, ips, args.http_concorrencia, inicio_carga, fim))
+            clientes = _juntar_clientes([f.result() for f in futuros], inicio_carga, fim,
+                                        args.intervalo_broadcast)
+        memoria = rss.parar()
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("servidor", "diretorio", "saida")},
+        "http": http,
+        "socketio": clientes,
+        "servidor_rss": memoria,
+    }
+
+
+def _resumo(resultado):
+    linhas = []
+    for rota, r in resultado["http"].items():
+        lat = r["latencia_ms"] or {}
+        linhas.append(f"/{rota}: {r['req_por_s']} req/s, {r['mb_por_s']} MB/s, p50 {lat.get('p50')} ms, "
+                      f"p99 {lat.get('p99')} ms, erros {r['erros']}")
+    c = resultado["socketio"]
+    atraso = c["atraso_entrega_ms"] or {}
+    linhas.append(f"socket.io: {c['conectados']} conectados ({c['falhas_conexao']} falhas), "
+                  f"{c['broadcasts']} broadcasts, entrega {c['entrega']}, atraso p50 {atraso.get('p50')} ms, "
+                  f"p99 {atraso.get('p99')} ms")
+    if resultado["servidor_rss"]:
+        linhas.append(f"RSS do servidor: pico {resultado['servidor_rss']['pico_mb']} MB")
+    return "\n".join(linhas)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Teste de carga offline do SwitchMap (HTTP + socket.io)")
+    parser.add_argument("--clientes", type=int, default=200, help="Clientes socket.io simultâneos")
+    parser.add_argument("--processos", type=int, default=2, help="Processos que dividem os clientes socket.io")
+    parser.add_argument("--taxa-conexao", type=float, default=50, help="Novas conexões por segundo na rampa")
+    parser.add_argument("--http-concorrencia", type=int, default=20, help="Requisições HTTP simultâneas")
+    parser.add_argument("--duracao", type=float, default=30, help="Segundos de carga após a rampa")
+    parser.add_argument("--hosts", type=int, default=1000, help="Hosts do dados.json sintético")
+    parser.add_argument("--intervalo-broadcast", type=float, default=2.0, help="Segundos entre varreduras simuladas")
+    parser.add_argument("--fracao-alterada", type=float, default=0.05, help="Fração de hosts alterada por varredura")
+    parser.add_argument("--porta", type=int, default=0, help="Porta do servidor (0 = livre)")
+    parser.add_argument("--saida", default="loadtest.json")
+    parser.add_argument("--servidor", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--diretorio", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.servidor:
+        servir(args)
+        sys.exit(0)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    resultado = executar(args)
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+    print(_resumo(resultado))
+    logger.info(f"Resultado gravado em {args.saida}")
@@ -0,0 +1,216 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+try:
+    from eventlet import patcher
+    # Com monkey_patch o QueueListener viraria uma green thread, e a escrita em disco e no
+    # console voltaria a parar o hub; a fila e a thread do listener usam os módulos originais
+    _threading = patcher.original("threading")
+    _queue = patcher.original("queue")
+except ImportError:
+    _threading = threading
+    _queue = queue
+
+TAMANHO_MAX_ARQUIVO = 10 * 1024 * 1024
+ARQUIVOS_ROTACIONADOS = 10
+TAMANHO_FILA = 10000
+FORMATO = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Mensagens por janela para cada (logger, modelo da mensagem) abaixo de WARNING; o excedente
+# é descartado e contado. Vale para mensagens por IP dos laços quentes (ping, ingestão...).
+LIMITE_PADRAO = (20, 60.0)
+
+_listener = None
+
+
+class CompressedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler que também rotaciona o arquivo na virada do dia e comprime os arquivos
+    rotacionados (app.log.1.gz, app.log.2.gz...).
+    """
+
+    def __init__(self, filename, max_bytes=TAMANHO_MAX_ARQUIVO, backup_count=ARQUIVOS_ROTACIONADOS,
+                 rotacionar_diariamente=True, encoding="utf-8"):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.rotacionar_diariamente = rotacionar_diariamente
+        self._dia = time.localtime().tm_yday
+        self.namer = lambda nome: nome + ".gz"
+        self.rotator = self._comprimir
+
+    @staticmethod
+    def _comprimir(origem, destino):
+        with open(origem, "rb") as entrada, gzip.open(destino, "wb") as saida:
+            shutil.copyfileobj(entrada, saida)
+        os.remove(origem)
+
+    def shouldRollover(self, record):
+        if self.rotacionar_diariamente and time.localtime().tm_yday != self._dia:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        self._dia = time.localtime().tm_yday
+        super().doRollover()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limita as mensagens abaixo de WARNING a `limite` por `janela` segundos para cada par
+    (logger, modelo da mensagem). Como o modelo é record.msg (antes da formatação), as
+    mensagens de um laço por IP ("IP %s offline") contam juntas. O número de descartadas
+    vai na próxima mensagem aceita (atributo `suprimidas`).
+    """
+
+    def __init__(self, limite=LIMITE_PADRAO, limites_por_logger=None):
+        super().__init__()
+        self.limite = limite
+        self.limites_por_logger = limites_por_logger or {}
+        self._contagens = {}  # (logger, msg) -> [início da janela, aceitas, suprimidas]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        limite, janela = self.limites_por_logger.get(record.name, self.limite)
+        if limite is None:
+            return True
+        chave = (record.name, record.msg if isinstance(record.msg, str) else id(record.msg))
+        agora = record.created
+        with self._lock:
+            contagem = self._contagens.get(chave)
+            if contagem is None or agora - contagem[0] >= janela:
+                suprimidas = contagem[2] if contagem else 0
+                self._contagens[chave] = [agora, 1, 0]
+                if len(self._contagens) > 10000:  # modelos gerados dinamicamente (f-strings)
+                    self._contagens = {chave: self._contagens[chave]}
+            elif contagem[1] < limite:
+                contagem[1] += 1
+                suprimidas = contagem[2]
+                contagem[2] = 0
+            else:
+                contagem[2] += 1
+                return False
+        if suprimidas:
+            record.suprimidas = suprimidas
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloqueia nem formata na thread que loga: o registro vai para a
+    fila como está (a mensagem só é montada a partir de msg/args no listener) e, com a
+    fila cheia, é descartado e contado.
+    """
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.descartadas = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except _queue.Full:
+            self.descartadas += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formato texto de sempre, acrescido dos campos estruturados do registro (passados em
+    extra=, ex.: extra={"ip": ip}) e da contagem de mensagens suprimidas pelo limite.
+    Com json_lines=True gera uma linha JSON por registro.
+    """
+
+    CAMPOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def __init__(self, fmt=FORMATO, json_lines=False):
+        super().__init__(fmt)
+        self.json_lines = json_lines
+
+    def _campos(self, record):
+        return {k: v for k, v in vars(record).items() if k not in self.CAMPOS_PADRAO}
+
+    def format(self, record):
+        campos = self._campos(record)
+        if self.json_lines:
+            dados = {"ts": record.created, "nivel": record.levelname, "logger": record.name,
+                     "mensagem": record.getMessage(), **campos}
+            if record.exc_info:
+                dados["excecao"] = self.formatException(record.exc_info)
+            return json.dumps(dados, ensure_ascii=False, default=str)
+        texto = super().format(record)
+        if campos:
+            texto += " | " + " ".join(f"{k}={v}" for k, v in campos.items())
+        return texto
+
+
+class RealThreadQueueListener(logging.handlers.QueueListener):
+    """QueueListener cuja thread é sempre uma thread do SO, mesmo com o eventlet aplicado."""
+
+    def start(self):
+        self._thread = _threading.Thread(target=self._monitor, name="log-listener", daemon=True)
+        self._thread.start()
+
+
+def configure_logging(arquivo, level=logging.INFO, limites_por_logger=None, json_lines=False,
+                      max_bytes=TAMANHO_MAX_ARQUIVO, backup_count=ARQUIVOS_ROTACIONADOS):
+    """
+    Configuração de logging comum aos serviços do websocket.
+
+    O root logger recebe só um NonBlockingQueueHandler (com o RateLimitFilter); a escrita no
+    arquivo (rotação por tamanho e por dia, com compressão) e no console acontece numa thread
+    separada (QueueListener), então logar nunca espera por disco.
+
+    O nível pode ser trocado sem alterar código pela variável SWITCHMAP_LOG_LEVEL.
+    """
+    global _listener
+    _parar()
+
+    level = os.environ.get("SWITCHMAP_LOG_LEVEL") or level
+    if isinstance(level, str):
+        level = level.strip().upper()
+        if not isinstance(logging.getLevelName(level), int):
+            print(f"SWITCHMAP_LOG_LEVEL inválido ({level}), usando INFO", file=sys.stderr)
+            level = logging.INFO
+    formatter = StructuredFormatter(json_lines=json_lines)
+    arquivo_handler = CompressedRotatingFileHandler(arquivo, max_bytes=max_bytes, backup_count=backup_count)
+    console_handler = logging.StreamHandler(sys.stdout)
+    for handler in (arquivo_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    fila = _queue.Queue(maxsize=TAMANHO_FILA)
+    queue_handler = NonBlockingQueueHandler(fila)
+    queue_handler.addFilter(RateLimitFilter(limites_por_logger=limites_por_logger))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = RealThreadQueueListener(fila, arquivo_handler, console_handler,
+                                        respect_handler_level=True)
+    _listener.start()
+    return queue_handler
+
+
+@atexit.register
+def _parar():
+    """Esvazia a fila e fecha os arquivos na saída do processo."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
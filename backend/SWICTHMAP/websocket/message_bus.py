@@ -0,0 +1,350 @@
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+except ImportError:  # Dependência opcional, só necessária com redis://
+    redis = None
+
+DEFAULT_BUS_URL = "unix:///tmp/switchmap_bus.sock" if hasattr(socket, "AF_UNIX") else "tcp://127.0.0.1:5100"
+
+_HEADER = struct.Struct("!I")
+
+
+def _encode_frame(topic, payload):
+    """Serializa uma mensagem do barramento em um frame com prefixo de tamanho."""
+    body = json.dumps({"topic": topic, "payload": payload}, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(body)) + body
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(size - len(buffer))
+        if not chunk:
+            return None
+        buffer.extend(chunk)
+    return bytes(buffer)
+
+
+def _read_frame(sock):
+    """Lê um frame do socket. Retorna (topic, payload, raw) ou None se a conexão caiu."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    body = _recv_exact(sock, _HEADER.unpack(header)[0])
+    if body is None:
+        return None
+    message = json.loads(body.decode("utf-8"))
+    return message["topic"], message["payload"], header + body
+
+
+class _BaseBus:
+    """Registro de assinantes comum a todas as implementações do barramento."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._subscribers_lock = threading.Lock()
+
+    def subscribe(self, topic, callback):
+        with self._subscribers_lock:
+            self._subscribers[topic].append(callback)
+
+    def _dispatch(self, topic, payload):
+        with self._subscribers_lock:
+            callbacks = list(self._subscribers.get(topic, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Erro no assinante do tópico '{topic}': {str(e)}", exc_info=True)
+
+    def publish(self, topic, payload):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class InProcessBus(_BaseBus):
+    """Barramento dentro do próprio processo (modo de nó único, sem workers)."""
+
+    def publish(self, topic, payload):
+        self._dispatch(topic, payload)
+
+
+class SocketBus(_BaseBus):
+    """
+    Barramento sobre Unix domain socket (ou TCP em loopback quando AF_UNIX não existe).
+
+    O processo dono do estado roda como hub (serve=True): cada mensagem publicada é
+    serializada uma única vez e o mesmo frame é repassado a todos os workers conectados.
+    Mensagens publicadas por um worker chegam ao hub, são entregues aos assinantes locais
+    e retransmitidas aos demais workers.
+    """
+
+    def __init__(self, address, serve=False, reconnect_interval=1.0):
+        super().__init__()
+        self.address = address
+        self.serve = serve
+        self.reconnect_interval = reconnect_interval
+        self._family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self._peers = {}
+        self._peers_lock = threading.Lock()
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._closed = False
+        if serve:
+            self._start_hub()
+        else:
+            self._connected = threading.Event()
+            threading.Thread(target=self._client_loop, daemon=True).start()
+
+    # --- Hub (processo dono do estado) ---
+
+    def _start_hub(self):
+        if self._family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._sock = socket.socket(self._family, socket.SOCK_STREAM)
+        if self._family == socket.AF_INET:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(self.address)
+        self._sock.listen(64)
+        logger.info(f"Barramento de mensagens escutando em {self.address}")
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                break
+            with self._peers_lock:
+                self._peers[conn] = threading.Lock()
+            logger.info(f"Worker conectado ao barramento ({len(self._peers)} conectados)")
+            threading.Thread(target=self._peer_loop, args=(conn,), daemon=True).start()
+
+    def _peer_loop(self, conn):
+        try:
+            while True:
+                frame = _read_frame(conn)
+                if frame is None:
+                    break
+                topic, payload, raw = frame
+                self._dispatch(topic, payload)
+                self._relay(raw, exclude=conn)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Conexão com worker encerrada: {str(e)}")
+        finally:
+            self._drop_peer(conn)
+
+    def _drop_peer(self, conn):
+        with self._peers_lock:
+            self._peers.pop(conn, None)
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def _relay(self, raw, exclude=None):
+        with self._peers_lock:
+            peers = list(self._peers.items())
+        for conn, lock in peers:
+            if conn is exclude:
+                continue
+            try:
+                with lock:
+                    conn.sendall(raw)
+            except OSError as e:
+                logger.warning(f"Falha ao enviar para worker, removendo: {str(e)}")
+                self._drop_peer(conn)
+
+    # --- Cliente (workers) ---
+
+    def _client_loop(self):
+        while not self._closed:
+            try:
+                sock = socket.socket(self._family, socket.SOCK_STREAM)
+                sock.connect(self.address)
+            except OSError:
+                time.sleep(self.reconnect_interval)
+                continue
+            self._sock = sock
+            self._connected.set()
+            logger.info(f"Conectado ao barramento em {self.address}")
+            self._dispatch("bus_connected", {})
+            try:
+                while True:
+                    frame = _read_frame(sock)
+                    if frame is None:
+                        break
+                    topic, payload, _ = frame
+                    self._dispatch(topic, payload)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Conexão com o barramento perdida: {str(e)}")
+            self._connected.clear()
+            self._sock = None
+            try:
+                sock.close()
+            except OSError:
+                pass
+            time.sleep(self.reconnect_interval)
+
+    def wait_connected(self, timeout=None):
+        return self.serve or self._connected.wait(timeout)
+
+    # --- API comum ---
+
+    def publish(self, topic, payload):
+        raw = _encode_frame(topic, payload)
+        if self.serve:
+            self._dispatch(topic, payload)
+            self._relay(raw)
+            return
+        sock = self._sock
+        if sock is None:
+            logger.warning(f"Barramento desconectado, mensagem '{topic}' descartada")
+            return
+        try:
+            with self._send_lock:
+                sock.sendall(raw)
+        except OSError as e:
+            logger.warning(f"Falha ao publicar '{topic}' no barramento: {str(e)}")
+
+    def close(self):
+        self._closed = True
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        with self._peers_lock:
+            peers = list(self._peers)
+        for conn in peers:
+            self._drop_peer(conn)
+
+
+class LocalRedisClient:
+    """
+    Substituto local mínimo de um cliente Redis (apenas publish/pubsub com psubscribe).
+
+    Permite exercitar o RedisBus sem um servidor Redis; instâncias de RedisBus que
+    compartilham o mesmo LocalRedisClient se comportam como processos ligados ao mesmo Redis.
+    """
+
+    def __init__(self):
+        self._pubsubs = []
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        if isinstance(channel, str):
+            channel = channel.encode("utf-8")
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        with self._lock:
+            pubsubs = list(self._pubsubs)
+        delivered = 0
+        for pubsub in pubsubs:
+            delivered += pubsub._deliver(channel, message)
+        return delivered
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        pubsub = _LocalPubSub()
+        with self._lock:
+            self._pubsubs.append(pubsub)
+        return pubsub
+
+
+class _LocalPubSub:
+    def __init__(self):
+        self._prefixes = []
+        self._queue = deque()
+        self._available = threading.Condition()
+
+    def psubscribe(self, *patterns):
+        for pattern in patterns:
+            self._prefixes.append(pattern.rstrip("*").encode("utf-8"))
+
+    def _deliver(self, channel, message):
+        if not any(channel.startswith(prefix) for prefix in self._prefixes):
+            return 0
+        with self._available:
+            self._queue.append({"type": "pmessage", "channel": channel, "data": message})
+            self._available.notify()
+        return 1
+
+    def listen(self):
+        while True:
+            with self._available:
+                while not self._queue:
+                    self._available.wait()
+                message = self._queue.popleft()
+            yield message
+
+    def close(self):
+        pass
+
+
+class RedisBus(_BaseBus):
+    """Barramento sobre pub/sub de um servidor compatível com Redis."""
+
+    def __init__(self, url=None, client=None, channel_prefix="switchmap:"):
+        super().__init__()
+        if client is None:
+            if redis is None:
+                raise RuntimeError("Pacote 'redis' não instalado; use outro barramento ou instale redis")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = channel_prefix
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.psubscribe(f"{channel_prefix}*")
+        threading.Thread(target=self._listen_loop, daemon=True).start()
+
+    def _listen_loop(self):
+        try:
+            for message in self._pubsub.listen():
+                if message.get("type") != "pmessage":
+                    continue
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode("utf-8")
+                payload = json.loads(message["data"])
+                self._dispatch(channel[len(self._prefix):], payload)
+        except Exception as e:
+            logger.error(f"Assinatura Redis encerrada: {str(e)}", exc_info=True)
+
+    def publish(self, topic, payload):
+        # O próprio Redis entrega a mensagem de volta a este processo, não despachamos localmente
+        self._client.publish(f"{self._prefix}{topic}", json.dumps(payload, ensure_ascii=False))
+
+    def close(self):
+        self._pubsub.close()
+
+
+def create_bus(url=None, serve=False):
+    """
+    Cria o barramento a partir de uma URL.
+
+    Formatos aceitos: inproc://, unix:///caminho.sock, tcp://host:porta, redis://host:porta/db.
+    Para unix:// e tcp://, serve=True cria o hub (processo dono do estado).
+    """
+    url = url or DEFAULT_BUS_URL
+    parsed = urlparse(url)
+    if parsed.scheme == "inproc":
+        return InProcessBus()
+    if parsed.scheme == "unix":
+        return SocketBus(parsed.path, serve=serve)
+    if parsed.scheme == "tcp":
+        return SocketBus((parsed.hostname, parsed.port), serve=serve)
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisBus(url)
+    raise ValueError(f"Esquema de barramento não suportado: {url}")
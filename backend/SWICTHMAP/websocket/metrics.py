@@ -0,0 +1,346 @@
+import bisect
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from eventlet import patcher
+    # Métricas também são atualizadas de threads reais do SO (ex.: a sondagem da varredura, via
+    # tpool); as seções protegidas são curtas e sem I/O, então um lock do SO não trava o hub
+    _Lock = patcher.original("threading").Lock
+except ImportError:
+    _Lock = threading.Lock
+
+try:
+    import greenlet
+except ImportError:  # Sem eventlet/greenlet só as threads do SO têm pilha nos donos do lock
+    greenlet = None
+
+logger = logging.getLogger(__name__)
+
+# Buckets padrão (segundos): de 0,5 ms a 1 min
+BUCKETS_TEMPO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Medidas caras (ex.: tamanho serializado dos eventos) só são feitas se houve coleta de /metrics
+# nos últimos JANELA_COLETA_ATIVA segundos; sem ninguém coletando, sobram só incrementos.
+JANELA_COLETA_ATIVA = 300
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _formatar_numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos=(), registry=None):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}  # tupla de valores dos rótulos -> valor
+        self._lock = _Lock()
+        (registry or REGISTRY).registrar(self)
+
+    def _chave(self, rotulos):
+        if len(rotulos) != len(self.rotulos):
+            raise ValueError(f"{self.nome} espera os rótulos {self.rotulos}, recebeu {rotulos}")
+        return rotulos
+
+    def render(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            itens = sorted(self._valores.items(), key=lambda item: tuple(map(str, item[0])))
+        for chave, valor in itens:
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}")
+        return linhas
+
+
+class Counter(_Metrica):
+    """Contador monotônico: counter.inc(*rotulos, valor=1)"""
+    tipo = "counter"
+
+    def inc(self, *rotulos, valor=1):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def total(self):
+        """Soma de todas as séries (todos os valores de rótulo)."""
+        with self._lock:
+            return sum(self._valores.values())
+
+
+class Gauge(_Metrica):
+    """Valor instantâneo: set()/inc()/dec()"""
+    tipo = "gauge"
+
+    def set(self, valor, *rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def inc(self, *rotulos, valor=1):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def dec(self, *rotulos, valor=1):
+        self.inc(*rotulos, valor=-valor)
+
+
+class Histogram(_Metrica):
+    """
+    Histograma com buckets fixos: histogram.observe(valor, *rotulos), ou
+    `with histogram.time(*rotulos):` para medir a duração de um bloco.
+    """
+    tipo = "histogram"
+
+    def __init__(self, nome, ajuda, rotulos=(), buckets=BUCKETS_TEMPO, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(nome, ajuda, rotulos, registry)
+
+    def observe(self, valor, *rotulos):
+        chave = self._chave(rotulos)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._valores.get(chave)
+            if serie is None:
+                serie = self._valores[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def total(self, *rotulos):
+        """(soma, contagem) das observações da série."""
+        with self._lock:
+            serie = self._valores.get(self._chave(rotulos))
+            return (serie[1], serie[2]) if serie is not None else (0.0, 0)
+
+    @contextmanager
+    def time(self, *rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, *rotulos)
+
+    def render(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            itens = sorted(((k, ([*v[0]], v[1], v[2])) for k, v in self._valores.items()),
+                           key=lambda item: tuple(map(str, item[0])))
+        for chave, (contagens, soma, total) in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                le = f'le="{_formatar_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, le)} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, chave)
+            linhas.append(f"{self.nome}_sum{rotulos} {_formatar_numero(soma)}")
+            linhas.append(f"{self.nome}_count{rotulos} {total}")
+        return linhas
+
+
+class Registry:
+    """Conjunto de métricas de um processo, exportado no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._metricas = []
+        self._lock = _Lock()
+        self.ultima_coleta = None
+
+    def registrar(self, metrica):
+        with self._lock:
+            self._metricas.append(metrica)
+
+    def coleta_ativa(self):
+        """True se /metrics foi coletado recentemente (vale a pena fazer as medidas caras)."""
+        return self.ultima_coleta is not None and time.monotonic() - self.ultima_coleta < JANELA_COLETA_ATIVA
+
+    def render(self):
+        self.ultima_coleta = time.monotonic()
+        with self._lock:
+            metricas = list(self._metricas)
+        linhas = []
+        for metrica in metricas:
+            linhas.extend(metrica.render())
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- métricas comuns aos serviços ---
+
+STAGE_SECONDS = Histogram(
+    "switchmap_stage_duration_seconds",
+    "Duração de cada etapa da varredura de ping e da publicação do estado",
+    ("stage",))
+SWEEP_SECONDS = Histogram(
+    "switchmap_sweep_duration_seconds", "Duração total de cada varredura de ping")
+PROBES_SENT = Counter("switchmap_probes_sent_total", "Pacotes ICMP enviados", ("tipo",))
+PROBES_LOST = Counter("switchmap_probes_lost_total", "Pacotes ICMP sem resposta", ("tipo",))
+PROBE_ERRORS = Counter("switchmap_probe_errors_total", "Pings que falharam com exceção", ("tipo",))
+LOCK_WAIT_SECONDS = Histogram(
+    "switchmap_rwlock_wait_seconds", "Espera para adquirir o RWLock do DataManager", ("modo",))
+LOCK_HOLD_SECONDS = Histogram(
+    "switchmap_rwlock_hold_seconds", "Tempo com o RWLock do DataManager adquirido", ("modo",))
+WS_EMITS = Counter("switchmap_ws_emits_total", "Eventos socket.io emitidos", ("event",))
+WS_EMITTED_BYTES = Counter(
+    "switchmap_ws_emitted_bytes_total",
+    "Bytes (JSON) dos eventos socket.io emitidos; só medido enquanto /metrics está sendo coletado",
+    ("event",))
+WS_CLIENTS = Gauge("switchmap_ws_connected_clients", "Clientes socket.io conectados")
+HTTP_SECONDS = Histogram(
+    "switchmap_http_request_duration_seconds", "Latência das rotas HTTP", ("method", "route", "status"))
+HTTP_RESPONSE_BYTES = Histogram(
+    "switchmap_http_response_bytes", "Tamanho das respostas HTTP (sem as respostas em streaming)",
+    ("method", "route"), buckets=BUCKETS_BYTES)
+DNS_SECONDS = Histogram(
+    "switchmap_dns_resolution_seconds", "Duração das consultas de DNS reverso dos clientes", ("resultado",))
+
+
+def _quem():
+    """(ident, nome da thread, greenlet atual ou None) de quem está executando."""
+    return (threading.get_ident(), threading.current_thread().name,
+            greenlet.getcurrent() if greenlet is not None else None)
+
+
+class _LockMedido:
+    """
+    Um dos lados (leitura/escrita) do RWLock, medindo espera e tempo de posse e mantendo quem
+    espera e quem detém o lock agora (para diagnóstico de travamentos).
+    """
+
+    def __init__(self, lock, modo):
+        self._lock = lock
+        self.modo = modo
+        self._local = threading.local()
+        self.esperando = {}  # ident -> (desde, nome, greenlet)
+        self.donos = {}      # ident -> (desde, nome, greenlet)
+
+    def __enter__(self):
+        inicio = time.perf_counter()
+        quem = _quem()
+        self.esperando[quem[0]] = (inicio, *quem[1:])
+        try:
+            self._lock.__enter__()
+        finally:
+            self.esperando.pop(quem[0], None)
+        adquirido = time.perf_counter()
+        LOCK_WAIT_SECONDS.observe(adquirido - inicio, self.modo)
+        pilha = getattr(self._local, "pilha", None)
+        if pilha is None:
+            pilha = self._local.pilha = []
+        if not pilha:
+            self.donos[quem[0]] = (adquirido, *quem[1:])
+        pilha.append(adquirido)
+        return self
+
+    def __exit__(self, *exc):
+        pilha = self._local.pilha
+        adquirido = pilha.pop()
+        if not pilha:
+            self.donos.pop(threading.get_ident(), None)
+        try:
+            return self._lock.__exit__(*exc)
+        finally:
+            LOCK_HOLD_SECONDS.observe(time.perf_counter() - adquirido, self.modo)
+
+
+class MeasuredRWLock:
+    """RWLock com a mesma interface (reader_lock/writer_lock) que registra espera e posse."""
+
+    def __init__(self, rwlock):
+        self.rwlock = rwlock
+        self.reader_lock = _LockMedido(rwlock.reader_lock, "reader")
+        self.writer_lock = _LockMedido(rwlock.writer_lock, "writer")
+
+    def owners(self):
+        """
+        Quem detém e quem espera cada lado do lock agora:
+        [{modo, situacao (dono/esperando), thread, segundos, frame}], com o frame atual de cada
+        thread do SO ou greenlet parado (None se não for possível obtê-lo).
+        """
+        agora = time.perf_counter()
+        frames = sys._current_frames()
+        resultado = []
+        for lado in (self.writer_lock, self.reader_lock):
+            for situacao, registros in (("dono", lado.donos), ("esperando", lado.esperando)):
+                for ident, (desde, nome, gr) in list(registros.items()):
+                    frame = frames.get(ident)
+                    if frame is None and gr is not None:
+                        frame = gr.gr_frame
+                    resultado.append({"modo": lado.modo, "situacao": situacao, "thread": nome,
+                                      "segundos": round(agora - desde, 3), "frame": frame})
+        return resultado
+
+
+def medir_emissao(evento, payload):
+    """Conta um evento socket.io emitido e, se há coleta ativa, o seu tamanho em JSON."""
+    WS_EMITS.inc(evento)
+    if REGISTRY.coleta_ativa():
+        try:
+            WS_EMITTED_BYTES.inc(evento, valor=len(json.dumps(payload, ensure_ascii=False, default=str)))
+        except (TypeError, ValueError):
+            pass
+
+
+def instrumentar_socketio(socketio):
+    """Passa todo socketio.emit (inclusive o emit() dos handlers) por medir_emissao."""
+    emit_original = socketio.emit
+
+    def emit(event, *args, **kwargs):
+        medir_emissao(event, args[0] if args else kwargs.get("data"))
+        return emit_original(event, *args, **kwargs)
+
+    socketio.emit = emit
+    return socketio
+
+
+def register_metrics(app, socketio=None, limiter=None):
+    """
+    Expõe GET /metrics (formato texto do Prometheus) e mede latência e tamanho da resposta de
+    todas as rotas do app; com socketio, também os eventos emitidos. Com limiter, /metrics fica
+    fora dos limites padrão (a coleta periódica não consome a cota dos clientes).
+    """
+    from flask import Response, g, request
+
+    @app.before_request
+    def _inicio_requisicao():
+        g.metrics_inicio = time.perf_counter()
+
+    @app.after_request
+    def _fim_requisicao(response):
+        inicio = g.pop("metrics_inicio", None)
+        if inicio is not None:
+            rota = request.url_rule.rule if request.url_rule is not None else "desconhecida"
+            HTTP_SECONDS.observe(time.perf_counter() - inicio, request.method, rota, response.status_code)
+            if not response.is_streamed:
+                HTTP_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, request.method, rota)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    if limiter is not None:
+        limiter.exempt(metrics)
+
+    if socketio is not None:
+        instrumentar_socketio(socketio)
@@ -1,15 +1,31 @@
 import asyncio
-from icmplib import async_ping
 import time
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import uuid
 import logging
 import os
 from typing import Dict, List, Tuple, Set
 from datetime import datetime
 from flask_socketio import SocketIO  # ALTERAÇÃO: Importar SocketIO
+from metrics import STAGE_SECONDS, SWEEP_SECONDS, PROBES_SENT, PROBES_LOST, PROBE_ERRORS
+from probers import IcmpProber
+
+try:
+    from eventlet import tpool
+    from eventlet.patcher import is_monkey_patched
+except ImportError:  # Sem eventlet as threads já são do SO
+    tpool = None
 
 logger = logging.getLogger(__name__)
 
+# Backend de ping usado por verificar_ping; trocado por set_prober (ex.: FakeProber nos benchmarks)
+_prober = IcmpProber()
+
+def set_prober(prober) -> None:
+    """Troca o backend de ping (qualquer objeto com `async probe(ip, count, timeout)`)."""
+    global _prober
+    _prober = prober
+
 async def verificar_ping(ip: str, is_priority: bool = False) -> Tuple[str, int]:
     """
     Verifica o status de um IP via ping.
@@ -25,14 +41,18 @@ async def verificar_ping(ip: str, is_priority: bool = False) -> Tuple[str, int]:
     """
     attempts = 3 if is_priority else 2
     timeout = 1 if is_priority else 2
+    tipo = "prioritario" if is_priority else "normal"
     try:
-        result = await async_ping(ip, count=attempts, timeout=timeout, privileged=False)
+        result = await _prober.probe(ip, attempts, timeout)
+        PROBES_SENT.inc(tipo, valor=result.packets_sent)
+        PROBES_LOST.inc(tipo, valor=result.packets_sent - result.packets_received)
         if result.is_alive:
             return "#00d700", int(result.avg_rtt)  # Online
-        logger.debug(f"IP {ip} offline: tempo_resposta=-1")  # ALTERAÇÃO: Log para IPs offline
+        logger.debug("IP offline: tempo_resposta=-1", extra={"ip": ip})  # ALTERAÇÃO: Log para IPs offline
         return "red", -1  # Offline
     except Exception as e:
-        logger.debug(f"Ping {ip}: ERRO - {str(e)}")
+        PROBE_ERRORS.inc(tipo)
+        logger.debug("Erro no ping: %s", e, extra={"ip": ip})
         return "red", -1
 
 async def processar_chunk(chunk: List[Dict], priority_ips_set: Set[str]) -> Dict[str, Tuple[str, int]]:
@@ -63,102 +83,314 @@ async def processar_chunk(chunk: List[Dict], priority_ips_set: Set[str]) -> Dict
     results = await asyncio.gather(*tasks)
     return dict(zip(ip_map, results))
 
-def init_ping_service(data_manager, socketio: SocketIO) -> None:  # ALTERAÇÃO: Adicionar socketio como parâmetro
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+async def processar_chunks(chunks: List[List[Dict]], priority_ips_set: Set[str], max_workers: int) -> Dict[str, Tuple[str, int]]:
+    """Pinga os chunks num único event loop, com até max_workers chunks em andamento."""
+    semaforo = asyncio.Semaphore(max_workers)
+
+    async def processar(chunk):
+        async with semaforo:
+            return await processar_chunk(chunk, priority_ips_set)
+
+    resultados = {}
+    for parcial in await asyncio.gather(*(processar(chunk) for chunk in chunks)):
+        resultados.update(parcial)
+    return resultados
+
+def sondar_em_thread_real(chunks: List[List[Dict]], priority_ips_set: Set[str], max_workers: int) -> Dict[str, Tuple[str, int]]:
+    """
+    Roda processar_chunks num event loop próprio. Com o monkey_patch do eventlet todas as
+    threads são green threads de uma única thread do SO, onde o loop do ping sob demanda já
+    está rodando (e asyncio.run recusaria um segundo); por isso o loop vai para o tpool.
+    """
+    def executar():
+        return asyncio.run(processar_chunks(chunks, priority_ips_set, max_workers))
+
+    if tpool is not None and is_monkey_patched("thread"):
+        return tpool.execute(executar)
+    return executar()
+
+JANELA_COALESCENCIA = 5.0   # segundos em que um resultado recente atende novos pedidos do mesmo IP
+JANELA_APLICACAO = 0.25     # segundos em que resultados sob demanda são juntados numa única transação
+TTL_TICKET = 300            # segundos que um ticket fica disponível para consulta
+MAX_PINGS_SIMULTANEOS = 64
+MAX_IPS_POR_PEDIDO = 100
+
+def separar_ips_conhecidos(data_manager, ips: List) -> Tuple[List[str], List]:
+    """Divide os IPs pedidos em (hosts conhecidos, rejeitados), sem repetições."""
+    aceitos, rejeitados = [], []
+    for ip in dict.fromkeys(ip for ip in ips if isinstance(ip, str)):
+        (aceitos if ip in data_manager.hosts_by_ip else rejeitados).append(ip)
+    rejeitados.extend(ip for ip in ips if not isinstance(ip, str))
+    return aceitos, rejeitados
+
+class PingTickets:
+    """Tickets de pedidos de ping sob demanda e os resultados que já chegaram para cada um."""
+
+    def __init__(self, ttl: float = TTL_TICKET):
+        self.ttl = ttl
+        self._tickets: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def criar(self, ips: List[str], ticket: str = None) -> str:
+        ticket = ticket or uuid.uuid4().hex
+        agora = time.time()
+        with self._lock:
+            for antigo in [t for t, info in self._tickets.items() if agora - info["criado"] > self.ttl]:
+                del self._tickets[antigo]
+            self._tickets[ticket] = {"criado": agora, "resultados": {ip: None for ip in ips}}
+        return ticket
+
+    def registrar(self, resultado: Dict) -> None:
+        """Guarda um resultado de ping nos tickets que o aguardavam."""
+        with self._lock:
+            for ticket in resultado.get("tickets", []):
+                info = self._tickets.get(ticket)
+                if info is not None:
+                    info["resultados"][resultado["ip"]] = {
+                        k: resultado[k] for k in ("ativo", "tempo_resposta", "ts")
+                    }
+
+    def status(self, ticket: str):
+        """{ticket, pendentes, resultados: {ip: {ativo, tempo_resposta, ts} ou None}}, ou None."""
+        with self._lock:
+            info = self._tickets.get(ticket)
+            if info is None:
+                return None
+            resultados = dict(info["resultados"])
+        return {
+            "ticket": ticket,
+            "pendentes": sum(1 for r in resultados.values() if r is None),
+            "resultados": resultados,
+        }
+
+class OnDemandPinger:
+    """
+    Ping sob demanda (faixa rápida), fora do ciclo de varredura.
+
+    request() só enfileira e retorna um ticket: os pings rodam num event loop próprio, em
+    outra thread, com os parâmetros dos IPs prioritários. Pedidos para um IP que já está sendo
+    pingado aguardam o mesmo ping, e pedidos feitos até JANELA_COALESCENCIA segundos depois
+    de um resultado recebem esse resultado sem novo ping.
+
+    Os resultados que chegam dentro de JANELA_APLICACAO segundos são aplicados juntos numa
+    única transação do DataManager (uma gravação e um delta com os hosts que mudaram) e depois
+    publicados como 'ping_result' com os tickets atendidos.
+    """
+
+    def __init__(self, data_manager, tickets: PingTickets = None, janela: float = JANELA_COALESCENCIA):
+        self.data_manager = data_manager
+        self.tickets = tickets or PingTickets()
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._em_andamento: Dict[str, List[str]] = {}       # ip -> tickets aguardando
+        self._recentes: Dict[str, Tuple[float, str, int]] = {}  # ip -> (ts, status, tempo)
+        self._loop = asyncio.new_event_loop()
+        self._semaforo = None
+        self._pendentes: List[Dict] = []  # resultados aguardando a próxima aplicação (só no loop)
+
+    def start(self):
+        threading.Thread(target=self._executar_loop, name="ping-sob-demanda", daemon=True).start()
+        return self
+
+    def _executar_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._semaforo = asyncio.Semaphore(MAX_PINGS_SIMULTANEOS)
+        self._loop.run_forever()
+
+    def request(self, ips: List[str], ticket: str = None) -> Dict:
+        """
+        Enfileira o ping dos IPs e retorna imediatamente.
+
+        Returns:
+            {ticket, ips, coalescidos}: coalescidos são os IPs atendidos por um ping já em
+            andamento ou por um resultado recente
+        """
+        ips = list(dict.fromkeys(ips))
+        ticket = self.tickets.criar(ips, ticket)
+        agora = time.time()
+        coalescidos = []
+        imediatos = []
+        with self._lock:
+            for ip in ips:
+                recente = self._recentes.get(ip)
+                if ip in self._em_andamento:
+                    self._em_andamento[ip].append(ticket)
+                    coalescidos.append(ip)
+                elif recente is not None and agora - recente[0] < self.janela:
+                    imediatos.append(self._resultado(ip, recente, [ticket]))
+                    coalescidos.append(ip)
+                else:
+                    self._em_andamento[ip] = [ticket]
+                    asyncio.run_coroutine_threadsafe(self._sondar(ip), self._loop)
+        for resultado in imediatos:
+            self._publicar(resultado)
+        logger.info("Ping sob demanda: %d IPs, %d coalescidos", len(ips), len(coalescidos), extra={"ticket": ticket})
+        return {"ticket": ticket, "ips": ips, "coalescidos": coalescidos}
+
+    async def _sondar(self, ip: str) -> None:
+        async with self._semaforo:
+            status, tempo = await verificar_ping(ip, is_priority=True)
+        medicao = (time.time(), status, tempo)
+        with self._lock:
+            self._recentes[ip] = medicao
+            tickets = self._em_andamento.pop(ip, [])
+            for antigo in [i for i, r in self._recentes.items() if medicao[0] - r[0] > self.janela]:
+                del self._recentes[antigo]
+        if not self._pendentes:
+            self._loop.call_later(JANELA_APLICACAO, self._descarregar)
+        self._pendentes.append(self._resultado(ip, medicao, tickets))
+
+    def _descarregar(self) -> None:
+        resultados, self._pendentes = self._pendentes, []
+        try:
+            self._aplicar(resultados)
+        except Exception as e:
+            logger.error("Erro ao aplicar ping sob demanda: %s", e, extra={"ips": len(resultados)})
+        for resultado in resultados:
+            self._publicar(resultado)
+
+    def _aplicar(self, resultados: List[Dict]) -> None:
+        with self.data_manager.transaction() as txn:
+            for resultado in resultados:
+                ip, status, tempo = resultado["ip"], resultado["ativo"], resultado["tempo_resposta"]
+                host = txn.get_host(ip)
+                if host is not None and (host.get("ativo"), host.get("tempo_resposta")) != (status, tempo):
+                    host = txn.edit_host(ip)
+                    host["ativo"] = status
+                    host["tempo_resposta"] = tempo
+
+    @staticmethod
+    def _resultado(ip: str, medicao: Tuple[float, str, int], tickets: List[str]) -> Dict:
+        ts, status, tempo = medicao
+        return {"ip": ip, "ativo": status, "tempo_resposta": tempo, "ts": ts, "tickets": tickets}
+
+    def _publicar(self, resultado: Dict) -> None:
+        self.tickets.registrar(resultado)
+        self.data_manager.report_ping(resultado)
+
+    def ticket_status(self, ticket: str):
+        return self.tickets.status(ticket)
+
+class RemotePingRequester:
+    """
+    Mesma interface de OnDemandPinger para os workers: o pedido vai ao dono do estado pelo
+    barramento (tópico ping_request) e os resultados voltam pelo tópico ping_result.
+    """
+
+    def __init__(self, bus, tickets: PingTickets = None):
+        self.bus = bus
+        self.tickets = tickets or PingTickets()
+        bus.subscribe("ping_result", self.tickets.registrar)
+
+    def request(self, ips: List[str], ticket: str = None) -> Dict:
+        ips = list(dict.fromkeys(ips))
+        ticket = self.tickets.criar(ips, ticket)
+        self.bus.publish("ping_request", {"ticket": ticket, "ips": ips})
+        return {"ticket": ticket, "ips": ips, "coalescidos": []}
+
+    def ticket_status(self, ticket: str):
+        return self.tickets.status(ticket)
+
+def _com_ping(item: Dict, ping_results: Dict[str, Tuple[str, int]], online: List[str]) -> Dict:
+    """Host ou conexão com o resultado do ping (cópia só se mudou); IPs online vão para `online`."""
+    resultado = ping_results.get(item.get("ip"))
+    if resultado is None:
+        return item
+    if resultado[0] == "#00d700":
+        online.append(item["ip"])
+    if (item.get("ativo"), item.get("tempo_resposta")) == resultado:
+        return item
+    return {**item, "ativo": resultado[0], "tempo_resposta": resultado[1]}
+
+def executar_varredura(data_manager, max_workers: int = 4, chunk_size: int = 50):
+    """
+    Uma varredura completa: pinga todos os hosts e conexões e grava o resultado no DataManager.
+
+    Returns:
+        {duracao, hosts, ips, online, prioritarios}, ou None se não houver hosts
+    """
+    start_time = time.time()
+    with STAGE_SECONDS.time("get_data"):
+        dados = data_manager.get_data()
+    hosts_originais = dados.get("hosts", [])
+    priority_ips = dados.get("priority_ips", {})
+    priority_ips_set = set(priority_ips.keys())
+    
+    if not hosts_originais:
+        logger.warning("Nenhum host encontrado para processar")
+        return None
+
+    logger.info(f"Iniciando atualização de pings para {len(hosts_originais)} hosts")
+    
+    hosts_para_processar = hosts_originais.copy()
+    ping_results = {}
+    inicio_sondagem = time.perf_counter()
+    
+    chunks = [hosts_para_processar[i:i + chunk_size] for i in range(0, len(hosts_para_processar), chunk_size)]
+    ping_results.update(sondar_em_thread_real(chunks, priority_ips_set, max_workers))
+    STAGE_SECONDS.observe(time.perf_counter() - inicio_sondagem, "probing")
+    
+    # Os resultados são aplicados sobre o documento atual sob o lock de escrita, para não
+    # descartar o que foi gravado durante a sondagem (edições, patches de workers)
+    total_ips = len(ping_results)
+    online = []
+
+    def mesclar(atual):
+        inicio_mescla = time.perf_counter()
+        hosts = []
+        for host in atual.get("hosts", []):
+            novo = _com_ping(host, ping_results, online)
+            if host.get("conexoes"):
+                conexoes = [_com_ping(conexao, ping_results, online) for conexao in host["conexoes"]]
+                if any(c is not o for c, o in zip(conexoes, host["conexoes"])):
+                    novo = {**novo, "conexoes": conexoes}
+            hosts.append(novo)
+        STAGE_SECONDS.observe(time.perf_counter() - inicio_mescla, "merge")
+        # Adicionar timestamp da última atualização
+        return {**atual, "hosts": hosts, "last_update": datetime.utcnow().isoformat() + "Z"}
+
+    logger.debug("Enviando dados atualizados para DataManager")
+    with STAGE_SECONDS.time("update_data"):
+        data_manager.update_with(mesclar)
+    total_validados = len(online)
     
+    elapsed_time = time.time() - start_time
+    SWEEP_SECONDS.observe(elapsed_time)
+    logger.info(
+        f"Atualização concluída em {elapsed_time:.2f}s | "
+        f"Online: {total_validados}/{total_ips} | "
+        f"IPs prioritários: {len(priority_ips_set)}"
+    )
+    return {"duracao": elapsed_time, "hosts": len(hosts_originais), "ips": total_ips,
+            "online": total_validados, "prioritarios": len(priority_ips_set)}
+
+def init_ping_service(data_manager, socketio: SocketIO, pinger: OnDemandPinger = None) -> None:  # ALTERAÇÃO: Adicionar socketio como parâmetro
     max_workers = min(os.cpu_count() or 1, 4)
     chunk_size = 50
-    
-    @socketio.on('host_updated')  # ALTERAÇÃO: Escutar evento host_updated
+
+    pinger = pinger or OnDemandPinger(data_manager).start()
+
     def handle_host_updated(data):
         ip = data['ip']
-        logger.info(f"Forçando ping para IP atualizado: {ip}")
-        priority_ips = data_manager.get_data().get('priority_ips', {})
-        status, tempo = loop.run_until_complete(verificar_ping(ip, ip in priority_ips))
-        dados = data_manager.get_data()
-        for host in dados['hosts']:
-            if host['ip'] == ip:
-                host['ativo'] = status
-                host['tempo_resposta'] = tempo
-                logger.debug(f"IP {ip} atualizado: status={status}, tempo={tempo}")
-                break
-        data_manager.update_data(dados)
+        logger.info("Forçando ping para IP atualizado", extra={"ip": ip})
+        pinger.request([ip])
+
+    # Em modo multi-worker os clientes estão nos workers, que repassam o evento pelo barramento
+    if socketio is not None:
+        socketio.on('host_updated')(handle_host_updated)
+    if data_manager.bus is not None:
+        data_manager.bus.subscribe('host_updated', handle_host_updated)
+        data_manager.bus.subscribe('ping_request', lambda pedido: pinger.request(pedido['ips'], pedido['ticket']))
 
     while True:
         try:
-            start_time = time.time()
-            dados = data_manager.get_data()
-            hosts_originais = dados.get("hosts", [])
-            priority_ips = dados.get("priority_ips", {})
-            priority_ips_set = set(priority_ips.keys())
-            
-            if not hosts_originais:
-                logger.warning("Nenhum host encontrado para processar")
+            varredura = executar_varredura(data_manager, max_workers, chunk_size)
+            if varredura is None:
                 time.sleep(60)
                 continue
 
-            logger.info(f"Iniciando atualização de pings para {len(hosts_originais)} hosts")
-            
-            hosts_para_processar = hosts_originais.copy()
-            ping_results = {}
-            
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = []
-                for i in range(0, len(hosts_para_processar), chunk_size):
-                    chunk = hosts_para_processar[i:i + chunk_size]
-                    futures.append(
-                        executor.submit(
-                            lambda c: loop.run_until_complete(
-                                processar_chunk(c, priority_ips_set)
-                            ),
-                            chunk
-                        )
-                    )
-                
-                for future in futures:
-                    ping_results.update(future.result())
-            
-            # Obter os dados mais recentes após os pings
-            dados_atualizados = data_manager.get_data()
-            total_validados = 0
-            total_ips = len(ping_results)
-            
-            # Atualizar apenas os campos gerenciados pelo ping_service
-            for host in dados_atualizados["hosts"]:
-                ip = host["ip"]
-                if ip in ping_results:
-                    status, tempo = ping_results[ip]
-                    host["ativo"] = status
-                    host["tempo_resposta"] = tempo
-                    if status == "#00d700":
-                        total_validados += 1
-                
-                if "conexoes" in host:
-                    for conexao in host["conexoes"]:
-                        conn_ip = conexao.get("ip")
-                        if conn_ip in ping_results:
-                            status, tempo = ping_results[conn_ip]
-                            conexao["ativo"] = status
-                            conexao["tempo_resposta"] = tempo
-                            if status == "#00d700":
-                                total_validados += 1
-            
-            # Adicionar timestamp da última atualização
-            dados_atualizados["last_update"] = datetime.utcnow().isoformat() + "Z"
-            
-            logger.debug("Enviando dados atualizados para DataManager")
-            data_manager.update_data(dados_atualizados)
-            
-            elapsed_time = time.time() - start_time
-            logger.info(
-                f"Atualização concluída em {elapsed_time:.2f}s | "
-                f"Online: {total_validados}/{total_ips} | "
-                f"IPs prioritários: {len(priority_ips_set)}"
-            )
-            
-            base_interval = 10 if priority_ips_set else 30  # ALTERAÇÃO: Reduzir intervalo para 30s
-            sleep_time = max(base_interval, elapsed_time * 1.5)
+            base_interval = 10 if varredura["prioritarios"] else 30  # ALTERAÇÃO: Reduzir intervalo para 30s
+            sleep_time = max(base_interval, varredura["duracao"] * 1.5)
             time.sleep(sleep_time)
             
         except Exception as e:
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from port_table import PORT_FIELDS, AUSENTE
+
+logger = logging.getLogger(__name__)
+
+RETENCAO_SEGUNDOS = 7 * 24 * 3600
+MAX_EVENTOS = 200_000
+
+_INDICE_CAMPO = {campo: i for i, campo in enumerate(PORT_FIELDS)}
+
+
+class PortEventLog:
+    """
+    Histórico das mudanças de porta entre coletas, com janela de retenção.
+
+    Cada evento fica como uma tupla de códigos do StringPool da PortTable
+    (seq, ts, ip, port, tipo, ((campo, antes, depois), ...)), sem dicts nem cópias de
+    strings; o formato legível só é montado em to_dict(), na borda da API. Os eventos
+    seguram referências aos códigos que citam e as liberam quando saem da retenção.
+
+    O histórico é só de memória. O dono do estado chama iniciar_seq() na partida para os
+    seqs continuarem crescendo depois de um reinício; réplicas ficam em 0 e seguem o seq
+    dos eventos que recebem.
+    """
+
+    def __init__(self, pool, retention=RETENCAO_SEGUNDOS, max_events=MAX_EVENTOS):
+        self.pool = pool
+        self.retention = retention
+        self.max_events = max_events
+        self._eventos = deque()
+        self._lock = threading.Lock()
+        self.last_seq = 0
+
+    def iniciar_seq(self, agora=None):
+        """
+        Começa a numeração em microssegundos desde a época (cabe em inteiros seguros do JS):
+        um cursor de antes do reinício fica abaixo de todos os eventos novos, em vez de
+        ficar à frente de um contador que recomeçou do zero.
+        """
+        with self._lock:
+            self.last_seq = max(self.last_seq, int((agora or time.time()) * 1_000_000))
+
+    def record(self, ip, mudancas, ts=None):
+        """
+        Registra as mudanças de PortTable.set_with_diff e retorna os eventos criados. As
+        referências aos códigos que vêm com as mudanças passam a ser dos eventos.
+        """
+        ts = ts or time.time()
+        novos = []
+        with self._lock:
+            for port, tipo, alteracoes in mudancas:
+                self.last_seq += 1
+                novos.append((self.last_seq, ts, ip, port, tipo, alteracoes))
+            self._eventos.extend(novos)
+            self._podar(ts)
+        return novos
+
+    def record_dicts(self, eventos):
+        """Registra eventos vindos de outro processo (formato de to_dict), mantendo o seq original."""
+        intern = self.pool.intern
+        with self._lock:
+            for evento in eventos:
+                alteracoes = tuple(
+                    (_INDICE_CAMPO[campo],
+                     AUSENTE if antes is None else intern(antes),
+                     AUSENTE if depois is None else intern(depois))
+                    for campo, (antes, depois) in evento["campos"].items() if campo in _INDICE_CAMPO
+                )
+                self._eventos.append((evento["seq"], evento["ts"], evento["ip"], intern(evento["port"]),
+                                      evento["tipo"], alteracoes))
+                self.last_seq = max(self.last_seq, evento["seq"])
+            self._podar(time.time())
+
+    def _podar(self, agora):
+        limite = agora - self.retention
+        while self._eventos and (self._eventos[0][1] < limite or len(self._eventos) > self.max_events):
+            self._descartar(self._eventos.popleft())
+
+    def _descartar(self, evento):
+        release = self.pool.release
+        release(evento[3])
+        for _, antes, depois in evento[5]:
+            release(antes)
+            release(depois)
+
+    def to_dict(self, evento):
+        seq, ts, ip, port, tipo, alteracoes = evento
+        valores = self.pool.values
+        return {
+            "seq": seq,
+            "ts": ts,
+            "ip": ip,
+            "port": valores[port],
+            "tipo": tipo,
+            "campos": {PORT_FIELDS[i]: [valores[a] if a != AUSENTE else None,
+                                        valores[d] if d != AUSENTE else None]
+                       for i, a, d in alteracoes},
+        }
+
+    def since(self, seq=0, ips=None, tipos=None, campos=None, limit=1000):
+        """
+        Eventos com seq maior que `seq`, em ordem, opcionalmente filtrados por host, tipo
+        (added/removed/changed) e campo alterado (ex.: Status).
+        """
+        indices_campos = {_INDICE_CAMPO[c] for c in campos if c in _INDICE_CAMPO} if campos else None
+        with self._lock:
+            self._podar(time.time())
+            eventos = list(self._eventos)
+        resultado = []
+        for evento in eventos:
+            if evento[0] <= seq:
+                continue
+            if ips and evento[2] not in ips:
+                continue
+            if tipos and evento[4] not in tipos:
+                continue
+            if indices_campos and not any(i in indices_campos for i, _, _ in evento[5]):
+                continue
+            resultado.append(self.to_dict(evento))
+            if len(resultado) >= limit:
+                break
+        return resultado
+
+    def __len__(self):
+        return len(self._eventos)
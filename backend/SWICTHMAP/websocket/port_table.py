@@ -0,0 +1,358 @@
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # Dependência opcional; sem ela os filtros percorrem as colunas em Python
+    np = None
+
+# Campos de cada porta no formato do Entuity, na ordem em que aparecem em dados.json
+PORT_FIELDS = ("Status", "VLANs", "Port", "OutSpeed", "InSpeed", "FastUtil", "FastStatus",
+               "StatusEvents", "Spare", "Duplex", "IPs", "Hosts")
+_INDICE_CAMPO = {campo: i for i, campo in enumerate(PORT_FIELDS)}
+AUSENTE = 0  # código de campo inexistente na porta
+LIVRE = 0    # código de host de uma linha livre
+
+
+class StringPool:
+    """
+    Valores internados: cada valor distinto é guardado uma vez e referenciado por código.
+
+    Os códigos têm contagem de referências: intern() e acquire() somam uma, release() tira
+    uma e, ao chegar a zero, o valor sai do pool e o código volta a ser usado por um valor
+    novo. Sem isso colunas como Hosts e IPs, que mudam a cada coleta, fariam o pool crescer
+    durante toda a vida do processo.
+    """
+
+    def __init__(self):
+        self.values = [None]  # código 0 reservado (AUSENTE)
+        self.codes = {}
+        self.refs = [0]
+        self._livres = []
+
+    @staticmethod
+    def _chave(valor):
+        # Para não-strings o tipo entra na chave, senão 1, 1.0 e True virariam o mesmo valor
+        return valor if type(valor) is str else (type(valor), valor)
+
+    def intern(self, valor):
+        """Código do valor, com uma referência a mais (liberar com release())."""
+        chave = self._chave(valor)
+        codigo = self.codes.get(chave)
+        if codigo is None:
+            if self._livres:
+                codigo = self._livres.pop()
+                self.values[codigo] = valor
+            else:
+                codigo = len(self.values)
+                self.values.append(valor)
+                self.refs.append(0)
+            self.codes[chave] = codigo
+        self.refs[codigo] += 1
+        return codigo
+
+    def acquire(self, codigo):
+        if codigo != AUSENTE:
+            self.refs[codigo] += 1
+
+    def release(self, codigo):
+        if codigo == AUSENTE:
+            return
+        self.refs[codigo] -= 1
+        if self.refs[codigo] == 0:
+            del self.codes[self._chave(self.values[codigo])]
+            self.values[codigo] = None
+            self._livres.append(codigo)
+
+    def code(self, valor):
+        """Código de um valor já internado, ou None."""
+        return self.codes.get(self._chave(valor))
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def _vlans(texto):
+    """"1, 11, 504" -> frozenset({"1", "11", "504"})"""
+    return frozenset(v.strip() for v in str(texto).split(",") if v.strip())
+
+
+class PortTable:
+    """
+    Portas de todos os hosts em colunas (uma por campo de PORT_FIELDS) de códigos inteiros.
+
+    Status, Duplex, velocidades etc. têm poucos valores distintos e nomes de porta se
+    repetem entre switches do mesmo modelo, então cada texto fica uma vez no StringPool e
+    cada porta ocupa 4 bytes por campo, em vez de um dict com 12 chaves. A lista de dicts
+    original só é montada em get(), na borda da API.
+
+    Hosts que nunca tiveram a chave "ports" não são registrados, para que o documento
+    materializado seja igual ao original.
+    """
+
+    def __init__(self):
+        self.pool = StringPool()
+        self.columns = {campo: array("I") for campo in PORT_FIELDS}
+        self.host = array("I")      # linha -> código do host (LIVRE se a linha não está em uso)
+        self._host_codes = {}       # ip -> código
+        self._host_ips = [None]     # código -> ip
+        self.rows = {}              # ip -> array("I") com as linhas do host, na ordem original
+        self._extras = {}           # linha -> {campo: valor} não representável nas colunas
+        self._livres = []
+        self._codigos_vlan_vistos = set()  # códigos já usados na coluna VLANs
+        self._vlans_por_codigo = {}        # cache: código -> (texto, conjunto de VLANs), montado na consulta
+
+    def __len__(self):
+        return len(self.host) - len(self._livres)
+
+    def __contains__(self, ip):
+        return ip in self.rows
+
+    # --- escrita ---
+
+    def _codificar(self, porta):
+        codigos = [AUSENTE] * len(PORT_FIELDS)
+        extras = None
+        for campo, valor in porta.items():
+            indice = _INDICE_CAMPO.get(campo)
+            try:
+                if indice is not None:
+                    codigos[indice] = self.pool.intern(valor)
+                    continue
+            except TypeError:  # valor não hasheável (lista, dict...)
+                pass
+            extras = extras or {}
+            extras[campo] = valor
+        return tuple(codigos), extras
+
+    def _codigos_linha(self, linha):
+        return tuple(self.columns[campo][linha] for campo in PORT_FIELDS), self._extras.get(linha)
+
+    def _codificar_lista(self, ports):
+        if not isinstance(ports, list):
+            ports = []
+        return [self._codificar(p) if isinstance(p, dict) else ((AUSENTE,) * len(PORT_FIELDS), None)
+                for p in ports]
+
+    def set(self, ip, ports):
+        """
+        Substitui as portas do host. Retorna False (sem escrever nada) se não mudaram.
+        """
+        return self._gravar(ip, self._codificar_lista(ports))
+
+    def set_with_diff(self, ip, ports):
+        """
+        Como set(), mas também retorna as mudanças por porta em relação às portas atuais.
+
+        Returns:
+            (mudou, mudanças): mudanças é uma lista de (código do Port, tipo, alterações), com
+            tipo "added", "removed" ou "changed" e alterações = ((índice do campo, código antes,
+            código depois), ...). Hosts ainda sem portas registradas não geram mudanças (a
+            primeira coleta é a linha de base). Cada código citado nas mudanças vem com uma
+            referência no pool, que quem as guarda (PortEventLog) libera ao descartá-las.
+        """
+        codificadas = self._codificar_lista(ports)
+        mudancas = []
+        if ip in self.rows:
+            mudancas = self._diff(self.rows[ip], codificadas)
+            for port, _, alteracoes in mudancas:
+                self.pool.acquire(port)
+                for _, antes, depois in alteracoes:
+                    self.pool.acquire(antes)
+                    self.pool.acquire(depois)
+        return self._gravar(ip, codificadas), mudancas
+
+    def _diff(self, linhas, codificadas):
+        indice_port = _INDICE_CAMPO["Port"]
+
+        def por_porta(itens):
+            # Chave (Port, ocorrência): o mesmo nome pode aparecer mais de uma vez no host
+            resultado = {}
+            ocorrencias = {}
+            for codigos in itens:
+                port = codigos[indice_port]
+                n = ocorrencias.get(port, 0)
+                ocorrencias[port] = n + 1
+                resultado[(port, n)] = codigos
+            return resultado
+
+        antes = por_porta(tuple(self.columns[campo][linha] for campo in PORT_FIELDS) for linha in linhas)
+        depois = por_porta(codigos for codigos, _ in codificadas)
+        mudancas = []
+        for chave, novos in depois.items():
+            antigos = antes.get(chave)
+            if antigos is None:
+                alteracoes = tuple((i, AUSENTE, c) for i, c in enumerate(novos) if c != AUSENTE)
+                mudancas.append((chave[0], "added", alteracoes))
+            elif antigos != novos:
+                alteracoes = tuple((i, a, c) for i, (a, c) in enumerate(zip(antigos, novos)) if a != c)
+                mudancas.append((chave[0], "changed", alteracoes))
+        for chave, antigos in antes.items():
+            if chave not in depois:
+                alteracoes = tuple((i, a, AUSENTE) for i, a in enumerate(antigos) if a != AUSENTE)
+                mudancas.append((chave[0], "removed", alteracoes))
+        return mudancas
+
+    def _gravar(self, ip, codificadas):
+        """Grava as portas codificadas; as referências tomadas por _codificar ficam com as células."""
+        atuais = self.rows.get(ip)
+        if atuais is not None and len(atuais) == len(codificadas) and all(
+                self._codigos_linha(linha) == cod for linha, cod in zip(atuais, codificadas)):
+            self._liberar_codigos(codigos for codigos, _ in codificadas)
+            return False
+        self._liberar(ip)
+        codigo_host = self._host_codes.get(ip)
+        if codigo_host is None:
+            codigo_host = len(self._host_ips)
+            self._host_codes[ip] = codigo_host
+            self._host_ips.append(ip)
+        linhas = array("I")
+        for codigos, extras in codificadas:
+            linha = self._alocar()
+            for campo, codigo in zip(PORT_FIELDS, codigos):
+                self.columns[campo][linha] = codigo
+            self._codigos_vlan_vistos.add(codigos[_INDICE_CAMPO["VLANs"]])
+            self.host[linha] = codigo_host
+            if extras:
+                self._extras[linha] = extras
+            linhas.append(linha)
+        self.rows[ip] = linhas
+        return True
+
+    def remove(self, ip):
+        self._liberar(ip)
+        self.rows.pop(ip, None)
+
+    def _alocar(self):
+        if self._livres:
+            return self._livres.pop()
+        for coluna in self.columns.values():
+            coluna.append(AUSENTE)
+        self.host.append(LIVRE)
+        return len(self.host) - 1
+
+    def _liberar_codigos(self, linhas_de_codigos):
+        release = self.pool.release
+        for codigos in linhas_de_codigos:
+            for codigo in codigos:
+                release(codigo)
+
+    def _liberar(self, ip):
+        release = self.pool.release
+        for linha in self.rows.get(ip, ()):
+            for coluna in self.columns.values():
+                release(coluna[linha])
+                coluna[linha] = AUSENTE
+            self.host[linha] = LIVRE
+            self._extras.pop(linha, None)
+            self._livres.append(linha)
+
+    # --- leitura ---
+
+    def materialize(self, linha):
+        valores = self.pool.values
+        porta = {}
+        for campo in PORT_FIELDS:
+            codigo = self.columns[campo][linha]
+            if codigo != AUSENTE:
+                porta[campo] = valores[codigo]
+        extras = self._extras.get(linha)
+        if extras:
+            porta.update(extras)
+        return porta
+
+    def get(self, ip):
+        """Lista de dicts no formato original, ou None se o host não tem a chave "ports"."""
+        linhas = self.rows.get(ip)
+        if linhas is None:
+            return None
+        return [self.materialize(linha) for linha in linhas]
+
+    def statuses(self, ip):
+        coluna = self.columns["Status"]
+        valores = self.pool.values
+        return {valores[coluna[linha]] for linha in self.rows.get(ip, ()) if coluna[linha] != AUSENTE}
+
+    def ip_of(self, linha):
+        return self._host_ips[self.host[linha]]
+
+    def position(self, linha):
+        """Índice da linha dentro da lista de portas do host."""
+        return self.rows[self.ip_of(linha)].index(linha)
+
+    # --- consultas na frota inteira ---
+
+    def _codigos_de(self, valores):
+        codigos = {self.pool.code(v) for v in valores}
+        codigos.discard(None)
+        return codigos
+
+    def _codigos_vlan(self, vlans):
+        """Códigos de VLANs cujo texto ("1, 11, 504") contém alguma das VLANs pedidas."""
+        codigos = set()
+        valores = self.pool.values
+        for codigo in list(self._codigos_vlan_vistos):
+            texto = valores[codigo]
+            if texto is None:  # código liberado no pool
+                self._codigos_vlan_vistos.discard(codigo)
+                self._vlans_por_codigo.pop(codigo, None)
+                continue
+            cache = self._vlans_por_codigo.get(codigo)
+            if cache is None or cache[0] is not texto:  # código reaproveitado para outro valor
+                cache = self._vlans_por_codigo[codigo] = (texto, _vlans(texto))
+            if not cache[1].isdisjoint(vlans):
+                codigos.add(codigo)
+        return codigos
+
+    def query(self, status=None, spare=None, duplex=None, speed=None, vlan=None, ips=None):
+        """
+        Linhas que atendem a todos os filtros (cada filtro é um conjunto de valores aceitos).
+
+        Args:
+            status, spare, duplex: valores exatos de Status, Spare e Duplex
+            speed: valores de InSpeed/OutSpeed (qualquer dos dois)
+            vlan: números de VLAN; casa portas cuja lista VLANs contém algum deles
+            ips: restringe aos hosts informados
+        """
+        filtros = []  # (nomes de coluna, códigos aceitos)
+        for campo, valores in (("Status", status), ("Spare", spare), ("Duplex", duplex)):
+            if valores:
+                filtros.append(((campo,), self._codigos_de(valores)))
+        if speed:
+            filtros.append((("InSpeed", "OutSpeed"), self._codigos_de(speed)))
+        if vlan:
+            filtros.append((("VLANs",), self._codigos_vlan({str(v) for v in vlan})))
+        codigos_host = None
+        if ips is not None:
+            codigos_host = {self._host_codes[ip] for ip in ips if ip in self._host_codes}
+
+        if np is not None:
+            # Cópias (não views) para não travar o redimensionamento dos arrays pelo escritor
+            hosts = np.array(self.host, dtype=np.uint32)
+            mascara = hosts != LIVRE
+            for campos, codigos in filtros:
+                aceitos = np.fromiter(codigos, dtype=np.uint32, count=len(codigos))
+                parcial = np.zeros(len(self.host), dtype=bool)
+                for campo in campos:
+                    parcial |= np.isin(np.array(self.columns[campo], dtype=np.uint32), aceitos)
+                mascara &= parcial
+            if codigos_host is not None:
+                aceitos = np.fromiter(codigos_host, dtype=np.uint32, count=len(codigos_host))
+                mascara &= np.isin(hosts, aceitos)
+            return np.flatnonzero(mascara).tolist()
+
+        linhas = []
+        colunas = {campo: self.columns[campo] for campos, _ in filtros for campo in campos}
+        for linha, host in enumerate(self.host):
+            if host == LIVRE or (codigos_host is not None and host not in codigos_host):
+                continue
+            if all(any(colunas[campo][linha] in codigos for campo in campos) for campos, codigos in filtros):
+                linhas.append(linha)
+        return linhas
+
+    def memory_usage(self):
+        """Bytes aproximados ocupados pelas colunas (sem o pool de strings)."""
+        return sum(c.buffer_info()[1] * c.itemsize for c in self.columns.values()) + \
+            self.host.buffer_info()[1] * self.host.itemsize
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import math
+import random
+import struct
+
+try:
+    from icmplib import async_ping
+except ImportError:  # Dependência do ping real; o FakeProber funciona sem ela
+    async_ping = None
+
+
+class ProbeResult:
+    """Resultado de um ping, com os mesmos atributos do Host do icmplib usados pelo ping_service."""
+
+    def __init__(self, address, packets_sent, packets_received, avg_rtt=0.0):
+        self.address = address
+        self.packets_sent = packets_sent
+        self.packets_received = packets_received
+        self.avg_rtt = avg_rtt
+
+    @property
+    def is_alive(self):
+        return self.packets_received > 0
+
+
+class IcmpProber:
+    """Ping ICMP real (icmplib.async_ping, sem privilégios)."""
+
+    async def probe(self, ip, count, timeout):
+        if async_ping is None:
+            raise RuntimeError("icmplib não instalado")
+        return await async_ping(ip, count=count, timeout=timeout, privileged=False)
+
+
+class FakeProber:
+    """
+    Backend ICMP simulado e determinístico, para medir o ping_service sem rede.
+
+    O perfil de cada IP (vivo, morto ou oscilante) é sorteado a partir de `seed` e do próprio
+    IP, então a mesma frota se comporta igual em toda execução:
+
+    - vivos: RTT sorteado da distribuição `rtt` ("lognormal", "normal", "uniforme" ou "fixo",
+      com `rtt_ms` = (média, desvio) em ms) e cada pacote perdido com probabilidade `perda`;
+    - mortos (fração `mortos`): nenhum pacote volta e o ping consome o timeout inteiro;
+    - oscilantes (fração `oscilantes`): alternam entre vivo e morto a cada `periodo` pings.
+
+    Os tempos simulados seguem o icmplib (intervalo entre pacotes + espera do último) e são
+    multiplicados por `escala_tempo`, para que varreduras grandes rodem em segundos.
+    """
+
+    def __init__(self, seed=0, rtt="lognormal", rtt_ms=(5.0, 3.0), perda=0.02, mortos=0.1,
+                 oscilantes=0.03, periodo=3, intervalo=1.0, escala_tempo=1.0):
+        if rtt not in ("lognormal", "normal", "uniforme", "fixo"):
+            raise ValueError(f"Distribuição de RTT desconhecida: {rtt}")
+        self.seed = seed
+        self.rtt = rtt
+        self.rtt_ms = rtt_ms
+        self.perda = perda
+        self.mortos = mortos
+        self.oscilantes = oscilantes
+        self.periodo = max(1, periodo)
+        self.intervalo = intervalo
+        self.escala_tempo = escala_tempo
+        self._sondagens = {}  # ip -> pings já feitos (para os oscilantes)
+
+    def _aleatorio(self, ip, *extra):
+        semente = hashlib.blake2b(repr((self.seed, ip, *extra)).encode(), digest_size=8).digest()
+        return random.Random(struct.unpack("<Q", semente)[0])
+
+    def perfil(self, ip):
+        """"vivo", "morto" ou "oscilante"."""
+        sorteio = self._aleatorio(ip).random()
+        if sorteio < self.mortos:
+            return "morto"
+        if sorteio < self.mortos + self.oscilantes:
+            return "oscilante"
+        return "vivo"
+
+    def _sortear_rtt(self, aleatorio):
+        media, desvio = self.rtt_ms
+        if self.rtt == "fixo":
+            return media
+        if self.rtt == "uniforme":
+            return aleatorio.uniform(max(0.0, media - desvio), media + desvio)
+        if self.rtt == "normal":
+            return max(0.1, aleatorio.gauss(media, desvio))
+        # lognormal com a média e o desvio pedidos
+        sigma2 = math.log(1 + (desvio / media) ** 2)
+        return aleatorio.lognormvariate(math.log(media) - sigma2 / 2, math.sqrt(sigma2))
+
+    async def probe(self, ip, count, timeout):
+        rodada = self._sondagens.get(ip, 0)
+        self._sondagens[ip] = rodada + 1
+        perfil = self.perfil(ip)
+        vivo = perfil == "vivo" or (perfil == "oscilante" and (rodada // self.periodo) % 2 == 0)
+        aleatorio = self._aleatorio(ip, rodada)
+        rtts = []
+        if vivo:
+            for _ in range(count):
+                if aleatorio.random() >= self.perda:
+                    rtts.append(min(self._sortear_rtt(aleatorio), timeout * 1000))
+        espera_ultimo = max(rtts) / 1000 if len(rtts) == count else timeout
+        await asyncio.sleep((self.intervalo * (count - 1) + espera_ultimo) * self.escala_tempo)
+        return ProbeResult(ip, count, len(rtts), sum(rtts) / len(rtts) if rtts else 0.0)
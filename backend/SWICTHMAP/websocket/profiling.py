@@ -0,0 +1,298 @@
+import gc
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from functools import wraps
+
+from client_identity import identificar_cliente
+
+try:
+    from eventlet import patcher
+    # O amostrador precisa de uma thread real do SO: uma green thread só rodaria quando o hub
+    # estivesse livre, justamente o que não acontece durante um travamento
+    _threading = patcher.original("threading")
+    _time = patcher.original("time")
+except ImportError:
+    _threading, _time = threading, time
+
+try:
+    import greenlet
+except ImportError:  # Sem eventlet/greenlet só há threads do SO para amostrar
+    greenlet = None
+
+logger = logging.getLogger(__name__)
+
+VARIAVEL_TOKEN = "SWITCHMAP_ADMIN_TOKEN"
+CABECALHO_TOKEN = "X-Admin-Token"
+MAX_SEGUNDOS = 300
+INTERVALO_PADRAO = 0.01       # segundos entre amostras das threads do SO
+INTERVALO_GREENLETS = 0.5     # greenlets parados exigem varrer o heap (gc), então são amostrados menos
+PROFUNDIDADE_MAXIMA = 64
+FRAMES_TRACEMALLOC = 25
+TOP_N = 30
+
+
+def _descrever(frame):
+    codigo = frame.f_code
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})"
+
+
+def formatar_pilha(frame, limite=PROFUNDIDADE_MAXIMA):
+    """Pilha do frame mais externo ao mais interno, como ["main (app.py:170)", ...]."""
+    pilha = []
+    while frame is not None and len(pilha) < limite:
+        pilha.append(_descrever(frame))
+        frame = frame.f_back
+    pilha.reverse()
+    return pilha
+
+
+def lock_owners(data_manager):
+    """Donos e esperas atuais do RWLock do DataManager, com a pilha de cada um."""
+    owners = getattr(data_manager.rwlock, "owners", None)
+    if owners is None:
+        return []
+    return [{**{k: v for k, v in dono.items() if k != "frame"},
+             "pilha": formatar_pilha(dono["frame"]) if dono["frame"] is not None else None}
+            for dono in owners()]
+
+
+class SamplingProfiler:
+    """
+    Sessão de perfilamento por amostragem, ativada sob demanda.
+
+    Uma thread do SO lê a pilha de todas as threads (sys._current_frames) a cada `intervalo`
+    segundos (tempo de parede: threads dormindo ou esperando também aparecem); com eventlet
+    isso inclui a green thread que estiver rodando no hub. A cada
+    INTERVALO_GREENLETS segundos também são lidas as pilhas dos greenlets parados (ping,
+    monitores do DataManager, handlers de requisição esperando I/O ou lock). Com `memoria`,
+    o tracemalloc fica ligado só durante a sessão e o relatório traz a diferença de alocações
+    entre o início e o fim. Fora de uma sessão nada disso roda.
+    """
+
+    def __init__(self, segundos, intervalo=INTERVALO_PADRAO, memoria=True, data_manager=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.segundos = segundos
+        self.intervalo = intervalo
+        self.memoria = memoria
+        self.data_manager = data_manager
+        self.inicio = None
+        self.fim = None
+        self.amostras = 0
+        self.pilhas = Counter()           # (thread, (frames...)) -> amostras
+        self.pilhas_greenlets = Counter() # (frames...) -> amostras
+        self.amostras_greenlets = 0
+        self.relatorio = None
+        self._parar = _threading.Event()
+        self._thread = None
+        self._tracemalloc_proprio = False
+        self._memoria_inicio = None
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(FRAMES_TRACEMALLOC)
+                self._tracemalloc_proprio = True
+            self._memoria_inicio = tracemalloc.take_snapshot()
+        self.inicio = time.time()
+        self._thread = _threading.Thread(target=self._executar, name="switchmap-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._parar.set()
+
+    def _executar(self):
+        proprio = _threading.get_ident()
+        limite = _time.monotonic() + self.segundos
+        proximo_greenlets = 0
+        try:
+            while not self._parar.is_set():
+                agora = _time.monotonic()
+                if agora >= limite:
+                    break
+                self._amostrar_threads(proprio)
+                if greenlet is not None and agora >= proximo_greenlets:
+                    self._amostrar_greenlets()
+                    proximo_greenlets = agora + INTERVALO_GREENLETS
+                self._parar.wait(self.intervalo)
+        except Exception as e:
+            logger.error(f"Erro no perfilamento {self.id}: {str(e)}", exc_info=True)
+        finally:
+            self._finalizar()
+
+    def _amostrar_threads(self, proprio):
+        nomes = {t.ident: t.name for t in _threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == proprio:
+                continue
+            pilha = tuple(formatar_pilha(frame))
+            self.pilhas[(nomes.get(ident, str(ident)), pilha)] += 1
+        self.amostras += 1
+
+    def _amostrar_greenlets(self):
+        for objeto in gc.get_objects():
+            if isinstance(objeto, greenlet.greenlet) and objeto.gr_frame is not None:
+                self.pilhas_greenlets[tuple(formatar_pilha(objeto.gr_frame))] += 1
+        self.amostras_greenlets += 1
+
+    def _finalizar(self):
+        self.fim = time.time()
+        alocacoes = []
+        if self.memoria and self._memoria_inicio is not None:
+            filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            memoria_fim = tracemalloc.take_snapshot().filter_traces(filtros)
+            diferencas = memoria_fim.compare_to(self._memoria_inicio.filter_traces(filtros), "lineno")
+            for estatistica in diferencas[:TOP_N]:
+                quadro = estatistica.traceback[0]
+                alocacoes.append({
+                    "local": f"{quadro.filename}:{quadro.lineno}",
+                    "diferenca_kb": round(estatistica.size_diff / 1024, 1),
+                    "total_kb": round(estatistica.size / 1024, 1),
+                    "diferenca_blocos": estatistica.count_diff,
+                })
+            self._memoria_inicio = None
+            if self._tracemalloc_proprio:
+                tracemalloc.stop()
+        self.relatorio = self._montar_relatorio(alocacoes)
+        logger.info(f"Perfilamento {self.id} concluído: {self.amostras} amostras em "
+                    f"{self.fim - self.inicio:.1f}s")
+
+    def _montar_relatorio(self, alocacoes):
+        proprias, inclusivas = Counter(), Counter()
+        for (_, pilha), n in self.pilhas.items():
+            if pilha:
+                proprias[pilha[-1]] += n
+            for funcao in set(pilha):
+                inclusivas[funcao] += n
+        total = sum(self.pilhas.values()) or 1
+        return {
+            "id": self.id,
+            "inicio": self.inicio,
+            "duracao_segundos": round((self.fim or time.time()) - self.inicio, 3),
+            "intervalo_ms": self.intervalo * 1000,
+            "amostras": self.amostras,
+            "top_pilhas": [{"thread": thread, "amostras": n, "percentual": round(100 * n / total, 1),
+                            "pilha": list(pilha)}
+                           for (thread, pilha), n in self.pilhas.most_common(TOP_N)],
+            "top_funcoes": [{"funcao": funcao, "proprias": n, "inclusivas": inclusivas[funcao]}
+                            for funcao, n in proprias.most_common(TOP_N)],
+            "greenlets": {
+                "amostras": self.amostras_greenlets,
+                "top_pilhas": [{"amostras": n, "pilha": list(pilha)}
+                               for pilha, n in self.pilhas_greenlets.most_common(TOP_N)],
+            },
+            "alocacoes": alocacoes,
+            "locks": lock_owners(self.data_manager) if self.data_manager is not None else [],
+        }
+
+    def status(self):
+        return {"id": self.id, "ativo": self.ativo, "inicio": self.inicio, "segundos": self.segundos,
+                "amostras": self.amostras, "amostras_greenlets": self.amostras_greenlets}
+
+    def folded(self):
+        """
+        Pilhas no formato "folded" (thread;externo;...;interno contagem), aceito por
+        flamegraph.pl e speedscope; os greenlets parados vêm sob o prefixo "greenlets".
+        """
+        linhas = []
+        for (thread, pilha), n in self.pilhas.items():
+            linhas.append(";".join(p.replace(";", ",") for p in (thread, *pilha)) + f" {n}")
+        for pilha, n in self.pilhas_greenlets.items():
+            linhas.append(";".join(p.replace(";", ",") for p in ("greenlets", *pilha)) + f" {n}")
+        return "\n".join(linhas) + "\n"
+
+
+def register_profiling(app, data_manager, limiter=None):
+    """
+    Rotas de diagnóstico em /admin (perfilamento e donos do RWLock).
+
+    Exigem o cabeçalho X-Admin-Token igual à variável de ambiente SWITCHMAP_ADMIN_TOKEN e um
+    cliente com hostname confiável; sem a variável definida, as rotas respondem 403.
+    """
+    from flask import jsonify, request, Response
+
+    estado = {"sessao": None}
+    lock = threading.Lock()
+
+    def exigir_admin(view):
+        @wraps(view)
+        def protegida(*args, **kwargs):
+            token = os.environ.get(VARIAVEL_TOKEN)
+            if not token:
+                return jsonify({"erro": f"Rotas de administração desabilitadas (defina {VARIAVEL_TOKEN})"}), 403
+            hostname_cliente = identificar_cliente(request.remote_addr)
+            if (not hmac.compare_digest(request.headers.get(CABECALHO_TOKEN, ""), token)
+                    or hostname_cliente not in data_manager.get_trusted_hostnames()):
+                logger.warning("🚫 ACESSO NEGADO em %s", request.path, extra={"cliente": hostname_cliente})
+                return jsonify({"erro": "Acesso não autorizado"}), 403
+            return view(*args, **kwargs)
+        if limiter is not None:
+            protegida = limiter.limit("30 per minute")(protegida)
+        return protegida
+
+    @app.route("/admin/profile/start", methods=["POST"])
+    @exigir_admin
+    def profile_start():
+        """Inicia uma sessão: ?seconds=N (até MAX_SEGUNDOS), interval_ms, memory=0 para não usar tracemalloc."""
+        segundos = request.args.get("seconds", 30, type=float)
+        intervalo = request.args.get("interval_ms", INTERVALO_PADRAO * 1000, type=float) / 1000
+        if not 0 < segundos <= MAX_SEGUNDOS or not 0.001 <= intervalo <= 1:
+            return jsonify({"erro": f"seconds deve estar entre 0 e {MAX_SEGUNDOS}, interval_ms entre 1 e 1000"}), 400
+        with lock:
+            if estado["sessao"] is not None and estado["sessao"].ativo:
+                return jsonify({"erro": "Já existe um perfilamento em andamento",
+                                **estado["sessao"].status()}), 409
+            sessao = SamplingProfiler(segundos, intervalo, request.args.get("memory", "1") != "0", data_manager)
+            estado["sessao"] = sessao.start()
+        logger.info(f"Perfilamento {sessao.id} iniciado por {segundos}s")
+        return jsonify(sessao.status()), 202
+
+    @app.route("/admin/profile/stop", methods=["POST"])
+    @exigir_admin
+    def profile_stop():
+        sessao = estado["sessao"]
+        if sessao is None:
+            return jsonify({"erro": "Nenhum perfilamento iniciado"}), 404
+        sessao.stop()
+        return jsonify(sessao.status()), 200
+
+    @app.route("/admin/profile", methods=["GET"])
+    @exigir_admin
+    def profile_report():
+        """Estado da sessão atual; o relatório vem quando a sessão termina."""
+        sessao = estado["sessao"]
+        if sessao is None:
+            return jsonify({"erro": "Nenhum perfilamento iniciado"}), 404
+        return jsonify({**sessao.status(), "relatorio": sessao.relatorio}), 200
+
+    @app.route("/admin/profile/download", methods=["GET"])
+    @exigir_admin
+    def profile_download():
+        """Arquivo da última sessão concluída: ?format=folded (padrão, para flame graph) ou json."""
+        sessao = estado["sessao"]
+        if sessao is None or sessao.relatorio is None:
+            return jsonify({"erro": "Nenhum perfilamento concluído"}), 404
+        if request.args.get("format", "folded") == "json":
+            corpo, mimetype, extensao = json.dumps(sessao.relatorio, ensure_ascii=False, indent=2), "application/json", "json"
+        else:
+            corpo, mimetype, extensao = sessao.folded(), "text/plain", "folded"
+        nome = f"switchmap-profile-{sessao.id}.{extensao}"
+        return Response(corpo, mimetype=mimetype, headers={"Content-Disposition": f"attachment; filename={nome}"})
+
+    @app.route("/admin/locks", methods=["GET"])
+    @exigir_admin
+    def admin_locks():
+        """Quem detém e quem espera o RWLock do DataManager neste momento."""
+        return jsonify({"locks": lock_owners(data_manager)}), 200
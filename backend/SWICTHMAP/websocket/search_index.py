@@ -0,0 +1,228 @@
+import heapq
+import logging
+import re
+import unicodedata
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Peso de cada campo no ranking
+SEARCH_FIELDS = {"nome": 1.0, "ip": 1.0, "observacao": 0.6, "local": 0.3}
+
+SCORE_EXATO = 3.0
+SCORE_PREFIXO = 2.0
+SCORE_SUBSTRING = 1.5
+SCORE_FUZZY = 1.0
+LIMITE_PREFIXO = 2000  # máximo de termos expandidos por um prefixo curto
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalizar(texto):
+    """Minúsculas e sem acentos, para comparar "captação" com "captacao"."""
+    texto = unicodedata.normalize("NFKD", str(texto or ""))
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+    return _TOKEN_RE.findall(normalizar(texto))
+
+
+def trigramas(termo):
+    padded = f"${termo}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def distancia_edicao(a, b, maximo):
+    """Levenshtein com corte: retorna maximo + 1 assim que a distância passa de maximo."""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        atual = [i]
+        menor = i
+        for j, cb in enumerate(b, 1):
+            valor = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (ca != cb))
+            atual.append(valor)
+            menor = min(menor, valor)
+        if menor > maximo:
+            return maximo + 1
+        anterior = atual
+    return anterior[-1]
+
+
+class _TrieNode:
+    __slots__ = ("filhos", "terminal")
+
+    def __init__(self):
+        self.filhos = {}
+        self.terminal = False
+
+
+class SearchIndex:
+    """
+    Busca de hosts por nome, ip, local e observacao.
+
+    Cada campo é quebrado em termos (ex.: "BR-MA-FAB-IMP-SWA_AC_DEPOSIT.124.26" ->
+    br, ma, fab, imp, swa, ac, deposit, 124, 26). Os termos ficam numa trie (prefixos) e
+    num índice de trigramas (substrings e tolerância a erros de digitação). O índice é
+    atualizado por host, então incluir/editar/aprovar um host custa O(termos do host).
+    """
+
+    def __init__(self):
+        self._raiz = _TrieNode()
+        self._postings = defaultdict(dict)   # termo -> {ip: peso}
+        self._trigramas = defaultdict(set)   # trigrama -> {termo}
+        self._host_terms = {}                # ip -> {termo: peso}
+        self._host_fields = {}               # ip -> {campo: texto normalizado}
+
+    # --- manutenção ---
+
+    def upsert(self, ip, host):
+        campos = {campo: normalizar(host.get(campo, "")) for campo in SEARCH_FIELDS}
+        if self._host_fields.get(ip) == campos:
+            return
+        termos = {}
+        for campo, peso in SEARCH_FIELDS.items():
+            for termo in _TOKEN_RE.findall(campos[campo]):
+                if peso > termos.get(termo, 0):
+                    termos[termo] = peso
+        self.remove(ip)
+        for termo, peso in termos.items():
+            if termo not in self._postings:
+                self._add_term(termo)
+            self._postings[termo][ip] = peso
+        self._host_terms[ip] = termos
+        self._host_fields[ip] = campos
+
+    def remove(self, ip):
+        self._host_fields.pop(ip, None)
+        for termo in self._host_terms.pop(ip, {}):
+            postings = self._postings.get(termo)
+            if postings is None:
+                continue
+            postings.pop(ip, None)
+            if not postings:
+                del self._postings[termo]
+                self._remove_term(termo)
+
+    def _add_term(self, termo):
+        node = self._raiz
+        for c in termo:
+            node = node.filhos.setdefault(c, _TrieNode())
+        node.terminal = True
+        for tri in trigramas(termo):
+            self._trigramas[tri].add(termo)
+
+    def _remove_term(self, termo):
+        caminho = [self._raiz]
+        for c in termo:
+            node = caminho[-1].filhos.get(c)
+            if node is None:
+                break
+            caminho.append(node)
+        else:
+            caminho[-1].terminal = False
+            # Poda nós que ficaram sem uso
+            for i in range(len(termo), 0, -1):
+                node = caminho[i]
+                if node.terminal or node.filhos:
+                    break
+                del caminho[i - 1].filhos[termo[i - 1]]
+        for tri in trigramas(termo):
+            termos = self._trigramas.get(tri)
+            if termos is not None:
+                termos.discard(termo)
+                if not termos:
+                    del self._trigramas[tri]
+
+    # --- consulta ---
+
+    def _prefixo(self, prefixo):
+        node = self._raiz
+        for c in prefixo:
+            node = node.filhos.get(c)
+            if node is None:
+                return []
+        termos = []
+        pilha = [(node, prefixo)]
+        while pilha and len(termos) < LIMITE_PREFIXO:
+            node, termo = pilha.pop()
+            if node.terminal:
+                termos.append(termo)
+            pilha.extend((filho, termo + c) for c, filho in node.filhos.items())
+        return termos
+
+    def _termos_similares(self, token):
+        """Termos que contêm o token (substring) ou estão a poucas edições dele."""
+        tris = trigramas(token)
+        contagem = defaultdict(int)
+        for tri in tris:
+            for termo in self._trigramas.get(tri, ()):
+                contagem[termo] += 1
+        resultado = {}
+        # Substring: todos os trigramas internos (sem as bordas $) do token aparecem no termo
+        internos = {t for t in tris if "$" not in t}
+        maximo = 1 if len(token) <= 5 else 2
+        for termo, comuns in contagem.items():
+            if internos and token in termo:
+                resultado[termo] = SCORE_SUBSTRING
+                continue
+            jaccard = comuns / (len(tris) + len(trigramas(termo)) - comuns)
+            if jaccard < 0.25:
+                continue
+            dist = distancia_edicao(token, termo, maximo)
+            if dist <= maximo:
+                resultado[termo] = SCORE_FUZZY - 0.25 * dist
+        return resultado
+
+    def _pontuar_token(self, token):
+        """{ip: melhor pontuação do token} combinando exato, prefixo, substring e fuzzy."""
+        pontos = {}
+
+        def acumular(termo, score):
+            for ip, peso in self._postings.get(termo, {}).items():
+                valor = score * peso
+                if valor > pontos.get(ip, 0):
+                    pontos[ip] = valor
+
+        acumular(token, SCORE_EXATO)
+        for termo in self._prefixo(token):
+            if termo != token:
+                acumular(termo, SCORE_PREFIXO)
+        if len(token) >= 3:
+            for termo, score in self._termos_similares(token).items():
+                acumular(termo, score)
+        return pontos
+
+    def search(self, consulta, limit=20):
+        """
+        Hosts ordenados por relevância para a consulta.
+
+        Todos os termos da consulta precisam casar (exato, prefixo, substring ou com erro de
+        digitação). Casamentos do início do nome ou do IP completo recebem bônus.
+
+        Returns:
+            Lista de (ip, score)
+        """
+        tokens = tokenizar(consulta)
+        if not tokens:
+            return []
+        acumulado = None
+        for token in dict.fromkeys(tokens):
+            pontos = self._pontuar_token(token)
+            if acumulado is None:
+                acumulado = pontos
+            else:
+                acumulado = {ip: acumulado[ip] + p for ip, p in pontos.items() if ip in acumulado}
+            if not acumulado:
+                return []
+
+        consulta_norm = normalizar(consulta).strip()
+        campos_hosts = self._host_fields
+        for ip in acumulado:
+            campos = campos_hosts[ip]
+            if campos["nome"].startswith(consulta_norm) or campos["ip"].startswith(consulta_norm):
+                acumulado[ip] += SCORE_EXATO
+        ranking = heapq.nsmallest(limit, acumulado.items(), key=lambda item: (-item[1], item[0]))
+        return [(ip, round(score, 3)) for ip, score in ranking]
@@ -0,0 +1,140 @@
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+def parse_local(local):
+    """
+    Converte o campo `local` ("lat, lng") em (lat, lng).
+
+    Retorna None quando o campo está vazio, malformado ou fora dos limites geográficos.
+    """
+    if not local or not isinstance(local, str):
+        return None
+    partes = local.split(",")
+    if len(partes) != 2:
+        return None
+    try:
+        lat = float(partes[0])
+        lng = float(partes[1])
+    except ValueError:
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lng)):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return lat, lng
+
+
+def _normalizar_lng(lng):
+    """Traz a longitude para [-180, 180] (o Leaflet passa de ±180 nas cópias do mundo)."""
+    if -180.0 <= lng <= 180.0:
+        return lng
+    return (lng + 180.0) % 360.0 - 180.0
+
+
+def parse_bbox(bbox):
+    """
+    Converte "minLng,minLat,maxLng,maxLat" (formato de LatLngBounds.toBBoxString do Leaflet)
+    em tupla de floats, com longitudes normalizadas para [-180, 180]; minLng > maxLng indica
+    área que cruza o antimeridiano. Lança ValueError se inválido.
+    """
+    partes = [float(p) for p in bbox.split(",")]
+    if len(partes) != 4:
+        raise ValueError("bbox deve ter 4 valores: minLng,minLat,maxLng,maxLat")
+    if not all(math.isfinite(p) for p in partes):
+        raise ValueError("bbox com valor não finito")
+    min_lng, min_lat, max_lng, max_lat = partes
+    if min_lat > max_lat:
+        raise ValueError("bbox com minLat maior que maxLat")
+    if min_lat < -90.0 or max_lat > 90.0:
+        raise ValueError("bbox com latitude fora de [-90, 90]")
+    if max_lng - min_lng >= 360.0:
+        return -180.0, min_lat, 180.0, max_lat
+    return _normalizar_lng(min_lng), min_lat, _normalizar_lng(max_lng), max_lat
+
+
+class SpatialIndex:
+    """
+    Índice em grade (células de cell_size graus) sobre as coordenadas dos hosts.
+
+    As coordenadas são interpretadas uma única vez por mudança do campo `local`;
+    consultas por retângulo visitam apenas as células que o cruzam.
+    """
+
+    def __init__(self, cell_size=0.25):
+        self.cell_size = cell_size
+        self._cells = {}   # (cx, cy) -> set(ip)
+        self._points = {}  # ip -> (lat, lng)
+        self._locals = {}  # ip -> texto original de `local`
+        self.invalid = set()
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lng / self.cell_size)), int(math.floor(lat / self.cell_size))
+
+    def upsert(self, ip, host):
+        local = host.get("local", "")
+        if self._locals.get(ip) == local and (ip in self._points or ip in self.invalid):
+            return
+        self.remove(ip)
+        self._locals[ip] = local
+        ponto = parse_local(local)
+        if ponto is None:
+            if local:
+                logger.debug(f"Coordenadas inválidas para {ip}: {local!r}")
+            self.invalid.add(ip)
+            return
+        self._points[ip] = ponto
+        self._cells.setdefault(self._cell(*ponto), set()).add(ip)
+
+    def remove(self, ip):
+        self._locals.pop(ip, None)
+        self.invalid.discard(ip)
+        ponto = self._points.pop(ip, None)
+        if ponto is None:
+            return
+        cell = self._cell(*ponto)
+        ips = self._cells.get(cell)
+        if ips is not None:
+            ips.discard(ip)
+            if not ips:
+                del self._cells[cell]
+
+    def point(self, ip):
+        return self._points.get(ip)
+
+    def query(self, min_lng, min_lat, max_lng, max_lat):
+        """IPs cujos pontos estão dentro do retângulo (trata bbox que cruza o antimeridiano)."""
+        if min_lng > max_lng:
+            # As duas metades têm min_lng <= max_lng, então não há nova divisão
+            return self._query(min_lng, min_lat, 180.0, max_lat) + self._query(-180.0, min_lat, max_lng, max_lat)
+        return self._query(min_lng, min_lat, max_lng, max_lat)
+
+    def _query(self, min_lng, min_lat, max_lng, max_lat):
+        cx0, cy0 = self._cell(min_lat, min_lng)
+        cx1, cy1 = self._cell(max_lat, max_lng)
+        n_cells = (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+        if n_cells > len(self._cells):
+            candidatos = (
+                ips for (cx, cy), ips in self._cells.items()
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1
+            )
+        else:
+            candidatos = (
+                self._cells[(cx, cy)]
+                for cx in range(cx0, cx1 + 1)
+                for cy in range(cy0, cy1 + 1)
+                if (cx, cy) in self._cells
+            )
+
+        resultado = []
+        for ips in candidatos:
+            for ip in ips:
+                lat, lng = self._points[ip]
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    resultado.append(ip)
+        return resultado
+
+    def __len__(self):
+        return len(self._points)
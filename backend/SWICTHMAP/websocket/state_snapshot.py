@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import pickle
+import struct
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SWMAPSNP"
+VERSAO = 1
+SECOES_ADIADAS = ("valores", "ports")  # carregadas só quando alguém precisa delas
+
+_CABECALHO = struct.Struct("<8sHI")  # magic, versão, tamanho do índice
+
+
+def caminho_snapshot(caminho_json):
+    """dados.json -> dados.snapshot, no mesmo diretório."""
+    return os.path.splitext(caminho_json)[0] + ".snapshot"
+
+
+def salvar_snapshot(caminho, data, ports_por_ip, hash_origem):
+    """
+    Grava o estado num arquivo binário (pickle protocolo 5) dividido em seções:
+
+        "documento": self.data com "valores" = None em cada host (a chave fica, para manter a
+                     ordem dos campos) e sem "ports", que já não ficam nos hosts
+        "valores":   {ip: valores}
+        "ports":     {ip: ports}
+
+    O cabeçalho guarda a versão do formato, o hash de dados.json a que o snapshot corresponde
+    e a posição de cada seção, para que as seções pesadas possam ser lidas depois, sob demanda.
+    A escrita é feita num arquivo temporário e trocada de uma vez (os.replace).
+    """
+    valores = {}
+    hosts = []
+    for host in data.get("hosts", []):
+        if "valores" in host and "ip" in host:
+            valores[host["ip"]] = host["valores"]
+            host = {**host, "valores": None}
+        hosts.append(host)
+    secoes = {
+        "documento": pickle.dumps({**data, "hosts": hosts}, protocol=5),
+        "valores": pickle.dumps(valores, protocol=5),
+        "ports": pickle.dumps(ports_por_ip, protocol=5),
+    }
+    indice, posicao = {}, 0
+    for nome, conteudo in secoes.items():
+        indice[nome] = [posicao, len(conteudo)]
+        posicao += len(conteudo)
+    cabecalho = json.dumps({"hash": hash_origem, "secoes": indice}).encode("utf-8")
+
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "wb") as arquivo:
+        arquivo.write(_CABECALHO.pack(MAGIC, VERSAO, len(cabecalho)))
+        arquivo.write(cabecalho)
+        for conteudo in secoes.values():
+            arquivo.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+class SnapshotReader:
+    """
+    Leitura de um snapshot gravado por salvar_snapshot().
+
+    Só o cabeçalho é lido na abertura; cada seção é lida e desserializada em secao(),
+    com o arquivo aberto de novo, então o leitor pode ficar guardado até a carga adiada.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with open(caminho, "rb") as arquivo:
+            magic, versao, tamanho = _CABECALHO.unpack(arquivo.read(_CABECALHO.size))
+            if magic != MAGIC or versao != VERSAO:
+                raise ValueError(f"Formato de snapshot não suportado (versão {versao})")
+            cabecalho = json.loads(arquivo.read(tamanho))
+        self.hash_origem = cabecalho["hash"]
+        self.secoes = cabecalho["secoes"]
+        self._inicio = _CABECALHO.size + tamanho
+
+    def secao(self, nome):
+        posicao, tamanho = self.secoes[nome]
+        with open(self.caminho, "rb") as arquivo:
+            arquivo.seek(self._inicio + posicao)
+            conteudo = arquivo.read(tamanho)
+        if len(conteudo) != tamanho:
+            raise ValueError(f"Seção {nome} truncada em {self.caminho}")
+        return pickle.loads(conteudo)
+
+
+def abrir_snapshot(caminho, hash_origem):
+    """
+    SnapshotReader se o snapshot existir, for legível e corresponder a dados.json com o hash
+    informado; senão None (e dados.json deve ser lido).
+    """
+    try:
+        leitor = SnapshotReader(caminho)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        logger.warning(f"Snapshot {caminho} ignorado: {str(e)}")
+        return None
+    if not hash_origem or leitor.hash_origem != hash_origem:
+        logger.info(f"Snapshot {caminho} não corresponde a dados.json, lendo o JSON")
+        return None
+    return leitor
@@ -0,0 +1,249 @@
+import json
+import logging
+import math
+import operator
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except ImportError:  # Dependência opcional; sem ela as regras são avaliadas linha a linha
+    np = None
+
+# Os 4 primeiros valores vêm dos widgets percentuais do dashboard systemDeviceSummary do
+# Entuity, nesta ordem; os demais são leituras de sensores com unidade (systemDeviceResources).
+# Só CPU e memória viram colunas: o coletor não identifica o 3º e o 4º widget, então eles
+# são ignorados em vez de expostos com nomes genéricos na API e nas regras de alerta.
+SUMMARY_COLUMNS = ("cpu", "memoria")
+SENSOR_COLUMNS = {
+    "C": ("temperatura_max", "temperatura_min"),
+    "mA": ("corrente_max", "corrente_min"),
+    "mW": ("potencia_max", "potencia_min"),
+    "V": ("tensao_max", "tensao_min"),
+}
+COLUMNS = SUMMARY_COLUMNS + tuple(c for par in SENSOR_COLUMNS.values() for c in par)
+
+_VALOR_RE = re.compile(r"^\s*(-?\d+(?:[.,]\d+)?)\s*(C|mA|mW|V)?\s*$")
+
+OPERADORES = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+CAMINHO_REGRAS = os.path.join(os.getcwd(), "alert_rules.json")
+
+DEFAULT_RULES = [
+    {"id": "temperatura_alta", "coluna": "temperatura_max", "op": ">", "limite": 60, "severidade": "warning"},
+    {"id": "temperatura_critica", "coluna": "temperatura_max", "op": ">", "limite": 70, "severidade": "critical"},
+    {"id": "cpu_alta", "coluna": "cpu", "op": ">", "limite": 90, "severidade": "warning"},
+    {"id": "memoria_alta", "coluna": "memoria", "op": ">", "limite": 90, "severidade": "warning"},
+    {"id": "corrente_laser_alta", "coluna": "corrente_max", "op": ">", "limite": 80, "severidade": "warning"},
+    {"id": "potencia_optica_baixa", "coluna": "potencia_min", "op": "<", "limite": 0.05, "severidade": "warning"},
+    {"id": "tensao_baixa", "coluna": "tensao_min", "op": "<", "limite": 3.0, "severidade": "warning"},
+    {"id": "tensao_alta", "coluna": "tensao_max", "op": ">", "limite": 3.6, "severidade": "warning"},
+]
+
+
+def parse_valores(valores):
+    """
+    Converte a lista posicional de strings do Entuity em {coluna: float}.
+
+    Ex.: ["5.00", "42.5", "61.0", "69.3", "57.0 C", "10.70 mA", "0.22 mW", "3.20 V", "36.0 C"]
+    -> cpu=5.0, memoria=42.5, ..., temperatura_max=57.0, temperatura_min=36.0, ...
+    Valores ausentes ("-") ou ilegíveis são ignorados.
+    """
+    linha = {}
+    if not isinstance(valores, list):
+        return linha
+    for posicao, texto in enumerate(valores):
+        m = _VALOR_RE.match(texto) if isinstance(texto, str) else None
+        if m is None:
+            continue
+        valor = float(m.group(1).replace(",", "."))
+        unidade = m.group(2)
+        if unidade is None:
+            if posicao < len(SUMMARY_COLUMNS):
+                linha[SUMMARY_COLUMNS[posicao]] = valor
+            continue
+        col_max, col_min = SENSOR_COLUMNS[unidade]
+        linha[col_max] = max(valor, linha.get(col_max, valor))
+        linha[col_min] = min(valor, linha.get(col_min, valor))
+    return linha
+
+
+class TelemetryTable:
+    """
+    Tabela colunar (uma linha por host, uma coluna por grandeza) com os valores de
+    telemetria já convertidos em números. NaN indica leitura ausente.
+
+    Segue a interface dos demais índices de HostIndexes (upsert/remove por host); só
+    reprocessa um host quando a lista `valores` dele muda.
+    """
+
+    def __init__(self, capacidade=1024):
+        self.ips = []            # linha -> ip (None para linhas livres)
+        self.rows = {}           # ip -> linha
+        self._livres = []
+        self._liberar = []       # linhas removidas, liberadas após a próxima avaliação
+        self._fonte = {}         # ip -> lista valores já convertida
+        self.columns = {}
+        self._capacidade = 0
+        self._crescer(capacidade)
+        self.dirty = False
+
+    def _crescer(self, capacidade):
+        if np is not None:
+            for coluna in COLUMNS:
+                nova = np.full(capacidade, np.nan)
+                if coluna in self.columns:
+                    nova[:self._capacidade] = self.columns[coluna]
+                self.columns[coluna] = nova
+        else:
+            for coluna in COLUMNS:
+                self.columns.setdefault(coluna, []).extend([math.nan] * (capacidade - self._capacidade))
+        self._capacidade = capacidade
+
+    def __len__(self):
+        return len(self.ips)
+
+    def upsert(self, ip, host):
+        valores = host.get("valores")
+        if ip in self._fonte and self._fonte[ip] == valores:
+            return
+        self._fonte[ip] = valores
+        linha = self.rows.get(ip)
+        if linha is None:
+            linha = self._nova_linha(ip)
+        elif linha in self._liberar:
+            self._liberar.remove(linha)
+        parsed = parse_valores(valores)
+        for coluna in COLUMNS:
+            self.columns[coluna][linha] = parsed.get(coluna, math.nan)
+        self.dirty = True
+
+    def remove(self, ip):
+        self._fonte.pop(ip, None)
+        linha = self.rows.get(ip)
+        if linha is None or linha in self._liberar:
+            return
+        for coluna in COLUMNS:
+            self.columns[coluna][linha] = math.nan
+        # A linha continua associada ao ip até a avaliação reportar os alertas resolvidos
+        self._liberar.append(linha)
+        self.dirty = True
+
+    def _nova_linha(self, ip):
+        if self._livres:
+            linha = self._livres.pop()
+            self.ips[linha] = ip
+        else:
+            linha = len(self.ips)
+            if linha >= self._capacidade:
+                self._crescer(self._capacidade * 2)
+            self.ips.append(ip)
+        self.rows[ip] = linha
+        return linha
+
+    def release_removed(self):
+        for linha in self._liberar:
+            self.rows.pop(self.ips[linha], None)
+            self.ips[linha] = None
+            self._livres.append(linha)
+        self._liberar = []
+
+    def row(self, ip):
+        """{coluna: valor} do host, sem as leituras ausentes."""
+        linha = self.rows.get(ip)
+        if linha is None:
+            return {}
+        return {c: float(self.columns[c][linha]) for c in COLUMNS
+                if not math.isnan(self.columns[c][linha])}
+
+
+def load_rules(path=CAMINHO_REGRAS):
+    """Regras de alerta de alert_rules.json; DEFAULT_RULES se o arquivo não existir."""
+    try:
+        with open(path, "r", encoding="utf-8") as arquivo:
+            regras = json.load(arquivo)
+    except FileNotFoundError:
+        return DEFAULT_RULES
+    except json.JSONDecodeError as e:
+        logger.error(f"Erro ao decodificar {path}, usando regras padrão: {str(e)}")
+        return DEFAULT_RULES
+    validas = []
+    for regra in regras if isinstance(regras, list) else []:
+        if (isinstance(regra, dict) and regra.get("coluna") in COLUMNS and regra.get("op") in OPERADORES
+                and isinstance(regra.get("limite"), (int, float)) and regra.get("id")):
+            validas.append(regra)
+        else:
+            logger.warning(f"Regra de alerta inválida ignorada: {regra}")
+    return validas
+
+
+class AlertEngine:
+    """
+    Avalia regras de limite sobre a TelemetryTable inteira de uma vez.
+
+    Cada regra vira uma comparação vetorizada sobre a coluna; o resultado é comparado com a
+    máscara da avaliação anterior, então só alertas novos e resolvidos são reportados.
+    """
+
+    def __init__(self, table, rules=None):
+        self.table = table
+        self.rules = list(rules if rules is not None else load_rules())
+        self._ativos = {}  # id da regra -> máscara (numpy) ou conjunto de linhas
+
+    def evaluate(self):
+        """
+        Returns:
+            (novos, resolvidos): listas de alertas {ip, regra, coluna, valor, limite, severidade}
+        """
+        table = self.table
+        novos = []
+        resolvidos = []
+        n = len(table)
+        for regra in self.rules:
+            coluna = table.columns[regra["coluna"]]
+            comparar = OPERADORES[regra["op"]]
+            anterior = self._ativos.get(regra["id"])
+            if np is not None:
+                with np.errstate(invalid="ignore"):
+                    atual = comparar(coluna[:n], regra["limite"])  # NaN compara como False
+                if anterior is None:
+                    anterior = np.zeros(n, dtype=bool)
+                elif len(anterior) < n:
+                    anterior = np.concatenate([anterior, np.zeros(n - len(anterior), dtype=bool)])
+                linhas_novas = np.flatnonzero(atual & ~anterior)
+                linhas_resolvidas = np.flatnonzero(anterior & ~atual)
+            else:
+                atual = {i for i in range(n) if comparar(coluna[i], regra["limite"])}
+                anterior = anterior or set()
+                linhas_novas = atual - anterior
+                linhas_resolvidas = anterior - atual
+            self._ativos[regra["id"]] = atual
+            novos.extend(self._alerta(regra, int(i)) for i in linhas_novas)
+            resolvidos.extend(self._alerta(regra, int(i)) for i in linhas_resolvidas)
+        table.release_removed()
+        table.dirty = False
+        return novos, resolvidos
+
+    def active(self):
+        """Todos os alertas ativos na última avaliação."""
+        ativos = []
+        for regra in self.rules:
+            atual = self._ativos.get(regra["id"])
+            if atual is None:
+                continue
+            linhas = np.flatnonzero(atual) if np is not None else sorted(atual)
+            ativos.extend(self._alerta(regra, int(i)) for i in linhas)
+        return ativos
+
+    def _alerta(self, regra, linha):
+        valor = float(self.table.columns[regra["coluna"]][linha])
+        return {
+            "ip": self.table.ips[linha],
+            "regra": regra["id"],
+            "coluna": regra["coluna"],
+            "valor": None if math.isnan(valor) else valor,
+            "limite": regra["limite"],
+            "severidade": regra.get("severidade", "warning"),
+        }
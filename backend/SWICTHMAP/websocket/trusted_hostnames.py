@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from file_watcher import FileWatcher
+
+logger = logging.getLogger(__name__)
+
+TRUSTED_HOSTNAMES_URL = "https://api-security-swmap.vercel.app/APIhosts.json"
+CAMINHO_CACHE = os.path.join(os.getcwd(), "trusted_hostnames_remotos.json")
+REFRESH_INTERVAL = 300
+
+
+class TrustedHostnameProvider:
+    """
+    Lista de hostnames confiáveis com stale-while-revalidate.
+
+    - get() nunca faz rede: devolve a última lista válida (da memória ou, na partida, do disco).
+    - Uma thread renova a lista a cada refresh_interval segundos; falhas mantêm a lista anterior.
+    - A lista válida é gravada num cache próprio (trusted_hostnames_remotos.json), nunca em
+      trusted_hostnames.json, que é mantido à mão; quem autoriza usa a união das duas listas
+      (client_identity.mesclar_hostnames). O DataManager monitora os dois arquivos.
+    """
+
+    def __init__(self, url=TRUSTED_HOSTNAMES_URL, cache_path=CAMINHO_CACHE,
+                 refresh_interval=REFRESH_INTERVAL, timeout=5):
+        self.url = url
+        self.cache_path = cache_path
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self._hostnames = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._callbacks = []
+        self.last_success = None
+        self.last_error = None
+
+    def start(self):
+        self._load_cache()
+        FileWatcher(self.cache_path, lambda _: self._load_cache()).start()
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+        return self
+
+    def get(self):
+        with self._lock:
+            return self._hostnames
+
+    def subscribe(self, callback):
+        """callback(hostnames) é chamado sempre que a lista muda."""
+        self._callbacks.append(callback)
+
+    def refresh_async(self):
+        """Antecipa a próxima renovação sem esperar por ela."""
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while True:
+            self.refresh_now()
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+
+    def refresh_now(self):
+        """Busca a lista remota; retorna True se obteve uma lista válida."""
+        try:
+            response = requests.get(self.url, timeout=self.timeout, verify=False)
+            response.raise_for_status()
+            hostnames = response.json().get("hostnames", [])
+        except (requests.RequestException, ValueError, AttributeError) as e:
+            self.last_error = f"{type(e).__name__}: {str(e)}"
+            logger.error(f"Erro ao buscar hostnames de {self.url}: {self.last_error}")
+            return False
+
+        if not isinstance(hostnames, list) or not all(isinstance(h, str) for h in hostnames):
+            self.last_error = "A chave 'hostnames' no JSON remoto não contém uma lista válida."
+            logger.error(self.last_error)
+            return False
+        if not hostnames and self.get():
+            logger.warning("Lista remota de hostnames veio vazia; mantendo a lista anterior")
+            return False
+
+        self.last_success = time.time()
+        self.last_error = None
+        if self._set(hostnames):
+            self._save_cache(hostnames)
+            logger.info(f"Hostnames confiáveis atualizados do endpoint remoto ({len(hostnames)} entradas)")
+        return True
+
+    def _set(self, hostnames):
+        with self._lock:
+            if hostnames == self._hostnames:
+                return False
+            self._hostnames = hostnames
+        for callback in self._callbacks:
+            try:
+                callback(hostnames)
+            except Exception as e:
+                logger.error(f"Erro ao notificar mudança de hostnames: {str(e)}")
+        return True
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                hostnames = json.load(f)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError as e:
+            logger.error(f"Cache de hostnames inválido em {self.cache_path}: {str(e)}")
+            return
+        if isinstance(hostnames, list):
+            self._set(hostnames)
+
+    def _save_cache(self, hostnames):
+        # Grava em arquivo temporário e troca atomicamente para ninguém ler pela metade
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(hostnames, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.error(f"Erro ao gravar cache de hostnames: {str(e)}")
+
+    def status(self):
+        return {
+            "total": len(self.get()),
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+        }
@@ -1,13 +1,68 @@
 import logging
+from flask_socketio import join_room, leave_room, emit
+from ping_service import separar_ips_conhecidos, MAX_IPS_POR_PEDIDO
+from metrics import WS_CLIENTS
 
 logger = logging.getLogger(__name__)
 
-def register_websocket(socketio, data_manager):
+def register_websocket(socketio, data_manager, pinger=None):
     @socketio.on("connect")
     def handle_connect():
         logger.debug("Cliente conectado ao WebSocket")
+        WS_CLIENTS.inc()
         socketio.emit('data_updated', data_manager.get_data())
 
+    @socketio.on("disconnect")
+    def handle_disconnect():
+        WS_CLIENTS.dec()
+
     @socketio.on("subscribe_to_updates")
     def handle_subscription():
-        logger.debug("Cliente inscrito para atualizações em tempo real")
\ No newline at end of file
+        logger.debug("Cliente inscrito para atualizações em tempo real")
+
+    @socketio.on("subscribe_clusters")
+    def handle_subscribe_clusters(data):
+        """Entra nas salas dos tiles visíveis ({zoom, tiles: [[x, y], ...]}) e recebe o estado atual."""
+        zoom = int(data.get("zoom", 0))
+        for x, y in data.get("tiles", []):
+            tile_id = f"{zoom}/{int(x)}/{int(y)}"
+            try:
+                clusters = data_manager.get_cluster_tile(zoom, int(x), int(y))
+            except ValueError as e:
+                emit("clusters_error", {"tile": tile_id, "erro": str(e)})
+                continue
+            join_room(f"clusters:{tile_id}")
+            emit("clusters_updated", {"tile": tile_id, "clusters": clusters})
+
+    @socketio.on("unsubscribe_clusters")
+    def handle_unsubscribe_clusters(data):
+        zoom = int(data.get("zoom", 0))
+        for x, y in data.get("tiles", []):
+            leave_room(f"clusters:{zoom}/{int(x)}/{int(y)}")
+
+    @socketio.on("subscribe_port_changes")
+    def handle_subscribe_port_changes():
+        """Passa a receber os eventos 'port_changes' (mudanças de porta entre coletas)."""
+        join_room("port_changes")
+
+    @socketio.on("unsubscribe_port_changes")
+    def handle_unsubscribe_port_changes():
+        leave_room("port_changes")
+
+    @socketio.on("ping_hosts")
+    def handle_ping_hosts(data):
+        """Ping sob demanda ({ips: [...]}); o ack traz o ticket e os resultados chegam em 'ping_result'."""
+        ips = data.get("ips") if isinstance(data, dict) else None
+        if pinger is None or not isinstance(ips, list) or not ips or len(ips) > MAX_IPS_POR_PEDIDO:
+            return {"erro": f"Informe 'ips' com 1 a {MAX_IPS_POR_PEDIDO} IPs"}
+        aceitos, rejeitados = separar_ips_conhecidos(data_manager, ips)
+        if not aceitos:
+            return {"erro": "Nenhum IP conhecido", "rejected": rejeitados}
+        return {**pinger.request(aceitos), "rejected": rejeitados}
+
+def register_bus_forwarding(socketio, bus):
+    """Repassa ao processo dono do estado os eventos de clientes que ele precisa tratar."""
+    @socketio.on("host_updated")
+    def handle_host_updated(data):
+        logger.debug(f"Repassando host_updated para o dono do estado: {data}")
+        bus.publish("host_updated", data)